@@ -8,12 +8,23 @@ import os
 import time
 import json
 import threading
-import subprocess
 import logging
 from datetime import datetime
-from flask import Flask, render_template_string, jsonify, request, send_from_directory
+from flask import Flask, render_template_string, jsonify, request, send_from_directory, Response
+from werkzeug.datastructures import Headers
 import psutil
 from file_manager import file_manager
+from chunked_upload import DEFAULT_CHUNK_SIZE, MAX_BATCH_BYTES
+from file_download import send_download, set_disposition
+from log_tail import DEFAULT_TAIL_LINES
+from metrics_history import metrics_history
+from metrics_store import metrics_store
+from system_snapshot import snapshot_publisher
+from firmware_reader import firmware_reader, decode_throttled
+from sensors import sensor_registry
+from process_monitor import process_monitor
+from openmetrics import metrics_exposition, OPENMETRICS_CONTENT_TYPE, PROMETHEUS_CONTENT_TYPE
+import shared_state
 import traceback
 
 # 配置日志
@@ -30,6 +41,7 @@ system_info = {
     'disk': {'total': 0, 'used': 0, 'free': 0, 'percent': 0},
     'network': {'bytes_sent': 0, 'bytes_recv': 0, 'upload_speed': 0, 'download_speed': 0},
     'io': {'read_bytes': 0, 'write_bytes': 0, 'read_speed': 0, 'write_speed': 0},
+    'sensors': {},  # 所有已发现传感器的读数，例如 thermal.cpu
     'uptime': 0,
     'timestamp': '',
     'system': {'system': '', 'release': '', 'version': '', 'machine': ''}
@@ -54,7 +66,13 @@ fan_control = {
 # 上一次的网络和IO统计
 last_network_stats = None
 last_io_stats = None
-last_update_time = time.time()
+last_cpu_stats = None
+
+# 最近一次采集的 psutil 原始数据（字节），供 /metrics 导出
+raw_stats = {
+    'memory': None,
+    'disk': None
+}
 
 # 缓存不常变化的数据
 cached_data = {
@@ -63,28 +81,69 @@ cached_data = {
     'disk_total': None,
     'memory_total': None,
     'system_info': None,
+    'cpu_temp_sensor': None,  # 代表CPU温度的传感器名称
     'last_cache_time': 0
 }
 
 # 缓存有效期（秒）
 CACHE_TTL = 60
 
-def get_cpu_temperature():
-    """获取CPU温度"""
-    try:
-        # 尝试从不同路径读取CPU温度
-        temp_paths = [
-            '/sys/class/thermal/thermal_zone0/temp',
-            '/sys/class/thermal/thermal_zone1/temp',
-            '/sys/devices/virtual/thermal/thermal_zone0/temp'
+# 采集调度配置：有客户端观看时快速采集，无人观看时降低到后台频率
+ACTIVE_INTERVAL = 0.5      # 有客户端时的采集周期（秒）
+IDLE_INTERVAL = 10         # 无客户端时的采集周期（秒）
+CLIENT_IDLE_TIMEOUT = 30   # 最后一次轮询后多久视为无人观看（秒）
+
+# 各指标的最小采集间隔（秒），实际间隔不小于当前采集周期
+METRIC_INTERVALS = {
+    'cpu': 0.5,
+    'cores': 1,        # 每核心使用率/频率、负载、上下文切换
+    'sensors': 2,      # 温度、功耗等 sysfs 传感器（一次批量读取）
+    'voltage': 10,
+    'memory': 1,
+    'disk': 30,
+    'network': 0.5,
+    'io': 0.5,
+}
+
+# 采集线程运行状态
+collector_state = {
+    'last_run': {},              # 各指标上次采集时间
+    'last_client_activity': 0,   # 最后一次客户端请求时间
+    'mode': 'idle',              # 'active', 'idle'
+    'interval': IDLE_INTERVAL,   # 当前采集周期
+    'ticks': 0,                  # 累计采集次数
+    'cpu_time': 0.0,             # 采集线程累计CPU时间（秒）
+    'last_tick_ms': 0.0,         # 上一次采集消耗的CPU时间（毫秒）
+    'cpu_samples': 0,            # 已采集的CPU使用率次数（第一次只建立基准）
+    'started': time.time()
+}
+
+# 客户端从空闲变为活跃时唤醒采集线程
+collector_wakeup = threading.Event()
+
+def select_cpu_temp_sensor():
+    """选择代表CPU温度的传感器名称，结果缓存"""
+    if cached_data.get('cpu_temp_sensor') is None:
+        thermal = sensor_registry.find('thermal.')
+        preferred = [name for name in thermal if any(key in name for key in ('cpu', 'soc', 'x86_pkg'))]
+        candidates = preferred or thermal or [
+            name for name in sensor_registry.find('hwmon') if '.temp' in name
         ]
-        
-        for path in temp_paths:
-            if os.path.exists(path):
-                with open(path, 'r') as f:
-                    temp = float(f.read()) / 1000.0
-                    if 0 < temp < 150:  # 合理的温度范围
-                        return round(temp, 1)
+        cached_data['cpu_temp_sensor'] = candidates[0] if candidates else ''
+    return cached_data['cpu_temp_sensor']
+
+def get_cpu_temperature(sensor_values=None):
+    """
+    获取CPU温度
+    :param sensor_values: 本周期批量读取的传感器数值，为空时单独读取一次
+    """
+    try:
+        name = select_cpu_temp_sensor()
+        if not name:
+            return 0
+        temp = sensor_values.get(name) if sensor_values is not None else sensor_registry.get(name)
+        if temp is not None and 0 < temp < 150:  # 合理的温度范围
+            return round(temp, 1)
         
         # 如果无法读取，返回0
         return 0
@@ -92,49 +151,29 @@ def get_cpu_temperature():
         return 0
 
 def get_cpu_voltage():
-    """获取CPU电压"""
+    """获取CPU电压（通过邮箱接口/sysfs读取，不再每次创建vcgencmd子进程）"""
     try:
-        # 使用 vcgencmd 获取树莓派CPU电压
-        result = subprocess.run(['vcgencmd', 'measure_volts'], 
-                              capture_output=True, text=True, timeout=5)
-        if result.returncode == 0:
-            # 输出格式: volt=0.9260V
-            output = result.stdout.strip()
-            if 'volt=' in output:
-                voltage_str = output.replace('volt=', '').replace('V', '')
-                voltage = float(voltage_str)
-                return round(voltage, 3)
-        
-        return 0
+        return round(firmware_reader.measure_volts(), 3)
     except:
         return 0
 
-def get_power_consumption():
-    """获取系统功耗"""
+def get_power_consumption(sensor_values):
+    """
+    获取系统功耗
+    :param sensor_values: 本周期批量读取的传感器数值
+    """
     try:
-        # 尝试从不同路径读取功耗信息
-        power_paths = [
-            '/sys/class/power_supply/battery/current_now',
-            '/sys/class/power_supply/battery/voltage_now',
-            '/sys/class/hwmon/hwmon0/power1_input'
-        ]
-        
-        for path in power_paths:
-            if os.path.exists(path):
-                with open(path, 'r') as f:
-                    value = float(f.read().strip())
-                    if 'current' in path:
-                        # 电流值，单位uA
-                        current_ma = value / 1000.0
-                        return round(current_ma, 2)
-                    elif 'voltage' in path:
-                        # 电压值，单位uV
-                        voltage_mv = value / 1000.0
-                        return round(voltage_mv, 2)
-                    elif 'power' in path:
-                        # 功耗值，单位uW
-                        power_mw = value / 1000.0
-                        return round(power_mw / 1000.0, 2)  # 转换为W
+        # 优先使用功率传感器
+        for name, value in sensor_values.items():
+            if value and (('.power' in name and name.startswith('hwmon')) or name.endswith('.power_now')):
+                return round(value, 2)
+        
+        # 其次使用供电电压 × 电流
+        for name, value in sensor_values.items():
+            if name.endswith('.voltage_now') and value:
+                current = sensor_values.get(name.replace('.voltage_now', '.current_now'))
+                if current:
+                    return round(value * abs(current), 2)
         
         # 如果无法直接读取，使用估算方法
         # 根据CPU使用率估算功耗（树莓派典型功耗：空闲2-3W，满载5-7W）
@@ -230,12 +269,22 @@ def get_system_info():
             'machine': 'Unknown'
         }
 
+def _metric_due(name, current_time):
+    """
+    判断指标是否到达采集间隔
+    :return: (是否需要采集, 距上次采集的秒数，首次采集为0)
+    """
+    last = collector_state['last_run'].get(name)
+    if last is not None and current_time - last < METRIC_INTERVALS.get(name, 0):
+        return False, 0
+    collector_state['last_run'][name] = current_time
+    return True, (current_time - last) if last is not None else 0
+
 def update_system_info():
-    """更新系统信息 - 优化版"""
-    global last_network_stats, last_io_stats, last_update_time, cached_data
+    """更新系统信息 - 按指标间隔分别采集"""
+    global last_network_stats, last_io_stats, last_cpu_stats, cached_data
     
     current_time = time.time()
-    time_delta = current_time - last_update_time
     
     # 检查是否需要更新缓存
     need_cache_update = (current_time - cached_data['last_cache_time']) > CACHE_TTL
@@ -254,96 +303,149 @@ def update_system_info():
         cached_data['system_info'] = get_system_info()
         cached_data['last_cache_time'] = current_time
     
-    # 高频数据采集（每2秒一次）
-    
     # CPU信息 - 使用非阻塞模式，减少采样开销
-    cpu_percent = psutil.cpu_percent(interval=None)
-    cpu_freq = psutil.cpu_freq()
+    cpu_due, _ = _metric_due('cpu', current_time)
+    if cpu_due:
+        cpu_percent = round(psutil.cpu_percent(interval=None), 1)
+        collector_state['cpu_samples'] += 1
+        cpu_freq = psutil.cpu_freq()
+        cpu_freq = round(cpu_freq.current if cpu_freq else 0, 1)
+    else:
+        cpu_percent = system_info['cpu'].get('percent', 0)
+        cpu_freq = system_info['cpu'].get('freq', 0)
     
-    # 只在需要时获取温度和电压（减少subprocess调用）
-    if current_time - cached_data['last_cache_time'] > 10:  # 每10秒更新一次温度和电压
-        cpu_temp = get_cpu_temperature()
-        cpu_voltage = get_cpu_voltage()
+    # 传感器和固件信息按各自间隔更新：所有 sysfs 传感器一次批量读取，
+    # 电压、实测频率、降频状态一次邮箱请求读取
+    sensors_due, _ = _metric_due('sensors', current_time)
+    if sensors_due:
+        sensor_values = sensor_registry.read_all()
+        system_info['sensors'] = sensor_values
+        cpu_temp = get_cpu_temperature(sensor_values)
     else:
+        sensor_values = system_info.get('sensors', {})
         cpu_temp = system_info['cpu'].get('temp', 0)
+    voltage_due, _ = _metric_due('voltage', current_time)
+    if voltage_due:
+        firmware = firmware_reader.read()
+        cpu_voltage = round(firmware['voltage'], 3)
+        arm_clock = round(firmware['arm_clock'] / 1000000, 1)  # MHz
+        throttled = firmware['throttled']
+    else:
         cpu_voltage = system_info['cpu'].get('voltage', 0)
+        arm_clock = system_info['cpu'].get('arm_clock', 0)
+        throttled = int(system_info['cpu'].get('throttled', '0x0'), 16)
     
     system_info['cpu'] = {
-        'percent': round(cpu_percent, 1),
+        'percent': cpu_percent,
         'temp': cpu_temp,
-        'freq': round(cpu_freq.current if cpu_freq else 0, 1),
+        'freq': cpu_freq,
         'count': cached_data['cpu_count'] or 0,
         'model': cached_data['cpu_model'] or '',
-        'voltage': cpu_voltage
+        'voltage': cpu_voltage,
+        'arm_clock': arm_clock,
+        'throttled': hex(throttled),
+        'throttled_flags': decode_throttled(throttled)
     }
     
-    # 功耗信息 - 基于CPU使用率估算，减少系统调用
-    cpu_percent_value = system_info['cpu']['percent']
-    estimated_power = 2.5 + (cpu_percent_value / 100.0) * 4.5
+    # 每核心信息 - 使用率、频率、负载以及上下文切换/中断速率
+    cores_due, time_delta = _metric_due('cores', current_time)
+    if cores_due:
+        per_cpu_percent = psutil.cpu_percent(interval=None, percpu=True)
+        per_cpu_freq = psutil.cpu_freq(percpu=True) or []
+        current_cpu_stats = psutil.cpu_stats()
+        if last_cpu_stats and time_delta > 0:
+            ctx_switch_rate = round((current_cpu_stats.ctx_switches - last_cpu_stats.ctx_switches) / time_delta, 1)
+            interrupt_rate = round((current_cpu_stats.interrupts - last_cpu_stats.interrupts) / time_delta, 1)
+        else:
+            ctx_switch_rate = 0
+            interrupt_rate = 0
+        last_cpu_stats = current_cpu_stats
+        
+        system_info['cores'] = {
+            'percent': [round(p, 1) for p in per_cpu_percent],
+            'freq': [round(f.current, 1) for f in per_cpu_freq],
+            'load_avg': [round(l, 2) for l in os.getloadavg()],
+            'ctx_switches': current_cpu_stats.ctx_switches,
+            'interrupts': current_cpu_stats.interrupts,
+            'ctx_switch_rate': ctx_switch_rate,  # 次/秒
+            'interrupt_rate': interrupt_rate     # 次/秒
+        }
+    
+    # 功耗信息 - 使用本周期的传感器读数，没有功率传感器时基于CPU使用率估算
     system_info['power'] = {
-        'watts': round(estimated_power, 2)
+        'watts': get_power_consumption(sensor_values)
     }
     
     # 内存信息 - 从缓存获取总量
-    memory = psutil.virtual_memory()
-    system_info['memory'] = {
-        'total': cached_data['memory_total'] or round(memory.total / (1024**3), 2),
-        'used': round(memory.used / (1024**3), 2),
-        'free': round(memory.available / (1024**3), 2),
-        'percent': round(memory.percent, 1)
-    }
+    memory_due, _ = _metric_due('memory', current_time)
+    if memory_due:
+        memory = psutil.virtual_memory()
+        raw_stats['memory'] = memory
+        system_info['memory'] = {
+            'total': cached_data['memory_total'] or round(memory.total / (1024**3), 2),
+            'used': round(memory.used / (1024**3), 2),
+            'free': round(memory.available / (1024**3), 2),
+            'percent': round(memory.percent, 1)
+        }
     
     # 磁盘信息 - 从缓存获取总量
-    disk = psutil.disk_usage('/')
-    system_info['disk'] = {
-        'total': cached_data['disk_total'] or round(disk.total / (1024**3), 2),
-        'used': round(disk.used / (1024**3), 2),
-        'free': round(disk.free / (1024**3), 2),
-        'percent': round((disk.used / disk.total) * 100, 1)
-    }
-    
-    # 网络信息
-    current_network_stats = psutil.net_io_counters()
-    if last_network_stats and time_delta > 0:
-        bytes_sent_delta = current_network_stats.bytes_sent - last_network_stats.bytes_sent
-        bytes_recv_delta = current_network_stats.bytes_recv - last_network_stats.bytes_recv
-        
-        upload_speed = round(bytes_sent_delta / time_delta / 1024, 2)  # KB/s
-        download_speed = round(bytes_recv_delta / time_delta / 1024, 2)  # KB/s
-    else:
-        upload_speed = 0
-        download_speed = 0
-    
-    last_network_stats = current_network_stats
+    disk_due, _ = _metric_due('disk', current_time)
+    if disk_due:
+        disk = psutil.disk_usage('/')
+        raw_stats['disk'] = disk
+        system_info['disk'] = {
+            'total': cached_data['disk_total'] or round(disk.total / (1024**3), 2),
+            'used': round(disk.used / (1024**3), 2),
+            'free': round(disk.free / (1024**3), 2),
+            'percent': round((disk.used / disk.total) * 100, 1)
+        }
     
-    system_info['network'] = {
-        'bytes_sent': round(current_network_stats.bytes_sent / (1024**2), 2),  # MB
-        'bytes_recv': round(current_network_stats.bytes_recv / (1024**2), 2),  # MB
-        'upload_speed': upload_speed,
-        'download_speed': download_speed
-    }
+    # 网络信息 - 速度按距上次网络采样的实际间隔计算
+    network_due, time_delta = _metric_due('network', current_time)
+    if network_due:
+        current_network_stats = psutil.net_io_counters()
+        if last_network_stats and time_delta > 0:
+            bytes_sent_delta = current_network_stats.bytes_sent - last_network_stats.bytes_sent
+            bytes_recv_delta = current_network_stats.bytes_recv - last_network_stats.bytes_recv
+            
+            upload_speed = round(bytes_sent_delta / time_delta / 1024, 2)  # KB/s
+            download_speed = round(bytes_recv_delta / time_delta / 1024, 2)  # KB/s
+        else:
+            upload_speed = 0
+            download_speed = 0
+        
+        last_network_stats = current_network_stats
+        
+        system_info['network'] = {
+            'bytes_sent': round(current_network_stats.bytes_sent / (1024**2), 2),  # MB
+            'bytes_recv': round(current_network_stats.bytes_recv / (1024**2), 2),  # MB
+            'upload_speed': upload_speed,
+            'download_speed': download_speed
+        }
     
     # IO信息
-    current_io_stats = psutil.disk_io_counters()
-    if current_io_stats and last_io_stats and time_delta > 0:
-        read_bytes_delta = current_io_stats.read_bytes - last_io_stats.read_bytes
-        write_bytes_delta = current_io_stats.write_bytes - last_io_stats.write_bytes
+    io_due, time_delta = _metric_due('io', current_time)
+    if io_due:
+        current_io_stats = psutil.disk_io_counters()
+        if current_io_stats and last_io_stats and time_delta > 0:
+            read_bytes_delta = current_io_stats.read_bytes - last_io_stats.read_bytes
+            write_bytes_delta = current_io_stats.write_bytes - last_io_stats.write_bytes
+            
+            read_speed = round(read_bytes_delta / time_delta / 1024, 2)  # KB/s
+            write_speed = round(write_bytes_delta / time_delta / 1024, 2)  # KB/s
+        else:
+            read_speed = 0
+            write_speed = 0
         
-        read_speed = round(read_bytes_delta / time_delta / 1024, 2)  # KB/s
-        write_speed = round(write_bytes_delta / time_delta / 1024, 2)  # KB/s
-    else:
-        read_speed = 0
-        write_speed = 0
-    
-    if current_io_stats:
-        last_io_stats = current_io_stats
-    
-    system_info['io'] = {
-        'read_bytes': round(current_io_stats.read_bytes / (1024**2), 2) if current_io_stats else 0,  # MB
-        'write_bytes': round(current_io_stats.write_bytes / (1024**2), 2) if current_io_stats else 0,  # MB
-        'read_speed': read_speed,
-        'write_speed': write_speed
-    }
+        if current_io_stats:
+            last_io_stats = current_io_stats
+        
+        system_info['io'] = {
+            'read_bytes': round(current_io_stats.read_bytes / (1024**2), 2) if current_io_stats else 0,  # MB
+            'write_bytes': round(current_io_stats.write_bytes / (1024**2), 2) if current_io_stats else 0,  # MB
+            'read_speed': read_speed,
+            'write_speed': write_speed
+        }
     
     # 系统运行时间
     system_info['uptime'] = round(time.time() - psutil.boot_time(), 1)
@@ -366,7 +468,11 @@ def update_system_info():
         'machine': 'Unknown'
     }
     
-    last_update_time = current_time
+    # 写入历史环形缓冲区，并在内存中累加持久化汇总（由后台线程批量落盘）；
+    # 启动后第一次 cpu_percent(interval=None) 的返回值没有意义（0或100），从第二次采样开始记录
+    if collector_state['cpu_samples'] >= 2:
+        metrics_history.record(current_time, system_info)
+        metrics_store.record(current_time, system_info)
 
 def update_fan_status():
     """更新风扇状态"""
@@ -374,8 +480,8 @@ def update_fan_status():
     
     current_time = time.time()
     
-    # 获取当前CPU温度
-    cpu_temp = get_cpu_temperature()
+    # 使用采集线程按温度间隔更新的CPU温度，避免重复读取传感器
+    cpu_temp = system_info['cpu'].get('temp', 0)
     
     # 更新当前周期剩余时间
     if fan_control["next_switch_time"]:
@@ -428,22 +534,173 @@ def update_fan_status():
         fan_control['remaining_stopped_minutes'] = 0
 
 
+def build_system_payload():
+    """构造包含风扇控制信息的系统信息响应"""
+    response_data = system_info.copy()
+    response_data["fan_control"] = {
+        "enabled": fan_control["enabled"],
+        "status": fan_control["status"],
+        "mode": fan_control["mode"],
+        "speed": fan_control["speed"],
+        "target_temp": fan_control["target_temp"],
+        "running_duration": fan_control["running_duration"],
+        "stop_duration": fan_control["stop_duration"],
+        "current_cycle_remaining": fan_control["current_cycle_remaining"],
+        "is_running": fan_control["is_running"],
+        "next_switch_time": fan_control["next_switch_time"]
+    }
+    return response_data
+
+def mark_client_activity():
+    """记录客户端请求，若采集线程处于空闲频率则立即唤醒"""
+    collector_state['last_client_activity'] = time.time()
+    if shared_state.role == 'worker':
+        # 多进程模式：通过共享内存告知采集进程
+        shared_state.board.touch_client()
+    elif collector_state['mode'] == 'idle':
+        collector_wakeup.set()
+
+def latest_system_info():
+    """获取最新的系统信息；工作进程中从共享内存快照解析（每个版本只解析一次）"""
+    if shared_state.role != 'worker':
+        return system_info
+    snapshot = snapshot_publisher.latest()
+    if cached_data.get('snapshot_version') != snapshot.version:
+        cached_data['snapshot_info'] = json.loads(snapshot.payload)
+        cached_data['snapshot_version'] = snapshot.version
+    return cached_data['snapshot_info']
+
+def get_collector_status():
+    """获取采集线程的调度状态和自身CPU开销"""
+    elapsed = max(time.time() - collector_state['started'], 1e-6)
+    ticks = collector_state['ticks']
+    return {
+        'mode': collector_state['mode'],
+        'interval': collector_state['interval'],
+        'subscribers': snapshot_publisher.subscribers,
+        'ticks': ticks,
+        'last_tick_ms': round(collector_state['last_tick_ms'], 2),
+        'avg_tick_ms': round(collector_state['cpu_time'] * 1000 / ticks, 2) if ticks else 0,
+        'cpu_percent': round(collector_state['cpu_time'] / elapsed * 100, 3)
+    }
+
 def background_update():
-    """后台更新系统信息"""
+    """后台更新系统信息 - 按客户端需求调整采集频率"""
     while True:
+        tick_start = time.thread_time()
+        
         update_system_info()
         
         # 每10秒检查一次温度，但不进行硬件控制（硬件控制由独立程序处理）
         if int(time.time()) % 10 == 0:
             # 仅获取当前温度用于显示，不进行控制操作
-            temp = get_cpu_temperature()
+            temp = system_info['cpu'].get('temp', 0)
             # 更新内部状态但不执行控制
             print(f"[TEMP] CPU温度: {temp}°C (状态监控，无硬件控制)")  # 仅日志记录
         
-        # 每秒更新风扇状态
+        # 每个周期更新风扇状态
         update_fan_status()
         
-        time.sleep(0.5)  # 每0.5秒更新一次
+        board = shared_state.board
+        last_activity = collector_state['last_client_activity']
+        if board is not None:
+            # 多进程模式：客户端请求和进程表请求发生在工作进程中，由共享内存头部传入
+            last_activity = max(last_activity, board.client_activity)
+            process_monitor.mark_demand(board.process_demand)
+        
+        # 仅在有客户端查看进程表时按间隔增量刷新
+        if process_monitor.wanted():
+            process_monitor.refresh()
+            if board is not None:
+                board.slot('processes').write_json(process_monitor.export())
+        
+        # 有SSE订阅者或最近有轮询时使用快速采集，否则降到后台频率
+        idle_for = time.time() - last_activity
+        if snapshot_publisher.subscribers > 0 or idle_for < CLIENT_IDLE_TIMEOUT:
+            collector_state['mode'] = 'active'
+            collector_state['interval'] = ACTIVE_INTERVAL
+        else:
+            collector_state['mode'] = 'idle'
+            collector_state['interval'] = IDLE_INTERVAL
+        system_info['collector'] = get_collector_status()
+        if board is not None:
+            board.collector_active = collector_state['mode'] == 'active'
+            board.slot('store').write_json(metrics_store.status())
+        
+        # 每个周期只序列化一次，推送给所有SSE订阅者
+        snapshot_publisher.publish(build_system_payload())
+        
+        # 同一周期渲染 /metrics 文本，抓取时直接返回缓存
+        metrics_exposition.render(
+            system_info, fan_control,
+            {**raw_stats, 'network': last_network_stats, 'io': last_io_stats, 'cpu_stats': last_cpu_stats},
+            sensor_registry.describe(), collector_state
+        )
+        
+        # 统计采集线程自身的CPU开销
+        tick_cost = time.thread_time() - tick_start
+        collector_state['cpu_time'] += tick_cost
+        collector_state['last_tick_ms'] = tick_cost * 1000
+        collector_state['ticks'] += 1
+        
+        wait_next_tick(collector_state['interval'])
+
+def wait_next_tick(interval):
+    """
+    等待下一个采集周期，空闲频率下收到客户端请求时提前唤醒
+    多进程模式下同时处理工作进程发来的命令（唤醒、风扇控制、目录大小索引优先扫描）
+    """
+    board = shared_state.board
+    if board is None:
+        collector_wakeup.wait(interval)
+        collector_wakeup.clear()
+        return
+    deadline = time.time() + interval
+    while True:
+        command = board.receive(deadline - time.time())
+        if command is None:
+            return
+        if command[0] == 'wake':
+            if collector_state['mode'] == 'idle':
+                return
+        elif command[0] == 'fan':
+            apply_fan_command(command[1], command[2])
+            snapshot_publisher.publish(build_system_payload())
+        elif command[0] == 'size_index':
+            file_manager.size_index.prioritize(command[1])
+
+def run_collector():
+    """多进程模式下采集进程的入口：在主线程中运行采集循环，异常时记录日志后重新开始"""
+    metrics_store.start()
+    file_manager.size_index.start()
+    try:
+        while True:
+            try:
+                background_update()
+            except Exception as e:
+                logger.error(f"采集循环异常: {e}")
+                traceback.print_exc()
+                time.sleep(1)
+    finally:
+        # 收到 SIGTERM 退出时写入剩余的指标数据和目录大小索引
+        metrics_store.close()
+        file_manager.size_index.close()
+
+def attach_shared_board():
+    """多进程模式下将快照、/metrics 文本和指标历史挂载到主进程创建的共享内存"""
+    board = shared_state.board
+    writer = shared_state.role == 'collector'
+    snapshot_publisher.attach(board.slot('system'), writer, heartbeat=None if writer else mark_client_activity)
+    metrics_exposition.attach(board.slot('metrics'), board.slot('metrics_text'), writer)
+    metrics_history.attach(board.region('history'))
+    metrics_store.attach(board.slot('store_pending'), writer)
+    if not writer:
+        process_monitor.remote = True
+        # 目录大小索引由采集进程维护，工作进程请求优先扫描时转发给采集进程
+        file_manager.size_index.remote = lambda path: board.send(('size_index', path))
+
+if shared_state.board is not None:
+    attach_shared_board()
 
 # HTML模板
 HTML_TEMPLATE = """
@@ -1048,6 +1305,10 @@ HTML_TEMPLATE = """
                     <span class="info-label">更新时间</span>
                     <span class="info-value" id="currentTimestamp">--</span>
                 </div>
+                <div class="info-item">
+                    <span class="info-label">采集开销</span>
+                    <span class="info-value" id="collectorCost">--</span>
+                </div>
             </div>
             
         </div>
@@ -1059,86 +1320,93 @@ HTML_TEMPLATE = """
             try {
                 const response = await fetch('/api/system');
                 const data = await response.json();
-
-                // 更新CPU信息
-                document.getElementById('cpuPercent').textContent = data.cpu.percent + '%';
-                document.getElementById('cpuTemp').textContent = data.cpu.temp + '°C';
-                document.getElementById('cpuFreq').textContent = data.cpu.freq + ' MHz';
-                document.getElementById('cpuCount').textContent = data.cpu.count;
-                document.getElementById('cpuModel').textContent = data.cpu.model;
-                
-                // 更新进度条
-                const cpuProgress = document.getElementById('cpuProgress');
-                cpuProgress.style.width = data.cpu.percent + '%';
-                cpuProgress.className = 'progress-fill ' + getProgressClass(data.cpu.percent);
-
-                // 更新功耗信息
-                document.getElementById('powerWatts').textContent = data.power.watts + ' W';
-                document.getElementById('cpuVoltage').textContent = (data.cpu.voltage > 0) ? data.cpu.voltage + ' V' : 'N/A';
-                document.getElementById('powerCpuTemp').textContent = data.cpu.temp + '°C';
-                const powerProgress = document.getElementById('powerProgress');
-                const powerPercent = Math.min((data.power.watts / 10) * 100, 100);
-                powerProgress.style.width = powerPercent + '%';
-                powerProgress.className = 'progress-fill ' + getProgressClass(powerPercent);
-
-                // 更新内存信息
-                document.getElementById('memoryPercent').textContent = data.memory.percent + '%';
-                document.getElementById('memoryUsed').textContent = data.memory.used + ' GB';
-                document.getElementById('memoryFree').textContent = data.memory.free + ' GB';
-                document.getElementById('memoryTotal').textContent = data.memory.total + ' GB';
-                
-                // 更新内存进度条
-                const memoryProgress = document.getElementById('memoryProgress');
-                memoryProgress.style.width = data.memory.percent + '%';
-                memoryProgress.className = 'progress-fill ' + getProgressClass(data.memory.percent);
-
-                // 更新磁盘信息
-                document.getElementById('diskPercent').textContent = data.disk.percent + '%';
-                document.getElementById('diskUsed').textContent = data.disk.used + ' GB';
-                document.getElementById('diskFree').textContent = data.disk.free + ' GB';
-                document.getElementById('diskTotal').textContent = data.disk.total + ' GB';
-                
-                // 更新磁盘进度条
-                const diskProgress = document.getElementById('diskProgress');
-                diskProgress.style.width = data.disk.percent + '%';
-                diskProgress.className = 'progress-fill ' + getProgressClass(data.disk.percent);
-
-                // 更新网络信息
-                document.getElementById('netUpload').textContent = data.network.upload_speed + ' KB/s';
-                document.getElementById('netDownload').textContent = data.network.download_speed + ' KB/s';
-                document.getElementById('netTotalUpload').textContent = data.network.bytes_sent + ' MB';
-                document.getElementById('netTotalDownload').textContent = data.network.bytes_recv + ' MB';
-
-                // 更新IO信息
-                document.getElementById('ioRead').textContent = data.io.read_speed + ' KB/s';
-                document.getElementById('ioWrite').textContent = data.io.write_speed + ' KB/s';
-                document.getElementById('ioTotalRead').textContent = data.io.read_bytes + ' MB';
-                document.getElementById('ioTotalWrite').textContent = data.io.write_bytes + ' MB';
-
-                // 更新系统信息
-                document.getElementById('sysUptime').textContent = formatUptime(data.uptime);
-                document.getElementById('sysSystem').textContent = data.system.system;
-                document.getElementById('sysRelease').textContent = data.system.release;
-                document.getElementById('sysMachine').textContent = data.system.machine;
-                document.getElementById('currentTimestamp').textContent = data.timestamp;
-                
-                // 更新风扇信息（如果存在）
-                if (data.fan_control) {
-                    document.getElementById('fanStatus').textContent = data.fan_control.is_running ? '运行中' : '已停止';
-                    document.getElementById('fanMode').textContent = data.fan_control.mode === 'auto' ? '自动' : '手动';
-                    
-                    // 格式化剩余时间
-                    const remainingSecs = data.fan_control.current_cycle_remaining || 0;
-                    document.getElementById('fanCycleRemaining').textContent = formatSeconds(remainingSecs);
-                    
-                    document.getElementById('fanRunningDuration').textContent = formatSeconds(data.fan_control.running_duration || 0);
-                    document.getElementById('fanStopDuration').textContent = formatSeconds(data.fan_control.stop_duration || 0);
-                }
+                renderSystemInfo(data);
             } catch (error) {
                 console.error('获取系统信息失败:', error);
             }
         }
         
+        function renderSystemInfo(data) {
+            // 更新CPU信息
+            document.getElementById('cpuPercent').textContent = data.cpu.percent + '%';
+            document.getElementById('cpuTemp').textContent = data.cpu.temp + '°C';
+            document.getElementById('cpuFreq').textContent = data.cpu.freq + ' MHz';
+            document.getElementById('cpuCount').textContent = data.cpu.count;
+            document.getElementById('cpuModel').textContent = data.cpu.model;
+            
+            // 更新进度条
+            const cpuProgress = document.getElementById('cpuProgress');
+            cpuProgress.style.width = data.cpu.percent + '%';
+            cpuProgress.className = 'progress-fill ' + getProgressClass(data.cpu.percent);
+
+            // 更新功耗信息
+            document.getElementById('powerWatts').textContent = data.power.watts + ' W';
+            document.getElementById('cpuVoltage').textContent = (data.cpu.voltage > 0) ? data.cpu.voltage + ' V' : 'N/A';
+            document.getElementById('powerCpuTemp').textContent = data.cpu.temp + '°C';
+            const powerProgress = document.getElementById('powerProgress');
+            const powerPercent = Math.min((data.power.watts / 10) * 100, 100);
+            powerProgress.style.width = powerPercent + '%';
+            powerProgress.className = 'progress-fill ' + getProgressClass(powerPercent);
+
+            // 更新内存信息
+            document.getElementById('memoryPercent').textContent = data.memory.percent + '%';
+            document.getElementById('memoryUsed').textContent = data.memory.used + ' GB';
+            document.getElementById('memoryFree').textContent = data.memory.free + ' GB';
+            document.getElementById('memoryTotal').textContent = data.memory.total + ' GB';
+            
+            // 更新内存进度条
+            const memoryProgress = document.getElementById('memoryProgress');
+            memoryProgress.style.width = data.memory.percent + '%';
+            memoryProgress.className = 'progress-fill ' + getProgressClass(data.memory.percent);
+
+            // 更新磁盘信息
+            document.getElementById('diskPercent').textContent = data.disk.percent + '%';
+            document.getElementById('diskUsed').textContent = data.disk.used + ' GB';
+            document.getElementById('diskFree').textContent = data.disk.free + ' GB';
+            document.getElementById('diskTotal').textContent = data.disk.total + ' GB';
+            
+            // 更新磁盘进度条
+            const diskProgress = document.getElementById('diskProgress');
+            diskProgress.style.width = data.disk.percent + '%';
+            diskProgress.className = 'progress-fill ' + getProgressClass(data.disk.percent);
+
+            // 更新网络信息
+            document.getElementById('netUpload').textContent = data.network.upload_speed + ' KB/s';
+            document.getElementById('netDownload').textContent = data.network.download_speed + ' KB/s';
+            document.getElementById('netTotalUpload').textContent = data.network.bytes_sent + ' MB';
+            document.getElementById('netTotalDownload').textContent = data.network.bytes_recv + ' MB';
+
+            // 更新IO信息
+            document.getElementById('ioRead').textContent = data.io.read_speed + ' KB/s';
+            document.getElementById('ioWrite').textContent = data.io.write_speed + ' KB/s';
+            document.getElementById('ioTotalRead').textContent = data.io.read_bytes + ' MB';
+            document.getElementById('ioTotalWrite').textContent = data.io.write_bytes + ' MB';
+
+            // 更新系统信息
+            document.getElementById('sysUptime').textContent = formatUptime(data.uptime);
+            document.getElementById('sysSystem').textContent = data.system.system;
+            document.getElementById('sysRelease').textContent = data.system.release;
+            document.getElementById('sysMachine').textContent = data.system.machine;
+            document.getElementById('currentTimestamp').textContent = data.timestamp;
+            if (data.collector) {
+                document.getElementById('collectorCost').textContent =
+                    `${data.collector.cpu_percent}% CPU / ${data.collector.interval}秒`;
+            }
+            
+            // 更新风扇信息（如果存在）
+            if (data.fan_control) {
+                document.getElementById('fanStatus').textContent = data.fan_control.is_running ? '运行中' : '已停止';
+                document.getElementById('fanMode').textContent = data.fan_control.mode === 'auto' ? '自动' : '手动';
+                
+                // 格式化剩余时间
+                const remainingSecs = data.fan_control.current_cycle_remaining || 0;
+                document.getElementById('fanCycleRemaining').textContent = formatSeconds(remainingSecs);
+                
+                document.getElementById('fanRunningDuration').textContent = formatSeconds(data.fan_control.running_duration || 0);
+                document.getElementById('fanStopDuration').textContent = formatSeconds(data.fan_control.stop_duration || 0);
+            }
+        }
+        
         // 格式化秒数为时分秒
         function formatSeconds(seconds) {
             if (seconds <= 0) return '0秒';
@@ -1170,8 +1438,35 @@ HTML_TEMPLATE = """
             return `${days}天 ${hours}小时 ${minutes}分钟`;
         }
 
-        // 定期获取系统信息
-        setInterval(fetchSystemInfo, 1000);  // 每1秒更新一次
+        // 优先使用SSE接收服务端推送，不支持或连接失败时回退到每1秒轮询
+        let pollTimer = null;
+        
+        function startPolling() {
+            if (pollTimer) return;
+            pollTimer = setInterval(fetchSystemInfo, 1000);
+        }
+        
+        function stopPolling() {
+            if (!pollTimer) return;
+            clearInterval(pollTimer);
+            pollTimer = null;
+        }
+        
+        if (window.EventSource) {
+            const source = new EventSource('/api/system/stream');
+            source.onmessage = (event) => {
+                stopPolling();
+                try {
+                    renderSystemInfo(JSON.parse(event.data));
+                } catch (error) {
+                    console.error('解析推送数据失败:', error);
+                }
+            };
+            // EventSource 会自动重连，重连期间临时使用轮询
+            source.onerror = () => startPolling();
+        } else {
+            startPolling();
+        }
         fetchSystemInfo();  // 页面加载时立即获取一次
         
         async function setFanMode(mode) {
@@ -1235,28 +1530,154 @@ def filemanager_page():
 # API端点
 @app.route('/api/system', methods=['GET'])
 def api_system():
-    """系统信息API - 更新以包含风扇控制信息"""
+    """系统信息API - 直接返回采集线程发布的预序列化快照"""
     try:
-        # 构造包含风扇控制信息的响应
-        response_data = system_info.copy()
-        response_data["fan_control"] = {
-            "enabled": fan_control["enabled"],
-            "status": fan_control["status"],
-            "mode": fan_control["mode"],
-            "speed": fan_control["speed"],
-            "target_temp": fan_control["target_temp"],
-            "running_duration": fan_control["running_duration"],
-            "stop_duration": fan_control["stop_duration"],
-            "current_cycle_remaining": fan_control["current_cycle_remaining"],
-            "is_running": fan_control["is_running"],
-            "next_switch_time": fan_control["next_switch_time"]
-        }
-        
-        return jsonify(response_data)
+        mark_client_activity()
+        snapshot = snapshot_publisher.latest()
+        if not snapshot.version:
+            # 采集线程尚未发布快照时现场构造
+            return jsonify(build_system_payload())
+        
+        if request.if_none_match.contains(snapshot.etag):
+            response = Response(status=304, mimetype='application/json')
+        else:
+            response = Response(snapshot.payload, mimetype='application/json')
+        response.headers['ETag'] = f'"{snapshot.etag}"'
+        response.headers['Last-Modified'] = snapshot.last_modified
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Snapshot-Version'] = str(snapshot.version)
+        return response
     except Exception as e:
         logger.error(f"获取系统信息时发生错误: {e}")
         return jsonify({"success": False, "message": f"获取系统信息时发生错误: {str(e)}"}), 500
 
+@app.route('/api/system/stream', methods=['GET'])
+def api_system_stream():
+    """系统信息SSE推送 - 每个采集周期推送一次预序列化的快照"""
+    mark_client_activity()
+    return Response(
+        snapshot_publisher.stream(),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # 禁止nginx缓冲事件流
+        }
+    )
+
+@app.route('/api/system/cores', methods=['GET'])
+def api_system_cores():
+    """每核心使用率/频率、负载、上下文切换和中断信息"""
+    try:
+        mark_client_activity()
+        info = latest_system_info()
+        cores = info.get('cores')
+        if not cores:
+            return jsonify({"success": False, "message": "核心信息尚未采集"}), 503
+        return jsonify({"success": True, "timestamp": info['timestamp'], **cores})
+    except Exception as e:
+        logger.error(f"获取核心信息时发生错误: {e}")
+        return jsonify({"success": False, "message": f"获取核心信息时发生错误: {str(e)}"}), 500
+
+@app.route('/api/processes', methods=['GET'])
+def api_processes():
+    """按CPU或内存排序的进程表"""
+    try:
+        try:
+            top = int(request.args.get('top', 10))
+        except ValueError:
+            return jsonify({"success": False, "message": "top参数必须为整数"}), 400
+        sort = request.args.get('sort', 'cpu')
+        if sort not in ['cpu', 'rss']:
+            return jsonify({"success": False, "message": "无效的排序字段，仅支持 'cpu' 或 'rss'"}), 400
+        
+        mark_client_activity()
+        if shared_state.role == 'worker':
+            # 进程表由采集进程刷新，工作进程只读取共享内存中的最新结果
+            shared_state.board.touch_process_demand()
+            data = shared_state.board.slot('processes').read_json()
+            if data:
+                process_monitor.load(data)
+        return status_response(process_monitor.top(top, sort))
+    except Exception as e:
+        logger.error(f"获取进程列表时发生错误: {e}")
+        return jsonify({"success": False, "message": f"获取进程列表时发生错误: {str(e)}"}), 500
+
+@app.route('/api/system/sensors', methods=['GET'])
+def api_system_sensors():
+    """列出所有已发现的传感器及最近读数"""
+    try:
+        if shared_state.role == 'worker':
+            # 工作进程不参与采集，请求时批量读取一次（仅 pread，开销很小）
+            sensor_registry.read_all()
+        return jsonify({"success": True, "sensors": sensor_registry.describe()})
+    except Exception as e:
+        logger.error(f"获取传感器列表时发生错误: {e}")
+        return jsonify({"success": False, "message": f"获取传感器列表时发生错误: {str(e)}"}), 500
+
+@app.route('/api/system/history', methods=['GET'])
+def api_system_history():
+    """系统指标历史API - 服务端降采样"""
+    try:
+        metric = request.args.get('metric', 'cpu.percent')
+        since = request.args.get('since')
+        step = request.args.get('step')
+        
+        try:
+            since = float(since) if since else None
+            step = float(step) if step else None
+        except ValueError:
+            return jsonify({"success": False, "message": "since和step参数必须为数字"}), 400
+        
+        if step is not None and step <= 0:
+            return jsonify({"success": False, "message": "step参数必须大于0"}), 400
+        
+        result = metrics_history.query(metric, since, step)
+        if not result["success"]:
+            return jsonify(result), 400
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"获取历史数据时发生错误: {e}")
+        return jsonify({"success": False, "message": f"获取历史数据时发生错误: {str(e)}"}), 500
+
+@app.route('/api/system/archive', methods=['GET'])
+def api_system_archive():
+    """持久化的指标汇总数据（1分钟/10分钟/1小时），服务重启后仍可查询"""
+    try:
+        metric = request.args.get('metric', 'cpu.percent')
+        try:
+            start = float(request.args['start']) if request.args.get('start') else None
+            end = float(request.args['end']) if request.args.get('end') else None
+            resolution = int(request.args['resolution']) if request.args.get('resolution') else None
+        except ValueError:
+            return jsonify({"success": False, "message": "start、end和resolution参数必须为数字"}), 400
+        
+        result = metrics_store.query(metric, start, end, resolution)
+        if not result["success"]:
+            return jsonify(result), 400
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"获取归档数据时发生错误: {e}")
+        return jsonify({"success": False, "message": f"获取归档数据时发生错误: {str(e)}"}), 500
+
+@app.route('/api/system/store', methods=['GET'])
+def api_system_store():
+    """持久化存储的写入统计（写放大、刷新次数等）"""
+    try:
+        if shared_state.role == 'worker':
+            return jsonify({"success": True, **(shared_state.board.slot('store').read_json() or metrics_store.status())})
+        return jsonify({"success": True, **metrics_store.status()})
+    except Exception as e:
+        logger.error(f"获取存储统计时发生错误: {e}")
+        return jsonify({"success": False, "message": f"获取存储统计时发生错误: {str(e)}"}), 500
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus/OpenMetrics 指标导出（返回采集线程缓存的文本，不触发采集）"""
+    # 不接受 OpenMetrics 的抓取方返回 0.0.4 文本格式（两种格式的计数器 TYPE 行写法不同）
+    openmetrics = 'application/openmetrics-text' in request.headers.get('Accept', '')
+    content_type = OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE
+    return Response(metrics_exposition.payload(openmetrics), content_type=content_type)
+
 # 文件管理API
 
 @app.route('/api/files/list', methods=['GET'])
@@ -1277,7 +1698,23 @@ def api_files_list():
 
         
 
-        result = file_manager.list_directory(path)
+        limit = request.args.get('limit')
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                return jsonify({"success": False, "message": "limit参数必须为整数"}), 400
+        fields = request.args.get('fields')
+        fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else None
+
+        result = file_manager.list_directory(
+            path,
+            limit=limit,
+            cursor=request.args.get('cursor') or None,
+            sort=request.args.get('sort', 'name'),
+            order=request.args.get('order', 'asc'),
+            fields=fields
+        )
 
         return jsonify(result)
 
@@ -1439,6 +1876,111 @@ def api_files_upload():
 
 
 
+def status_response(result):
+    """结果中的 status 字段作为HTTP状态码（分块上传、打包下载、分段预览等接口共用）"""
+    status = result.pop("status", 200)
+    return jsonify(result), status
+
+
+@app.route('/api/files/upload/init', methods=['POST'])
+def api_files_upload_init():
+    """创建分块上传会话"""
+    try:
+        data = request.get_json(silent=True)
+        if not data:
+            return jsonify({"success": False, "message": "请求体为空"}), 400
+        size = data.get('size')
+        chunk_size = data.get('chunk_size', DEFAULT_CHUNK_SIZE)
+        if not isinstance(size, int) or not isinstance(chunk_size, int):
+            return jsonify({"success": False, "message": "size和chunk_size必须为整数"}), 400
+        result = file_manager.upload_init(
+            data.get('path', ''),
+            data.get('filename', ''),
+            size,
+            chunk_size,
+            overwrite=bool(data.get('overwrite', False)),
+            create_dirs=bool(data.get('create_dirs', False))
+        )
+        return status_response(result)
+    except Exception as e:
+        logger.error(f"创建上传会话时发生错误: {e}")
+        return jsonify({"success": False, "message": f"创建上传会话时发生错误: {str(e)}"}), 500
+
+
+@app.route('/api/files/upload/batch', methods=['POST'])
+def api_files_upload_batch():
+    """批量上传小文件：multipart 中多个 file 字段，paths 为与之一一对应的相对路径 JSON 数组（上传文件夹时保留目录结构）"""
+    try:
+        if request.content_length is None:
+            return jsonify({"success": False, "message": "缺少Content-Length"}), 411
+        if request.content_length > MAX_BATCH_BYTES:
+            return jsonify({
+                "success": False,
+                "message": f"请求体超过批量上传限制 ({file_manager.format_size(MAX_BATCH_BYTES)})，大文件请使用分块上传"
+            }), 413
+        files = request.files.getlist('file')
+        try:
+            paths = json.loads(request.form.get('paths') or '[]')
+        except ValueError:
+            return jsonify({"success": False, "message": "paths参数格式错误"}), 400
+        if not isinstance(paths, list) or len(paths) not in (0, len(files)):
+            return jsonify({"success": False, "message": "paths与文件数量不一致"}), 400
+        names = [str(p) for p in paths] if paths else [f.filename or '' for f in files]
+        result = file_manager.upload_batch(
+            request.form.get('path', ''),
+            [(name, f.stream) for name, f in zip(names, files)],
+            overwrite=request.form.get('overwrite', '').lower() in ('1', 'true')
+        )
+        return status_response(result)
+    except Exception as e:
+        logger.error(f"批量上传文件时发生错误: {e}")
+        return jsonify({"success": False, "message": f"批量上传文件时发生错误: {str(e)}"}), 500
+
+
+@app.route('/api/files/upload/<upload_id>', methods=['GET'])
+def api_files_upload_status(upload_id):
+    """查询分块上传进度，客户端据此补传缺失的区间"""
+    return status_response(file_manager.uploads.status(upload_id))
+
+
+@app.route('/api/files/upload/<upload_id>', methods=['PUT'])
+def api_files_upload_chunk(upload_id):
+    """上传一个分块：请求体为原始字节，offset 为分块在文件中的偏移量，可选 X-Chunk-SHA256 头校验分块"""
+    try:
+        try:
+            offset = int(request.args.get('offset', ''))
+        except ValueError:
+            return jsonify({"success": False, "message": "offset参数必须为整数"}), 400
+        result = file_manager.uploads.write_chunk(
+            upload_id,
+            offset,
+            request.content_length,
+            request.stream,
+            checksum=request.headers.get('X-Chunk-SHA256')
+        )
+        return status_response(result)
+    except Exception as e:
+        logger.error(f"上传分块时发生错误: {e}")
+        return jsonify({"success": False, "message": f"上传分块时发生错误: {str(e)}"}), 500
+
+
+@app.route('/api/files/upload/<upload_id>/finalize', methods=['POST'])
+def api_files_upload_finalize(upload_id):
+    """完成分块上传：可选 sha256 校验整个文件，然后原子改名为目标文件"""
+    try:
+        data = request.get_json(silent=True) or {}
+        return status_response(file_manager.upload_finalize(upload_id, data.get('sha256') or None))
+    except Exception as e:
+        logger.error(f"完成上传时发生错误: {e}")
+        return jsonify({"success": False, "message": f"完成上传时发生错误: {str(e)}"}), 500
+
+
+@app.route('/api/files/upload/<upload_id>', methods=['DELETE'])
+def api_files_upload_abort(upload_id):
+    """取消分块上传"""
+    return status_response(file_manager.uploads.abort(upload_id))
+
+
 @app.route('/api/files/download', methods=['GET'])
 
 def api_files_download():
@@ -1473,12 +2015,6 @@ def api_files_download():
 
         
 
-        from flask import send_file
-
-        import os
-
-        
-
         # 检查文件权限
 
         if not os.access(str(safe_path), os.R_OK):
@@ -1487,9 +2023,9 @@ def api_files_download():
 
         
 
-        # Flask 3.1.2 使用 download_name 参数
+        # 支持 Range、ETag/If-Modified-Since 条件请求，gunicorn 下用 sendfile 零拷贝发送
 
-        return send_file(str(safe_path), as_attachment=True, download_name=os.path.basename(str(safe_path)))
+        return send_download(safe_path, str(safe_path.relative_to(file_manager.base_path)))
 
     except PermissionError:
 
@@ -1657,6 +2193,108 @@ def api_files_rename():
 
 
 
+# 批量文件操作API端点
+@app.route('/api/files/batch', methods=['POST'])
+def api_files_batch():
+    """
+    批量文件操作：operations 为按顺序执行的操作列表（delete、rename、mkdir、move、chmod），
+    atomic 为 true 时全部成功或全部不执行，async 为 true 时作为后台任务执行（返回 202 和任务状态）
+    返回与操作一一对应的 results 数组
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not data:
+            return jsonify({"success": False, "message": "请求体为空"}), 400
+        atomic = data.get('atomic', False)
+        run_async = data.get('async', False)
+        if not isinstance(atomic, bool) or not isinstance(run_async, bool):
+            return jsonify({"success": False, "message": "atomic、async 必须为布尔值"}), 400
+        result = file_manager.batch(data.get('operations'), atomic, run_async)
+        return status_response(result)
+    except Exception as e:
+        logger.error(f"批量操作时发生错误: {e}")
+        return jsonify({"success": False, "message": f"批量操作时发生错误: {str(e)}"}), 500
+
+
+# 后台任务API端点
+
+@app.route('/api/jobs', methods=['POST'])
+def api_jobs_submit():
+    """
+    提交后台任务：type 为 delete、copy、move 或 archive，paths 为路径列表，
+    dest 为目标目录（copy/move/archive），format、level 为打包格式和压缩级别（archive）
+    立即返回 202 和任务状态
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not data:
+            return jsonify({"success": False, "message": "请求体为空"}), 400
+        result = file_manager.submit_job(
+            data.get('type', ''),
+            data.get('paths'),
+            data.get('dest'),
+            data.get('format', 'zip'),
+            data.get('level')
+        )
+        return status_response(result)
+    except Exception as e:
+        logger.error(f"提交任务时发生错误: {e}")
+        return jsonify({"success": False, "message": f"提交任务时发生错误: {str(e)}"}), 500
+
+
+@app.route('/api/jobs', methods=['GET'])
+def api_jobs_list():
+    """列出最近的后台任务（所有工作进程）"""
+    return jsonify({"success": True, "jobs": file_manager.jobs.list_jobs()})
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def api_jobs_status(job_id):
+    """查询任务状态、进度和结果"""
+    state = file_manager.jobs.get(job_id)
+    if state is None:
+        return jsonify({"success": False, "message": "任务不存在或已过期"}), 404
+    return jsonify({"success": True, "job": state})
+
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def api_jobs_cancel(job_id):
+    """取消任务"""
+    state = file_manager.jobs.cancel(job_id)
+    if state is None:
+        return jsonify({"success": False, "message": "任务不存在或已过期"}), 404
+    return jsonify({"success": True, "job": state})
+
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def api_jobs_events(job_id):
+    """以SSE推送任务状态（事件名 job），任务结束后关闭"""
+    if file_manager.jobs.get(job_id) is None:
+        return jsonify({"success": False, "message": "任务不存在或已过期"}), 404
+    updates = file_manager.jobs.watch(job_id)
+
+    def stream():
+        try:
+            yield b'retry: 3000\n\n'
+            for state in updates:
+                if state is None:
+                    yield b': keepalive\n\n'
+                else:
+                    yield b'event: job\ndata: %s\n\n' % json.dumps(state, ensure_ascii=False).encode()
+        finally:
+            updates.close()
+
+    return Response(
+        stream(),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # 禁止nginx缓冲事件流
+        }
+    )
+
+
+
 # 目录统计API端点
 
 @app.route('/api/files/stats', methods=['GET'])
@@ -1675,7 +2313,13 @@ def api_files_stats():
 
         
 
-        result = file_manager.get_directory_stats(path)
+        depth = request.args.get('depth', '0')
+        try:
+            depth = int(depth)
+        except ValueError:
+            return jsonify({"success": False, "message": "depth参数必须为整数"}), 400
+
+        result = file_manager.get_directory_stats(path, depth)
 
         return jsonify(result)
 
@@ -1686,6 +2330,119 @@ def api_files_stats():
         return jsonify({"success": False, "message": f"获取统计信息时发生错误: {str(e)}"}), 500
 
 
+@app.route('/api/files/search', methods=['GET'])
+def api_files_search():
+    """按文件名搜索"""
+    try:
+        limit = request.args.get('limit', '100')
+        min_size = request.args.get('min_size')
+        modified_after = request.args.get('modified_after')
+        try:
+            limit = int(limit)
+            min_size = int(min_size) if min_size else None
+        except ValueError:
+            return jsonify({"success": False, "message": "limit和min_size参数必须为整数"}), 400
+        if modified_after:
+            # 支持Unix时间戳或 YYYY-MM-DD[ HH:MM:SS]
+            try:
+                modified_after = float(modified_after)
+            except ValueError:
+                try:
+                    modified_after = datetime.fromisoformat(modified_after).timestamp()
+                except ValueError:
+                    return jsonify({"success": False, "message": "modified_after参数必须为时间戳或日期"}), 400
+        else:
+            modified_after = None
+
+        result = file_manager.search(
+            request.args.get('q', '').strip(),
+            request.args.get('path', ''),
+            entry_type=request.args.get('type') or None,
+            min_size=min_size,
+            modified_after=modified_after,
+            limit=limit,
+            cursor=request.args.get('cursor') or None
+        )
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"搜索文件时发生错误: {e}")
+        return jsonify({"success": False, "message": f"搜索文件时发生错误: {str(e)}"}), 500
+
+
+@app.route('/api/files/content_search', methods=['GET'])
+def api_files_content_search():
+    """搜索文本文件内容 - 以SSE事件流逐条推送匹配结果（match），最后推送统计信息（done）"""
+    try:
+        limit = request.args.get('limit', '200')
+        try:
+            limit = int(limit)
+        except ValueError:
+            return jsonify({"success": False, "message": "limit参数必须为整数"}), 400
+
+        result = file_manager.search_content(request.args.get('q', '').strip(), request.args.get('path', ''), limit)
+        if not result["success"]:
+            return jsonify(result), 400
+    except Exception as e:
+        logger.error(f"搜索文件内容时发生错误: {e}")
+        return jsonify({"success": False, "message": f"搜索文件内容时发生错误: {str(e)}"}), 500
+
+    def stream():
+        try:
+            for event, data in result["events"]:
+                yield b'event: %s\ndata: %s\n\n' % (event.encode(), json.dumps(data, ensure_ascii=False).encode())
+        except Exception as e:
+            logger.error(f"搜索文件内容时发生错误: {e}")
+            payload = json.dumps({"message": f"搜索文件内容时发生错误: {str(e)}"}, ensure_ascii=False)
+            yield b'event: failed\ndata: %s\n\n' % payload.encode()
+
+    return Response(
+        stream(),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # 禁止nginx缓冲事件流
+        }
+    )
+
+
+@app.route('/api/files/archive', methods=['GET'])
+def api_files_archive():
+    """打包下载目录或多选的条目：path 可重复，format 为 zip/tar.gz/tar.zst，level 为压缩级别"""
+    try:
+        result = file_manager.archive(
+            request.args.getlist('path'),
+            request.args.get('format', 'zip'),
+            request.args.get('level')
+        )
+        if not result["success"]:
+            return status_response(result)
+    except Exception as e:
+        logger.error(f"打包下载时发生错误: {e}")
+        return jsonify({"success": False, "message": f"打包下载时发生错误: {str(e)}"}), 500
+
+    def stream():
+        # 响应头已经发出，出错时只能中断数据流（客户端会得到不完整的压缩包）
+        try:
+            yield from result["stream"]
+        except Exception as e:
+            logger.error(f"打包下载时发生错误: {e}")
+        finally:
+            result["stream"].close()
+
+    headers = Headers({
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no'  # 禁止nginx缓冲，边压缩边发送
+    })
+    set_disposition(headers, result["filename"])
+    return Response(stream(), mimetype=result["mimetype"], headers=headers)
+
+
+@app.route('/api/files/cache', methods=['GET'])
+def api_files_cache():
+    """目录列表缓存统计（多进程模式下为当前工作进程的缓存）"""
+    return jsonify({"success": True, **file_manager.listing_cache.stats()})
+
+
 
 # 读取文件内容API端点
 
@@ -1739,13 +2496,93 @@ def api_files_read():
 
 
 
+@app.route('/api/files/preview', methods=['GET'])
+def api_files_preview():
+    """分段预览文本文件：offset（字节位置）、line（行号）或 before（向上翻页）三选一，lines 为行数"""
+    params = {}
+    for name in ('offset', 'line', 'before', 'lines'):
+        value = request.args.get(name)
+        if value is None or value == '':
+            continue
+        try:
+            params[name] = int(value)
+        except ValueError:
+            return jsonify({"success": False, "message": f"{name}参数必须为整数"}), 400
+    try:
+        return status_response(file_manager.preview_file(request.args.get('path', ''), **params))
+    except Exception as e:
+        logger.error(f"预览文件时发生错误: {e}")
+        return jsonify({"success": False, "message": f"预览文件时发生错误: {str(e)}"}), 500
+
+
+@app.route('/api/files/tail', methods=['GET'])
+def api_files_tail():
+    """
+    跟踪文件末尾：先返回最后 lines 行，follow=1 时持续推送新追加的内容
+    format=sse（默认）为SSE事件流，format=text 为分块传输的纯文本（适合 curl）
+    """
+    try:
+        try:
+            lines = int(request.args.get('lines', DEFAULT_TAIL_LINES))
+        except ValueError:
+            return jsonify({"success": False, "message": "lines参数必须为整数"}), 400
+        follow = request.args.get('follow', '1').lower() in ('1', 'true')
+        result = file_manager.tail_file(request.args.get('path', ''), lines, follow)
+        if not result["success"]:
+            return status_response(result)
+    except Exception as e:
+        logger.error(f"跟踪文件时发生错误: {e}")
+        return jsonify({"success": False, "message": f"跟踪文件时发生错误: {str(e)}"}), 500
+    events = result["events"]
+
+    if request.args.get('format') == 'text':
+        def stream():
+            try:
+                for event, data in events:
+                    if event == 'data' and data["text"]:
+                        yield data["text"].encode('utf-8')
+            finally:
+                events.close()
+
+        return Response(stream(), mimetype='text/plain',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    def stream():
+        try:
+            yield b'retry: 3000\n\n'
+            for event, data in events:
+                if event == 'keepalive':
+                    yield b': keepalive\n\n'
+                else:
+                    yield b'event: %s\ndata: %s\n\n' % (event.encode(), json.dumps(data, ensure_ascii=False).encode())
+        except Exception as e:
+            logger.error(f"跟踪文件时发生错误: {e}")
+            payload = json.dumps({"message": f"跟踪文件时发生错误: {str(e)}"}, ensure_ascii=False)
+            yield b'event: failed\ndata: %s\n\n' % payload.encode()
+        finally:
+            events.close()
+
+    return Response(
+        stream(),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # 禁止nginx缓冲事件流
+        }
+    )
+
+
 # 写入文件内容API端点
 
 @app.route('/api/files/write', methods=['POST'])
 
 def api_files_write():
 
-    """写入文件内容"""
+    """
+    写入文件内容（原子保存）
+    请求体：path、content、overwrite，可选 base_etag（读取时返回的 etag，文件已被修改时返回409）、fsync（默认true）、
+    encoding（读取时返回的编码，默认utf-8）；差异保存时以 patches（修改的行区间）、base_etag、encoding 代替 content
+    """
 
     try:
 
@@ -1763,6 +2600,10 @@ def api_files_write():
 
         overwrite = data.get('overwrite', True)
 
+        base_etag = data.get('base_etag') or None
+
+        fsync = bool(data.get('fsync', True))
+
         
 
         if not path:
@@ -1773,15 +2614,28 @@ def api_files_write():
 
             return jsonify({"success": False, "message": "路径参数类型错误"}), 400
 
+        if base_etag is not None and not isinstance(base_etag, str):
+
+            return jsonify({"success": False, "message": "base_etag必须为字符串"}), 400
+
+        if 'patches' in data:
+
+            result = file_manager.patch_file_content(path, data['patches'], base_etag,
+
+                                                     data.get('encoding', 'utf-8'), fsync)
+
+            return status_response(result)
+
         if not isinstance(content, str):
 
             return jsonify({"success": False, "message": "内容必须为字符串"}), 400
 
         
 
-        result = file_manager.write_file_content(path, content, overwrite)
+        result = file_manager.write_file_content(path, content, overwrite, base_etag, fsync,
+                                                 data.get('encoding', 'utf-8'))
 
-        return jsonify(result)
+        return status_response(result)
 
     except Exception as e:
 
@@ -1790,6 +2644,65 @@ def api_files_write():
         return jsonify({"success": False, "message": f"写入文件内容时发生错误: {str(e)}"}), 500
 
 
+def set_fan_mode(mode):
+    """设置风扇运行模式"""
+    fan_control['mode'] = mode
+    fan_control['last_control_time'] = time.time()
+    
+    # 在自动模式下，根据当前温度重新设置状态
+    if mode == 'auto':
+        cpu_temp = latest_system_info().get('cpu', {}).get('temp', 0)
+        if cpu_temp >= fan_control['target_temp']:
+            fan_control['is_running'] = True
+            fan_control['status'] = 'on'
+            fan_control['next_switch_time'] = None
+        else:
+            # 对于自动模式的循环，设置下次切换时间
+            current_time = time.time()
+            if fan_control['is_running']:
+                fan_control['next_switch_time'] = current_time + fan_control['running_duration']
+            else:
+                fan_control['next_switch_time'] = current_time + fan_control['stop_duration']
+
+def set_fan_status(status):
+    """设置风扇运行状态"""
+    fan_control['status'] = status
+    fan_control['is_running'] = (status == 'on')
+    fan_control['last_control_time'] = time.time()
+    
+    # 如果是手动模式，直接设置状态
+    if fan_control['mode'] == 'manual':
+        fan_control['is_running'] = (status == 'on')
+
+def record_fan_event(action):
+    """更新内部状态以匹配外部控制事件"""
+    fan_control['is_running'] = (action == 'start')
+    fan_control['status'] = 'on' if action == 'start' else 'off'
+    fan_control['last_control_time'] = time.time()
+
+FAN_COMMANDS = {
+    'mode': set_fan_mode,
+    'status': set_fan_status,
+    'event': record_fan_event
+}
+
+def apply_fan_command(name, arg):
+    """执行风扇控制命令"""
+    FAN_COMMANDS[name](arg)
+
+def dispatch_fan_command(name, arg):
+    """
+    执行风扇控制命令并立即发布新快照，使轮询和SSE客户端无需等待下一个采集周期
+    多进程模式下风扇状态由采集进程维护：工作进程先在快照副本上执行命令用于生成响应，再把命令转发给采集进程
+    """
+    if shared_state.role == 'worker':
+        fan_control.update(latest_system_info().get('fan_control', {}))
+        apply_fan_command(name, arg)
+        shared_state.board.send(('fan', name, arg))
+    else:
+        apply_fan_command(name, arg)
+        snapshot_publisher.publish(build_system_payload())
+
 # 风扇控制API端点
 @app.route('/api/fan/mode', methods=['POST'])
 def api_fan_mode():
@@ -1803,24 +2716,7 @@ def api_fan_mode():
         if mode not in ['auto', 'manual']:
             return jsonify({"success": False, "message": "无效的模式，仅支持 'auto' 或 'manual'"}), 400
         
-        # 更新风扇模式
-        fan_control['mode'] = mode
-        fan_control['last_control_time'] = time.time()
-        
-        # 在自动模式下，根据当前温度重新设置状态
-        if mode == 'auto':
-            cpu_temp = get_cpu_temperature()
-            if cpu_temp >= fan_control['target_temp']:
-                fan_control['is_running'] = True
-                fan_control['status'] = 'on'
-                fan_control['next_switch_time'] = None
-            else:
-                # 对于自动模式的循环，设置下次切换时间
-                current_time = time.time()
-                if fan_control['is_running']:
-                    fan_control['next_switch_time'] = current_time + fan_control['running_duration']
-                else:
-                    fan_control['next_switch_time'] = current_time + fan_control['stop_duration']
+        dispatch_fan_command('mode', mode)
         
         return jsonify({
             "success": True, 
@@ -1848,14 +2744,7 @@ def api_fan_status_control():
         if status not in ['on', 'off']:
             return jsonify({"success": False, "message": "无效的状态，仅支持 'on' 或 'off'"}), 400
         
-        # 更新风扇状态
-        fan_control['status'] = status
-        fan_control['is_running'] = (status == 'on')
-        fan_control['last_control_time'] = time.time()
-        
-        # 如果是手动模式，直接设置状态
-        if fan_control['mode'] == 'manual':
-            fan_control['is_running'] = (status == 'on')
+        dispatch_fan_command('status', status)
         
         return jsonify({
             "success": True, 
@@ -1889,10 +2778,7 @@ def api_fan_control_event():
         current_time = time.time()
         logger.info(f"外部风扇控制事件: {action}, 温度: {temperature}°C, 时间: {time.ctime(current_time)}")
         
-        # 更新内部状态以匹配外部控制
-        fan_control['is_running'] = (action == 'start')
-        fan_control['status'] = 'on' if action == 'start' else 'off'
-        fan_control['last_control_time'] = current_time
+        dispatch_fan_command('event', action)
         
         return jsonify({
             "success": True,
@@ -1966,13 +2852,16 @@ def handle_exception(e):
 
 
 
+# 按设计返回文件内容、压缩包或纯文本的API（出错时仍返回JSON）
+NON_JSON_API_PATHS = ('/api/files/download', '/api/files/archive', '/api/files/tail')
+
 # 添加一个中间件来确保API响应始终是JSON格式
 @app.after_request
 def after_request(response):
     # 如果请求路径以/api/开头，确保Content-Type是JSON
-    if request.path.startswith('/api/'):
-        # 如果响应不是JSON格式，记录警告
-        if not response.content_type.startswith('application/json'):
+    if request.path.startswith('/api/') and request.path not in NON_JSON_API_PATHS:
+        # 如果响应不是JSON格式（SSE事件流除外），记录警告
+        if not response.content_type.startswith(('application/json', 'text/event-stream')):
             logger.warning(f"API请求返回了非JSON格式: {request.path}, Content-Type: {response.content_type}")
             # 注意：这里不修改响应，因为可能已经发送了数据
     return response
@@ -1983,8 +2872,11 @@ if __name__ == '__main__':
     update_thread = threading.Thread(target=background_update, daemon=True)
     update_thread.start()
     
-    # 初始化一次系统信息
-    update_system_info()
+    # 启动指标数据库的批量写入线程
+    metrics_store.start()
+    
+    # 启动目录大小索引的后台维护线程
+    file_manager.size_index.start()
     
     # 启动Flask应用，使用9001端口（避免冲突）
     app.run(host='0.0.0.0', port=9001, debug=False, threaded=True)
\ No newline at end of file
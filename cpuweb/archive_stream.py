@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录打包下载模块
+边遍历目录树边生成 ZIP / tar.gz / tar.zst 数据流，不生成临时文件：
+- 遍历使用 tree_walker.walk，生成器被关闭（客户端断开）时取消尚未开始的扫描
+- 文件按 COPY_BLOCK 分块读取，每块压缩后立即产出，内存占用与文件大小无关
+  （ZIP 的中央目录需要记住每个条目，占用与文件数量成正比）
+- ZIP 输出不可回写，条目使用数据描述符记录大小和CRC；按 stat 得到的大小决定是否使用 ZIP64
+- 已压缩的文件类型（图片、音视频、压缩包等）不再压缩：ZIP 中以存储方式写入；
+  tar.gz / tar.zst 为这些文件结束当前的压缩成员，改用不压缩（gzip 级别0 / zstd 最快级别）的新成员，
+  解压工具会依次解压拼接在一起的多个成员
+- 符号链接作为链接本身打包，不跟随；设备文件、管道等特殊文件跳过
+- tar.zst 需要可选依赖 zstandard
+"""
+import os
+import stat
+import time
+import tarfile
+import zipfile
+import zlib
+import mimetypes
+import logging
+from typing import Iterator, List, Optional
+
+from tree_walker import walk, WalkCancelled, WalkProgress
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 格式 -> (MIME类型, 文件扩展名, 默认压缩级别, 最小级别, 最大级别)
+ARCHIVE_FORMATS = {
+    'zip': ('application/zip', '.zip', 6, 0, 9),
+    'tar.gz': ('application/gzip', '.tar.gz', 6, 0, 9),
+    'tar.zst': ('application/zstd', '.tar.zst', 3, 1, 19),
+}
+# 读取文件的块大小（字节）
+COPY_BLOCK = 1024 * 1024
+# zstd 写入已压缩文件时使用的级别（负数级别接近直接存储）
+ZSTD_STORE_LEVEL = -5
+# mimetypes 识别不出的已压缩文件扩展名
+COMPRESSED_EXTENSIONS = {
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.txz', '.zst', '.lz4', '.7z', '.rar', '.jar', '.apk', '.whl',
+    '.deb', '.rpm', '.docx', '.xlsx', '.pptx', '.odt', '.ods', '.epub', '.pdf', '.heic', '.webp', '.avif',
+    '.mkv', '.webm', '.flac', '.opus', '.ogg', '.m4a', '.mp4', '.mov', '.jpg', '.jpeg', '.png', '.gif',
+}
+# 虽然属于 image/ 等类型但压缩效果好的格式
+COMPRESSIBLE_TYPES = {'image/svg+xml', 'image/bmp', 'image/x-ms-bmp', 'image/tiff', 'audio/x-wav', 'audio/wav'}
+
+
+def is_compressed(name: str) -> bool:
+    """根据文件名判断内容是否已经压缩过（再压缩只会浪费CPU）"""
+    if os.path.splitext(name)[1].lower() in COMPRESSED_EXTENSIONS:
+        return True
+    mime, encoding = mimetypes.guess_type(name)
+    if encoding is not None:
+        return True
+    if mime is None or mime in COMPRESSIBLE_TYPES:
+        return False
+    return mime.split('/', 1)[0] in ('image', 'video', 'audio')
+
+
+def parse_level(fmt: str, value: Optional[str]) -> Optional[int]:
+    """
+    解析压缩级别
+    :return: 级别；未指定时返回该格式的默认级别，无效时返回 None
+    """
+    _, _, default, low, high = ARCHIVE_FORMATS[fmt]
+    if value is None or value == '':
+        return default
+    try:
+        level = int(value)
+    except ValueError:
+        return None
+    return level if low <= level <= high else None
+
+
+class _Output:
+    """收集写入的字节，由生成器定期取走"""
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        if data:
+            self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b''.join(self.parts)
+        self.parts.clear()
+        return data
+
+
+class _ZipArchive:
+    """流式 ZIP 写入"""
+
+    def __init__(self, out: _Output, level: int):
+        self.out = out
+        self.level = level
+        self.zip = zipfile.ZipFile(out, 'w', allowZip64=True)
+
+    @staticmethod
+    def _info(arcname: str, st: os.stat_result) -> zipfile.ZipInfo:
+        date_time = time.localtime(st.st_mtime)[:6]
+        # ZIP 只能表示 1980-2107 年的时间
+        if date_time[0] < 1980:
+            date_time = (1980, 1, 1, 0, 0, 0)
+        elif date_time[0] > 2107:
+            date_time = (2107, 12, 31, 23, 59, 59)
+        info = zipfile.ZipInfo(arcname, date_time)
+        info.external_attr = (st.st_mode & 0xFFFF) << 16
+        return info
+
+    def add_dir(self, arcname: str, st: os.stat_result):
+        info = self._info(arcname + '/', st)
+        info.external_attr |= 0x10
+        self.zip.writestr(info, b'')
+
+    def add_symlink(self, arcname: str, st: os.stat_result, target: str):
+        self.zip.writestr(self._info(arcname, st), os.fsencode(target))
+
+    def add_file(self, arcname: str, st: os.stat_result, f) -> Iterator[bytes]:
+        info = self._info(arcname, st)
+        info.file_size = st.st_size
+        if self.level == 0 or is_compressed(arcname):
+            info.compress_type = zipfile.ZIP_STORED
+        else:
+            info.compress_type = zipfile.ZIP_DEFLATED
+            # zipfile 按条目读取压缩级别（Python 3.13 起为公开属性 compress_level）
+            info._compresslevel = self.level
+        with self.zip.open(info, 'w') as dest:
+            remaining = st.st_size
+            while remaining > 0:
+                block = f.read(min(COPY_BLOCK, remaining))
+                if not block:
+                    break
+                remaining -= len(block)
+                dest.write(block)
+                yield self.out.take()
+
+    def finish(self):
+        self.zip.close()
+
+
+class _MemberCompressor:
+    """
+    gzip/zstd 多成员压缩流：写入已压缩的内容时结束当前成员，改用不压缩的新成员，之后的数据再切换回压缩的成员
+    """
+
+    def __init__(self, out: _Output, fmt: str, level: int):
+        self.out = out
+        self.fmt = fmt
+        self.level = level
+        self.store = None
+        self.compressor = None
+
+    def _new(self, store: bool):
+        if self.fmt == 'tar.gz':
+            # wbits=31 生成带 gzip 头和尾的成员
+            return zlib.compressobj(0 if store else self.level, zlib.DEFLATED, 31)
+        return zstandard.ZstdCompressor(level=ZSTD_STORE_LEVEL if store else self.level).compressobj()
+
+    def write(self, data: bytes, store: bool = False):
+        """
+        :param store: 是否不压缩（已压缩的文件内容）；与当前成员不同时结束当前成员并开始新成员
+        """
+        if self.level == 0:
+            store = True
+        if self.compressor is None or store != self.store:
+            if self.compressor is not None:
+                self.out.write(self.compressor.flush())
+            self.store = store
+            self.compressor = self._new(self.store)
+        self.out.write(self.compressor.compress(data))
+
+    def finish(self):
+        if self.compressor is not None:
+            self.out.write(self.compressor.flush())
+
+
+class _TarArchive:
+    """流式 tar 写入（PAX 格式，支持长文件名和超过8GB的文件），经 _MemberCompressor 压缩"""
+
+    def __init__(self, out: _Output, fmt: str, level: int):
+        self.out = out
+        self.stream = _MemberCompressor(out, fmt, level)
+        self.offset = 0
+
+    def _write(self, data: bytes, store: bool = False):
+        self.stream.write(data, store)
+        self.offset += len(data)
+
+    def _header(self, arcname: str, st: os.stat_result, type_: bytes, size: int = 0,
+                linkname: str = ''):
+        info = tarfile.TarInfo(arcname)
+        info.type = type_
+        info.mode = stat.S_IMODE(st.st_mode)
+        info.mtime = int(st.st_mtime)
+        info.uid = st.st_uid
+        info.gid = st.st_gid
+        info.size = size
+        info.linkname = linkname
+        self._write(info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape'))
+
+    def add_dir(self, arcname: str, st: os.stat_result):
+        self._header(arcname, st, tarfile.DIRTYPE)
+
+    def add_symlink(self, arcname: str, st: os.stat_result, target: str):
+        self._header(arcname, st, tarfile.SYMTYPE, linkname=target)
+
+    def add_file(self, arcname: str, st: os.stat_result, f) -> Iterator[bytes]:
+        # 只有已压缩文件的内容不压缩，头、补齐和结尾仍使用压缩的成员
+        store = is_compressed(arcname)
+        self._header(arcname, st, tarfile.REGTYPE, size=st.st_size)
+        remaining = st.st_size
+        while remaining > 0:
+            block = f.read(min(COPY_BLOCK, remaining))
+            if not block:
+                # 文件在打包期间变短：头中已经写入了大小，用0补齐
+                logger.warning(f"打包期间文件变短: {arcname}")
+                block = bytes(min(COPY_BLOCK, remaining))
+            remaining -= len(block)
+            self._write(block, store)
+            yield self.out.take()
+        padding = -st.st_size % tarfile.BLOCKSIZE
+        if padding:
+            self._write(bytes(padding))
+
+    def finish(self):
+        # 结尾两个空块，并补齐到记录大小
+        end = self.offset + 2 * tarfile.BLOCKSIZE
+        self._write(bytes(2 * tarfile.BLOCKSIZE + (-end % tarfile.RECORDSIZE)))
+        self.stream.finish()
+
+
+def _add_entry(archive, path: str, arcname: str, st: os.stat_result, cancel=None,
+               progress: Optional[WalkProgress] = None) -> Iterator[bytes]:
+    """打包单个条目；无法读取的文件记录日志后跳过"""
+    if cancel is not None and cancel.is_set():
+        raise WalkCancelled()
+    if stat.S_ISDIR(st.st_mode):
+        archive.add_dir(arcname, st)
+    elif stat.S_ISLNK(st.st_mode):
+        try:
+            archive.add_symlink(arcname, st, os.readlink(path))
+        except OSError as e:
+            logger.warning(f"打包时无法读取链接 {path}: {e}")
+    elif stat.S_ISREG(st.st_mode):
+        try:
+            f = open(path, 'rb')
+        except OSError as e:
+            logger.warning(f"打包时无法读取 {path}: {e}")
+            return
+        with f:
+            yield from archive.add_file(arcname, st, f)
+        if progress is not None:
+            progress.files += 1
+            progress.bytes += st.st_size
+            progress.current = path
+
+
+def stream_archive(roots: List[str], fmt: str, level: int, cancel=None,
+                   progress: Optional[WalkProgress] = None) -> Iterator[bytes]:
+    """
+    生成打包数据流
+    :param roots: 要打包的文件或目录（已校验的绝对路径），条目名相对于各自的父目录
+    :param fmt: 格式，ARCHIVE_FORMATS 的键
+    :param level: 压缩级别（parse_level 的结果）
+    :param cancel: 取消标志（打包到服务器的后台任务使用），被设置后抛出 WalkCancelled
+    :param progress: 进度对象，累加已打包的文件数和字节数
+    :return: 数据块生成器
+    """
+    out = _Output()
+    archive = _ZipArchive(out, level) if fmt == 'zip' else _TarArchive(out, fmt, level)
+    for root in roots:
+        try:
+            st = os.lstat(root)
+        except OSError as e:
+            logger.warning(f"打包时无法访问 {root}: {e}")
+            continue
+        base = os.path.dirname(root)
+        yield from _add_entry(archive, root, os.path.basename(root), st, cancel, progress)
+        if not stat.S_ISDIR(st.st_mode):
+            continue
+        walker = walk(root, need_stat=True, cancel=cancel)
+        try:
+            for dir_path, records, _ in walker:
+                prefix = os.path.relpath(dir_path, base)
+                for name, _, entry_st in sorted(records, key=lambda r: r[0]):
+                    if entry_st is None:
+                        continue
+                    yield from _add_entry(archive, os.path.join(dir_path, name), prefix + '/' + name, entry_st,
+                                          cancel, progress)
+                if progress is not None:
+                    progress.directories += 1
+                data = out.take()
+                if data:
+                    yield data
+        finally:
+            walker.close()
+    archive.finish()
+    yield out.take()
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分块断点续传上传模块
+协议：init 创建上传会话并在目标目录中创建临时文件 -> 按偏移量 PUT 分块 -> finalize 校验后原子改名为目标文件。
+
+- 分块请求体以 COPY_BLOCK 大小的块从请求流中读出并用 os.pwrite 直接写入临时文件，服务端内存占用与文件大小无关
+- 已接收的字节区间保存在会话文件中（UPLOAD_STATE_DIR，每个会话一个 JSON 文件，flock 加锁），
+  多个工作进程可以并行接收同一个上传的不同分块，服务重启后仍可查询进度并继续上传
+- 分块中途断开时已写入的部分同样计入已接收区间（带校验和的分块除外），客户端只需补传缺失的区间
+- 临时文件与目标文件位于同一目录，finalize 时 fsync 后改名，目标路径上不会出现不完整的文件
+- 超过 UPLOAD_EXPIRE 秒没有活动的会话在下次创建会话时清理
+- 大量小文件通过批量接口在一个请求中上传（store_file），每个文件同样先写临时文件再改名
+"""
+import os
+import re
+import json
+import time
+import fcntl
+import errno
+import shutil
+import hashlib
+import secrets
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 上传会话文件目录
+UPLOAD_STATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'upload_sessions')
+# 建议的分块大小和单个分块请求的上限（字节）
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+# 从请求流读取并写入文件的块大小（字节）
+COPY_BLOCK = 1024 * 1024
+# 会话在没有活动多久后过期（秒）
+UPLOAD_EXPIRE = 24 * 3600
+# 批量上传单个请求最多包含的文件数和请求体大小（字节）
+MAX_BATCH_FILES = 500
+MAX_BATCH_BYTES = 32 * 1024 * 1024
+# 临时文件名前缀和后缀
+TEMP_PREFIX = '.upload-'
+TEMP_SUFFIX = '.part'
+
+_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+def _merge(ranges: List[List[int]], start: int, end: int) -> List[List[int]]:
+    """把 [start, end) 合并到有序且不重叠的区间列表中"""
+    merged = []
+    for s, e in ranges:
+        if e < start or s > end:
+            merged.append([s, e])
+        else:
+            start, end = min(s, start), max(e, end)
+    merged.append([start, end])
+    merged.sort()
+    return merged
+
+
+def _missing(ranges: List[List[int]], size: int) -> List[List[int]]:
+    """尚未接收的区间"""
+    missing, position = [], 0
+    for s, e in ranges:
+        if s > position:
+            missing.append([position, s])
+        position = max(position, e)
+    if position < size:
+        missing.append([position, size])
+    return missing
+
+
+def fsync_dir(path: str):
+    """fsync 目录，使其中的改名、创建持久化"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    except OSError:
+        # 部分文件系统不支持对目录 fsync
+        pass
+    finally:
+        os.close(fd)
+
+
+def commit_file(temp_path: str, target_path: str, overwrite: bool) -> bool:
+    """
+    把同一目录中写好的临时文件原子地改名为目标文件
+    :return: 目标文件已存在且不允许覆盖时返回 False（临时文件保留）
+    """
+    if overwrite:
+        os.replace(temp_path, target_path)
+        return True
+    try:
+        # 硬链接在目标已存在时失败，不会覆盖其他请求同时创建的文件
+        os.link(temp_path, target_path)
+    except FileExistsError:
+        return False
+    except OSError as e:
+        if e.errno not in (errno.EPERM, errno.ENOTSUP, errno.EOPNOTSUPP, errno.EMLINK):
+            raise
+        # 文件系统不支持硬链接（例如 FAT/exFAT），退化为先检查再改名
+        if os.path.exists(target_path):
+            return False
+        os.rename(temp_path, target_path)
+        return True
+    os.unlink(temp_path)
+    return True
+
+
+def store_file(stream: BinaryIO, target_path: str, overwrite: bool) -> bool:
+    """
+    把一个小文件的内容写入目标目录中的临时文件，再原子改名为目标文件（批量上传使用）
+    :param stream: 文件内容流
+    :param target_path: 目标文件路径
+    :param overwrite: 目标文件已存在时是否覆盖
+    :return: 目标文件已存在且不允许覆盖时返回 False
+    """
+    temp_path = os.path.join(os.path.dirname(target_path), f"{TEMP_PREFIX}{secrets.token_hex(16)}{TEMP_SUFFIX}")
+    try:
+        with open(temp_path, 'xb') as f:
+            shutil.copyfileobj(stream, f, COPY_BLOCK)
+        stored = commit_file(temp_path, target_path, overwrite)
+    finally:
+        # 改名成功后临时文件已不存在；失败或目标已存在时删除
+        try:
+            os.unlink(temp_path)
+        except FileNotFoundError:
+            pass
+    return stored
+
+
+class UploadSessions:
+    def __init__(self, base_path: str, state_dir: str = UPLOAD_STATE_DIR):
+        """
+        初始化上传会话管理
+        :param base_path: 文件管理器的基础路径（已解析的绝对路径），会话中的目标目录相对于它保存
+        :param state_dir: 会话文件目录
+        """
+        self.base_path = str(base_path)
+        self.state_dir = state_dir
+
+    def _state_path(self, upload_id: str) -> str:
+        return os.path.join(self.state_dir, upload_id + '.json')
+
+    def _temp_path(self, meta: Dict) -> str:
+        return os.path.join(self.base_path, meta['path'], meta['temp'])
+
+    def _target_path(self, meta: Dict) -> str:
+        return os.path.join(self.base_path, meta['path'], meta['filename'])
+
+    @contextmanager
+    def _session(self, upload_id: str, exclusive: bool = False):
+        """
+        打开并锁定会话文件
+        :return: (会话文件, 会话数据)，会话不存在时为 (None, None)
+        """
+        if not _ID_PATTERN.match(upload_id or ''):
+            yield None, None
+            return
+        try:
+            f = open(self._state_path(upload_id), 'r+', encoding='utf-8')
+        except FileNotFoundError:
+            yield None, None
+            return
+        with f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                meta = json.load(f)
+            except ValueError:
+                # 会话已被删除（文件被清空）或损坏
+                meta = None
+            yield f, meta
+
+    @staticmethod
+    def _save(f, meta: Dict):
+        meta['updated'] = time.time()
+        f.seek(0)
+        f.truncate()
+        json.dump(meta, f)
+        f.flush()
+
+    def _remove(self, f, meta: Dict):
+        """删除会话和临时文件（持有排他锁）；清空会话文件，已经打开它并在等待锁的请求会读到空内容"""
+        for path in (self._temp_path(meta), self._state_path(meta['id'])):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        f.seek(0)
+        f.truncate()
+
+    def _describe(self, meta: Dict) -> Dict:
+        received = sum(e - s for s, e in meta['received'])
+        return {
+            "success": True,
+            "upload_id": meta['id'],
+            "path": meta['path'],
+            "filename": meta['filename'],
+            "size": meta['size'],
+            "chunk_size": meta['chunk_size'],
+            "received_bytes": received,
+            "received": meta['received'],
+            "missing": _missing(meta['received'], meta['size']),
+            "complete": received == meta['size']
+        }
+
+    def expire(self):
+        """清理过期的会话和临时文件"""
+        try:
+            names = os.listdir(self.state_dir)
+        except FileNotFoundError:
+            return
+        deadline = time.time() - UPLOAD_EXPIRE
+        for name in names:
+            upload_id = name[:-len('.json')]
+            with self._session(upload_id, exclusive=True) as (f, meta):
+                if meta is not None and meta['updated'] < deadline:
+                    logger.info(f"清理过期的上传会话: {upload_id} ({meta['filename']})")
+                    self._remove(f, meta)
+
+    def create(self, target_dir: Path, filename: str, size: int, chunk_size: int = DEFAULT_CHUNK_SIZE,
+               overwrite: bool = False) -> Dict:
+        """
+        创建上传会话和临时文件
+        :param target_dir: 目标目录（已校验的绝对路径）
+        :param filename: 目标文件名（已校验）
+        :param size: 文件总大小（字节）
+        :param chunk_size: 建议的分块大小（字节）
+        :param overwrite: 目标文件已存在时是否覆盖
+        :return: 会话状态
+        """
+        target = target_dir / filename
+        if target.exists() and not overwrite:
+            return {"success": False, "message": "文件已存在", "status": 409}
+        if target.is_dir():
+            return {"success": False, "message": "目标路径是一个目录", "status": 409}
+        free = shutil.disk_usage(str(target_dir)).free
+        if size > free:
+            return {"success": False, "message": f"磁盘空间不足（剩余 {free} 字节）", "status": 507}
+
+        os.makedirs(self.state_dir, exist_ok=True)
+        self.expire()
+        upload_id = secrets.token_hex(16)
+        meta = {
+            'id': upload_id,
+            'path': os.path.relpath(str(target_dir), self.base_path) if str(target_dir) != self.base_path else '',
+            'filename': filename,
+            'temp': f"{TEMP_PREFIX}{upload_id}{TEMP_SUFFIX}",
+            'size': size,
+            'chunk_size': min(max(chunk_size, COPY_BLOCK), MAX_CHUNK_SIZE),
+            'overwrite': overwrite,
+            'received': [],
+            'created': time.time(),
+            'updated': time.time()
+        }
+        fd = os.open(self._temp_path(meta), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            # 预先设置为最终大小（稀疏文件），任意偏移量的分块都可以直接写入
+            os.ftruncate(fd, size)
+        finally:
+            os.close(fd)
+        with open(self._state_path(upload_id), 'x', encoding='utf-8') as f:
+            json.dump(meta, f)
+        logger.info(f"创建上传会话 {upload_id}: {meta['path']}/{filename} ({size} 字节)")
+        return self._describe(meta)
+
+    def status(self, upload_id: str) -> Dict:
+        """查询上传进度（已接收和缺失的字节区间）"""
+        with self._session(upload_id) as (_, meta):
+            if meta is None:
+                return {"success": False, "message": "上传会话不存在或已过期", "status": 404}
+            return self._describe(meta)
+
+    def write_chunk(self, upload_id: str, offset: int, length: Optional[int], stream: BinaryIO,
+                    checksum: Optional[str] = None) -> Dict:
+        """
+        把请求体写入临时文件的指定偏移量
+        :param upload_id: 会话ID
+        :param offset: 分块在文件中的偏移量
+        :param length: 请求体长度（Content-Length）
+        :param stream: 请求体流
+        :param checksum: 分块的 SHA-256（十六进制），提供时校验通过才计入已接收区间
+        :return: 写入后的会话状态
+        """
+        if length is None:
+            return {"success": False, "message": "缺少 Content-Length", "status": 411}
+        if length > MAX_CHUNK_SIZE:
+            return {"success": False, "message": f"分块不能超过 {MAX_CHUNK_SIZE} 字节", "status": 413}
+        with self._session(upload_id) as (_, meta):
+            if meta is None:
+                return {"success": False, "message": "上传会话不存在或已过期", "status": 404}
+        if offset < 0 or offset + length > meta['size']:
+            return {"success": False, "message": "分块超出文件范围", "status": 416}
+
+        try:
+            fd = os.open(self._temp_path(meta), os.O_WRONLY)
+        except FileNotFoundError:
+            self.abort(upload_id)
+            return {"success": False, "message": "临时文件已被删除，请重新上传", "status": 410}
+        digest = hashlib.sha256() if checksum else None
+        written = 0
+        try:
+            while written < length:
+                data = stream.read(min(COPY_BLOCK, length - written))
+                if not data:
+                    break
+                if digest is not None:
+                    digest.update(data)
+                view = memoryview(data)
+                while view:
+                    count = os.pwrite(fd, view, offset + written)
+                    written += count
+                    view = view[count:]
+        finally:
+            os.close(fd)
+
+        if digest is not None and (written < length or digest.hexdigest() != checksum.lower()):
+            return {"success": False, "message": "分块数据不完整或校验和不匹配", "status": 422}
+        with self._session(upload_id, exclusive=True) as (f, meta):
+            if meta is None:
+                return {"success": False, "message": "上传会话已被取消", "status": 404}
+            if written:
+                meta['received'] = _merge(meta['received'], offset, offset + written)
+                self._save(f, meta)
+            result = self._describe(meta)
+        if written < length:
+            # 连接中断：已写入的部分保留，客户端根据 missing 补传
+            result.update(success=False, message="分块数据不完整", status=400)
+        return result
+
+    def finalize(self, upload_id: str, sha256: Optional[str] = None) -> Dict:
+        """
+        完成上传：校验整个文件后 fsync 并原子改名为目标文件
+        :param upload_id: 会话ID
+        :param sha256: 整个文件的 SHA-256（十六进制），提供时校验
+        :return: 结果，成功时包含目标文件的相对路径
+        """
+        with self._session(upload_id, exclusive=True) as (f, meta):
+            if meta is None:
+                return {"success": False, "message": "上传会话不存在或已过期", "status": 404}
+            described = self._describe(meta)
+            if not described['complete']:
+                return {**described, "success": False, "message": "文件尚未上传完整", "status": 409}
+            temp_path, target_path = self._temp_path(meta), self._target_path(meta)
+            try:
+                temp = open(temp_path, 'rb')
+            except FileNotFoundError:
+                self._remove(f, meta)
+                return {"success": False, "message": "临时文件已被删除，请重新上传", "status": 410}
+
+            with temp:
+                if sha256:
+                    digest = hashlib.sha256()
+                    for block in iter(lambda: temp.read(COPY_BLOCK), b''):
+                        digest.update(block)
+                    if digest.hexdigest() != sha256.lower():
+                        # 无法确定哪个分块出错，清空已接收区间，客户端需要重新上传全部分块
+                        meta['received'] = []
+                        self._save(f, meta)
+                        return {"success": False, "message": "文件校验和不匹配，请重新上传", "status": 422}
+                os.fsync(temp.fileno())
+
+            if not commit_file(temp_path, target_path, meta['overwrite']):
+                return {"success": False, "message": "文件已存在", "status": 409}
+            fsync_dir(os.path.dirname(target_path))
+            self._remove(f, meta)
+        logger.info(f"上传完成 {upload_id}: {meta['path']}/{meta['filename']}")
+        return {
+            "success": True,
+            "message": "文件上传成功",
+            "path": os.path.join(meta['path'], meta['filename']) if meta['path'] else meta['filename'],
+            "size": meta['size']
+        }
+
+    def abort(self, upload_id: str) -> Dict:
+        """取消上传，删除临时文件和会话"""
+        with self._session(upload_id, exclusive=True) as (f, meta):
+            if meta is None:
+                return {"success": False, "message": "上传会话不存在或已过期", "status": 404}
+            self._remove(f, meta)
+        return {"success": True, "message": "上传已取消"}
@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件内容搜索索引模块
+对 base_path 下的文本文件（扩展名与文件预览一致，且不超过文件大小上限）建立 SQLite FTS5 trigram 倒排索引，
+搜索结果逐个产生，调用方以流的形式返回 (文件, 行号, 片段)。
+
+- 作为目录大小索引的监听器：扫描结果只用于维护文件清单（content_files），按大小和 mtime 判断文件是否需要重新索引
+- 文件内容由独立的后台线程按批读取和写入，每批的文件数和字节数都有上限；
+  索引状态逐文件持久化在数据库中，重启或重建后从尚未完成的文件继续
+- 查询在一个读事务中完成：已索引的文件由倒排索引筛选候选后在存储的正文中定位行号；
+  尚未索引（新建或已修改）的文件在进程池中直接扫描；索引尚未覆盖的目录整体扫描
+- 倒排索引使用 detail=none 以减小体积，候选结果总会被逐行校验
+"""
+import os
+import re
+import stat
+import time
+import sqlite3
+import threading
+import itertools
+import multiprocessing
+import logging
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from tree_walker import walk
+from text_preview import detect_encoding, SAMPLE_BYTES
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 索引版本，分词或表结构变化时递增，启动时发现版本不同会重建正文索引
+CONTENT_INDEX_VERSION = '1'
+# 文件清单的变化缓冲条数上限和最长缓冲时间（秒）
+FLUSH_ROWS = 50000
+FLUSH_DELAY = 10.0
+# 后台索引每批最多读取的文件数和字节数（决定索引线程的内存占用）
+INDEX_BATCH_FILES = 200
+INDEX_BATCH_BYTES = 16 * 1024 * 1024
+# 没有待索引文件时的检查间隔（秒）
+INDEX_IDLE = 2.0
+# 索引线程等待数据库写锁的时间（秒）
+INDEX_BUSY_TIMEOUT = 30.0
+# 三元组索引要求的最短查询长度，更短的查询逐个校验所有已索引文件
+MIN_TRIGRAM = 3
+# 每次从数据库取出的候选文件数
+CANDIDATE_BATCH = 500
+# 扫描进程数、每个任务的文件数
+GREP_WORKERS = min(4, os.cpu_count() or 1)
+GREP_CHUNK_FILES = 32
+# 单个文件最多返回的匹配行数
+MAX_FILE_MATCHES = 100
+# 单次搜索最多返回的匹配行数
+MAX_CONTENT_RESULTS = 1000
+# 片段的最大字符数
+SNIPPET_CHARS = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS content_files (
+    id INTEGER PRIMARY KEY,
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    indexed_ns INTEGER
+);
+CREATE UNIQUE INDEX IF NOT EXISTS content_files_dir ON content_files (dir, name);
+CREATE INDEX IF NOT EXISTS content_files_pending ON content_files (id) WHERE indexed_ns IS NOT mtime_ns;
+"""
+
+FTS_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS content_fts USING fts5(body, tokenize='trigram', detail='none')"
+
+_SUBTREE = '(f.dir = ? OR (f.dir > ? AND f.dir < ?))'
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def decode_text(data: bytes) -> Optional[str]:
+    """
+    解码文本文件内容，编码检测与文件预览相同（text_preview.detect_encoding），同一文件的搜索结果和预览一致
+    :param data: 文件内容
+    :return: 文本，二进制文件返回 None
+    """
+    encoding = detect_encoding(data[:SAMPLE_BYTES], at_eof=len(data) <= SAMPLE_BYTES)
+    if encoding is None:
+        return None
+    return data.decode(encoding, errors='replace')
+
+
+def _snippet(line: str, column: int, length: int) -> str:
+    line = line.rstrip('\r')
+    if len(line) <= SNIPPET_CHARS:
+        return line.strip()
+    start = max(0, min(column - (SNIPPET_CHARS - length) // 2, len(line) - SNIPPET_CHARS))
+    text = line[start:start + SNIPPET_CHARS]
+    return ('…' if start > 0 else '') + text + ('…' if start + SNIPPET_CHARS < len(line) else '')
+
+
+def find_matches(text: str, needle: str, max_hits: int = MAX_FILE_MATCHES) -> List[Tuple[int, int, str]]:
+    """
+    逐行查找（不区分大小写），每行只报告第一处匹配
+    :param text: 文件内容
+    :param needle: 已转为小写的查询字符串
+    :param max_hits: 最多返回的行数
+    :return: [(行号, 列号, 片段)]，行号和列号从1开始
+    """
+    lowered = text.lower()
+    pos = lowered.find(needle)
+    if pos < 0:
+        return []
+    hits = []
+    if len(lowered) != len(text):
+        # 个别字符转小写后长度变化，偏移量不能直接对应原文，逐行处理
+        for number, line in enumerate(text.split('\n'), 1):
+            column = line.lower().find(needle)
+            if column >= 0:
+                hits.append((number, column + 1, _snippet(line, column, len(needle))))
+                if len(hits) >= max_hits:
+                    break
+        return hits
+    number, counted = 1, 0
+    while pos >= 0 and len(hits) < max_hits:
+        number += lowered.count('\n', counted, pos)
+        counted = pos
+        start = lowered.rfind('\n', 0, pos) + 1
+        end = lowered.find('\n', pos)
+        if end < 0:
+            end = len(lowered)
+        hits.append((number, pos - start + 1, _snippet(text[start:end], pos - start, len(needle))))
+        pos = lowered.find(needle, end)
+    return hits
+
+
+def grep_files(paths: List[str], needle: str, max_size: int, max_hits: int) -> List[Tuple[str, List[tuple]]]:
+    """
+    在扫描进程中执行：读取并逐行查找一组文件
+    :param paths: 文件绝对路径列表
+    :param needle: 已转为小写的查询字符串
+    :param max_size: 文件大小上限（字节），超过的文件跳过
+    :param max_hits: 单个文件最多返回的行数
+    :return: [(文件路径, [(行号, 列号, 片段)])]，只包含有匹配的文件
+    """
+    results = []
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                data = f.read(max_size + 1)
+        except OSError:
+            continue
+        if len(data) > max_size:
+            continue
+        text = decode_text(data)
+        if text is None:
+            continue
+        hits = find_matches(text, needle, max_hits)
+        if hits:
+            results.append((path, hits))
+    return results
+
+
+def grep_pool() -> ProcessPoolExecutor:
+    """
+    获取当前进程的扫描进程池（延迟创建）
+    使用 forkserver 启动子进程：不从多线程的工作进程直接 fork，子进程只预先导入本模块
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload([__name__])
+            _pool = ProcessPoolExecutor(max_workers=GREP_WORKERS, mp_context=context)
+        return _pool
+
+
+class ContentIndex:
+    def __init__(self, base_path: str, db_path: str, extensions: Iterable[str], max_file_size: int):
+        """
+        初始化文件内容索引（由 DirectorySizeIndex.add_listener 注册后才会被维护）
+        :param base_path: 索引的根目录（已解析的绝对路径）
+        :param db_path: 与目录大小索引共用的 SQLite 数据库文件路径
+        :param extensions: 作为文本文件索引的扩展名（小写，含点）
+        :param max_file_size: 文件大小上限（字节），超过的文件不索引也不扫描
+        """
+        self.base_path = str(base_path)
+        self.db_path = db_path
+        self.extensions = frozenset(extensions)
+        self.max_file_size = max_file_size
+        self.enabled = False
+        self._scans: Dict[str, List[tuple]] = {}
+        self._removed: set = set()
+        self._rows = 0
+        self._since = 0.0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def is_text_file(self, name: str, st: os.stat_result) -> bool:
+        """是否为需要索引的文本文件（不跟随符号链接）"""
+        return (stat.S_ISREG(st.st_mode) and st.st_size <= self.max_file_size
+                and os.path.splitext(name)[1].lower() in self.extensions)
+
+    # ---- 目录大小索引的监听器接口（在索引维护线程中调用） ----
+
+    def setup(self, conn: sqlite3.Connection):
+        """创建表结构；索引版本变化时清空正文索引，所有文件重新索引"""
+        conn.executescript(SCHEMA)
+        row = conn.execute("SELECT value FROM meta WHERE key = 'content_index_version'").fetchone()
+        rebuild = row is None or row[0] != CONTENT_INDEX_VERSION
+        try:
+            if rebuild:
+                conn.execute('DROP TABLE IF EXISTS content_fts')
+            conn.execute(FTS_SCHEMA)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite 不支持 FTS5 trigram，文件内容搜索将直接扫描文件: {e}")
+            return
+        if rebuild:
+            with conn:
+                conn.execute('UPDATE content_files SET indexed_ns = NULL')
+                conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                             ('content_index_version', CONTENT_INDEX_VERSION))
+        self.enabled = True
+
+    def start(self):
+        """启动后台索引线程"""
+        if self.enabled and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='content-index', daemon=True)
+            self._thread.start()
+
+    def close(self):
+        """停止后台索引线程（当前批次完成后退出）"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=5)
+
+    def scanned(self, rel_dir: str, records: List[tuple]):
+        """
+        目录完成一次单层扫描
+        :param rel_dir: 相对 base_path 的目录路径
+        :param records: [(名称, 是否目录, stat结果)]
+        """
+        files = [(name, st.st_size, st.st_mtime_ns) for name, is_dir, st in records
+                 if not is_dir and self.is_text_file(name, st)]
+        with self._lock:
+            old = self._scans.get(rel_dir)
+            self._rows += len(files) - (len(old) if old is not None else 0)
+            self._scans[rel_dir] = files
+            if not self._since:
+                self._since = time.monotonic()
+
+    def removed(self, rel_dir: str):
+        """目录及其子树已被删除"""
+        with self._lock:
+            prefix = rel_dir + '/'
+            for key in [k for k in self._scans if not rel_dir or k == rel_dir or k.startswith(prefix)]:
+                self._rows -= len(self._scans.pop(key))
+            self._removed.add(rel_dir)
+            if not self._since:
+                self._since = time.monotonic()
+
+    def pending(self) -> bool:
+        """是否有待写入的变化"""
+        return bool(self._scans or self._removed)
+
+    def wants_flush(self) -> bool:
+        """缓冲的变化是否需要提前写入"""
+        return self._rows >= FLUSH_ROWS or bool(self._since and time.monotonic() - self._since >= FLUSH_DELAY)
+
+    def write(self, conn: sqlite3.Connection):
+        """在目录大小索引的写入事务中更新文件清单，新增或变化的文件交给后台索引线程"""
+        with self._lock:
+            scans, self._scans = self._scans, {}
+            removed, self._removed = self._removed, set()
+            self._rows = 0
+            self._since = 0.0
+        for rel_dir in removed:
+            if rel_dir:
+                params = (rel_dir, rel_dir + '/', rel_dir + '0')
+                if self.enabled:
+                    conn.execute(f'DELETE FROM content_fts WHERE rowid IN '
+                                 f'(SELECT f.id FROM content_files f WHERE {_SUBTREE})', params)
+                conn.execute(f'DELETE FROM content_files AS f WHERE {_SUBTREE}', params)
+            else:
+                if self.enabled:
+                    conn.execute('DELETE FROM content_fts')
+                conn.execute('DELETE FROM content_files')
+        inserts, updates, deletes = [], [], []
+        for rel_dir, files in scans.items():
+            existing = {name: (file_id, size, mtime_ns) for file_id, name, size, mtime_ns in conn.execute(
+                'SELECT id, name, size, mtime_ns FROM content_files WHERE dir = ?', (rel_dir,))}
+            for name, size, mtime_ns in files:
+                old = existing.pop(name, None)
+                if old is None:
+                    inserts.append((rel_dir, name, size, mtime_ns))
+                elif old[1:] != (size, mtime_ns):
+                    updates.append((size, mtime_ns, old[0]))
+            deletes.extend((file_id,) for file_id, _, _ in existing.values())
+        if self.enabled:
+            conn.executemany('DELETE FROM content_fts WHERE rowid = ?', deletes)
+        conn.executemany('DELETE FROM content_files WHERE id = ?', deletes)
+        conn.executemany('UPDATE content_files SET size = ?, mtime_ns = ? WHERE id = ?', updates)
+        conn.executemany('INSERT INTO content_files (dir, name, size, mtime_ns) VALUES (?, ?, ?, ?)', inserts)
+        if inserts or updates:
+            self._wake.set()
+
+    # ---- 后台索引 ----
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=INDEX_BUSY_TIMEOUT)
+        try:
+            while not self._stop.is_set():
+                try:
+                    indexed = self._index_batch(conn)
+                except (sqlite3.Error, OSError) as e:
+                    logger.error(f"索引文件内容失败: {e}")
+                    indexed = 0
+                if not indexed:
+                    self._wake.wait(INDEX_IDLE)
+                    self._wake.clear()
+        finally:
+            conn.close()
+
+    def _index_batch(self, conn: sqlite3.Connection) -> int:
+        """
+        读取并索引一批待索引的文件（按 id 顺序，中断后从剩余的文件继续）
+        :return: 本批处理的文件数
+        """
+        rows = conn.execute('SELECT id, dir, name, mtime_ns FROM content_files WHERE indexed_ns IS NOT mtime_ns '
+                            'ORDER BY id LIMIT ?', (INDEX_BATCH_FILES,)).fetchall()
+        docs = []
+        total = 0
+        for file_id, rel_dir, name, mtime_ns in rows:
+            if self._stop.is_set():
+                break
+            full_path = os.path.join(self.base_path, rel_dir, name)
+            try:
+                with open(full_path, 'rb') as f:
+                    data = f.read(self.max_file_size + 1)
+            except OSError:
+                # 已被删除或无权限读取，按空文件索引，文件清单会在目录重扫时更新
+                data = b''
+            # 超过大小上限（索引之后增长）或二进制内容只记录状态，不写入正文
+            text = decode_text(data) if len(data) <= self.max_file_size else None
+            docs.append((file_id, mtime_ns, text or ''))
+            total += len(data)
+            if total >= INDEX_BATCH_BYTES:
+                break
+        if not docs:
+            return 0
+        with conn:
+            for file_id, mtime_ns, text in docs:
+                # 读取期间文件已从清单中删除时不写入正文
+                if conn.execute('UPDATE content_files SET indexed_ns = ? WHERE id = ?', (mtime_ns, file_id)).rowcount:
+                    conn.execute('DELETE FROM content_fts WHERE rowid = ?', (file_id,))
+                    conn.execute('INSERT INTO content_fts (rowid, body) VALUES (?, ?)', (file_id, text))
+        return len(docs)
+
+    def status(self) -> Dict:
+        """获取索引进度"""
+        if not os.path.exists(self.db_path):
+            return {"files": 0, "pending": 0}
+        conn = sqlite3.connect(self.db_path)
+        try:
+            files = conn.execute('SELECT count(*) FROM content_files').fetchone()[0]
+            pending = conn.execute('SELECT count(*) FROM content_files WHERE indexed_ns IS NOT mtime_ns').fetchone()[0]
+            return {"files": files, "pending": pending}
+        except sqlite3.OperationalError:
+            return {"files": 0, "pending": 0}
+        finally:
+            conn.close()
+
+    # ---- 查询 ----
+
+    def search(self, q: str, path: str = '', limit: int = 200, scan_all: bool = False) -> Iterator[Tuple[str, Dict]]:
+        """
+        搜索文件内容（不区分大小写的子串匹配），边查找边产生结果
+        :param q: 查询字符串
+        :param path: 只搜索该目录（相对 base_path）下的文件
+        :param limit: 最多返回的匹配行数
+        :param scan_all: 不使用索引，直接扫描目录下的所有文本文件（索引尚未覆盖该目录时）
+        :return: 生成 ('match', {file, line, column, snippet, source}) 事件，最后是 ('done', 统计信息)
+        """
+        started = time.time()
+        needle = q.lower()
+        summary = {"matches": 0, "files": 0, "indexed_files": 0, "scanned_files": 0, "truncated": False}
+
+        def emit(rel_path: str, hits: List[tuple], source: str) -> Iterator[Tuple[str, Dict]]:
+            summary["files"] += 1
+            for line, column, snippet in hits[:limit - summary["matches"]]:
+                summary["matches"] += 1
+                yield 'match', {"file": rel_path, "line": line, "column": column, "snippet": snippet, "source": source}
+            if summary["matches"] >= limit:
+                summary["truncated"] = True
+
+        conn = None
+        if not scan_all and os.path.exists(self.db_path):
+            conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            if conn is not None:
+                try:
+                    # 两个阶段在同一个读事务（快照）中完成，文件不会同时出现在已索引和未索引的结果中
+                    conn.execute('BEGIN')
+                    for rel_path, hits in self._search_indexed(conn, q, needle, path, summary):
+                        yield from emit(rel_path, hits, 'index')
+                        if summary["truncated"]:
+                            break
+                    files = self._pending_files(conn, path)
+                except sqlite3.OperationalError as e:
+                    # 维护线程尚未创建表
+                    logger.warning(f"读取文件内容索引失败: {e}")
+                    files = self._walk_files(path)
+            else:
+                files = self._walk_files(path)
+            if not summary["truncated"]:
+                for rel_path, hits in self._grep(files, needle, summary):
+                    yield from emit(rel_path, hits, 'scan')
+                    if summary["truncated"]:
+                        break
+        finally:
+            if conn is not None:
+                conn.close()
+        summary["elapsed"] = round(time.time() - started, 3)
+        yield 'done', summary
+
+    def _search_indexed(self, conn: sqlite3.Connection, q: str, needle: str, path: str,
+                        summary: Dict) -> Iterator[Tuple[str, List[tuple]]]:
+        """已索引且未变化的文件：倒排索引筛选候选，再在存储的正文中逐行校验"""
+        if not self.enabled and conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'content_fts'").fetchone() is None:
+            return
+        conditions, params = ['f.indexed_ns = f.mtime_ns'], []
+        if path:
+            conditions.append(_SUBTREE)
+            params.extend((path, path + '/', path + '0'))
+        # LIKE 带 ESCAPE 时 FTS5 不使用索引：只用查询中不含通配符的最长片段筛选候选（结果是超集，随后逐行校验）
+        literal = max(re.split('[%_]', q), key=len)
+        if len(literal) >= MIN_TRIGRAM:
+            sql = ("SELECT c.rowid, f.dir, f.name FROM content_fts c JOIN content_files f ON f.id = c.rowid "
+                   "WHERE c.body LIKE ? AND c.rowid > ? AND ")
+            head = [f'%{literal}%']
+        else:
+            sql = 'SELECT f.id, f.dir, f.name FROM content_files f WHERE f.id > ? AND '
+            head = []
+        sql += ' AND '.join(conditions) + ' ORDER BY 1 LIMIT ?'
+        last_id = 0
+        while True:
+            rows = conn.execute(sql, head + [last_id] + params + [CANDIDATE_BATCH]).fetchall()
+            for file_id, rel_dir, name in rows:
+                # 每次只取出一个文件的正文，内存占用不超过单个文件大小上限
+                body = conn.execute('SELECT body FROM content_fts WHERE rowid = ?', (file_id,)).fetchone()
+                summary["indexed_files"] += 1
+                hits = find_matches(body[0], needle) if body else []
+                if hits:
+                    yield (f"{rel_dir}/{name}" if rel_dir else name), hits
+            if len(rows) < CANDIDATE_BATCH:
+                return
+            last_id = rows[-1][0]
+
+    def _pending_files(self, conn: sqlite3.Connection, path: str) -> Iterator[str]:
+        """清单中尚未索引或索引后已变化的文件"""
+        sql = 'SELECT f.id, f.dir, f.name FROM content_files f WHERE f.indexed_ns IS NOT f.mtime_ns AND f.id > ?'
+        params: list = [0]
+        if path:
+            sql += ' AND ' + _SUBTREE
+            params.extend((path, path + '/', path + '0'))
+        sql += ' ORDER BY f.id LIMIT ?'
+        while True:
+            rows = conn.execute(sql, params + [CANDIDATE_BATCH]).fetchall()
+            for _, rel_dir, name in rows:
+                yield f"{rel_dir}/{name}" if rel_dir else name
+            if len(rows) < CANDIDATE_BATCH:
+                return
+            params[0] = rows[-1][0]
+
+    def _walk_files(self, path: str) -> Iterator[str]:
+        """遍历目录树中的所有文本文件"""
+        root = os.path.join(self.base_path, path) if path else self.base_path
+        for dir_path, records, _ in walk(root, need_stat=True):
+            rel_dir = os.path.relpath(dir_path, self.base_path)
+            for name, is_dir, st in records:
+                if not is_dir and self.is_text_file(name, st):
+                    yield name if rel_dir == '.' else f"{rel_dir}/{name}"
+
+    def _grep(self, files: Iterator[str], needle: str, summary: Dict) -> Iterator[Tuple[str, List[tuple]]]:
+        """在扫描进程池中并行查找，按完成顺序产生结果；生成器被关闭时取消尚未开始的任务"""
+        pool = grep_pool()
+        in_flight = set()
+        try:
+            while True:
+                while len(in_flight) < GREP_WORKERS * 2:
+                    chunk = list(itertools.islice(files, GREP_CHUNK_FILES))
+                    if not chunk:
+                        break
+                    summary["scanned_files"] += len(chunk)
+                    in_flight.add(pool.submit(grep_files, [os.path.join(self.base_path, p) for p in chunk],
+                                              needle, self.max_file_size, MAX_FILE_MATCHES))
+                if not in_flight:
+                    return
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for full_path, hits in future.result():
+                        yield os.path.relpath(full_path, self.base_path), hits
+        finally:
+            for future in in_flight:
+                future.cancel()
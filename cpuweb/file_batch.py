@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量文件操作模块
+一个请求按顺序执行多个操作（delete、rename、mkdir、move、chmod），返回与操作一一对应的结果数组，
+多选删除、移动、修改权限只需一次请求，执行完后每个受影响的目录只失效一次列表缓存。
+
+- 执行前一次性校验：格式错误或路径不安全时拒绝整个批次；再按顺序在虚拟的文件系统视图（BatchPlan）上
+  模拟各操作，预先发现源不存在、目标已存在、目标目录不存在等错误（前面的操作创建、移走、删除的路径对后面的操作可见）
+- 全部成功或全部不执行（atomic）：预检有错误时不执行任何操作；执行中失败时倒序撤销已执行的操作（BatchTransaction）：
+  改名和移动改回原名，新建的目录删除，权限恢复为原来的值。删除和跨文件系统移动先把源改名为同一目录中的
+  隐藏条目（BATCH_TRASH_PREFIX），全部操作成功后才真正删除，无法撤销的部分都放在最后
+- 非 atomic 模式下预检失败的操作跳过，其余操作照常执行
+"""
+import os
+import secrets
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 支持的操作
+BATCH_OPERATIONS = ('delete', 'rename', 'mkdir', 'move', 'chmod')
+# 单个批次最多包含的操作数
+MAX_BATCH_OPERATIONS = 1000
+# atomic 模式下待删除条目的临时名称前缀（批次结束前进程退出时会残留在原目录中）
+BATCH_TRASH_PREFIX = '.batch-trash-'
+
+
+def parse_mode(value) -> int:
+    """
+    解析权限：八进制字符串（"755"、"0o755"）或整数
+    :raises ValueError: 格式错误或超出 0-7777
+    """
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text.startswith('0o'):
+            text = text[2:]
+        if not text or any(c not in '01234567' for c in text):
+            raise ValueError(f"无效的权限: {value}")
+        mode = int(text, 8)
+    elif isinstance(value, int) and not isinstance(value, bool):
+        mode = value
+    else:
+        raise ValueError("mode 必须为八进制字符串或整数")
+    if not 0 <= mode <= 0o7777:
+        raise ValueError(f"无效的权限: {value}")
+    return mode
+
+
+def stage_path(path: str) -> str:
+    """待删除条目在同一目录中的临时名称（同一文件系统内改名，可以撤销）"""
+    return os.path.join(os.path.dirname(path), BATCH_TRASH_PREFIX + secrets.token_hex(8))
+
+
+def _valid_name(name) -> bool:
+    return isinstance(name, str) and name not in ('', '.', '..') and '/' not in name and '\\' not in name \
+        and '\0' not in name
+
+
+def normalize_operations(operations) -> List[Dict]:
+    """
+    校验操作列表的格式，每项为：
+      {"op": "delete", "path": 路径}
+      {"op": "rename", "path": 路径, "new_name": 新名称}
+      {"op": "mkdir", "path": 新目录的路径}（父目录必须已存在）
+      {"op": "move", "path": 路径, "dest": 目标目录}
+      {"op": "chmod", "path": 路径, "mode": "755"}
+    :return: 规范化的操作（chmod 的 mode 转换为整数）
+    :raises ValueError: 格式错误，消息中包含操作的序号（从1开始）
+    """
+    if not isinstance(operations, list) or not operations:
+        raise ValueError("operations 必须为非空列表")
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise ValueError(f"单个批次最多 {MAX_BATCH_OPERATIONS} 个操作")
+    result = []
+    for number, operation in enumerate(operations, 1):
+        if not isinstance(operation, dict):
+            raise ValueError(f"第 {number} 个操作格式错误")
+        op, path = operation.get('op'), operation.get('path')
+        if op not in BATCH_OPERATIONS:
+            raise ValueError(f"第 {number} 个操作: 不支持的操作 {op}")
+        if not isinstance(path, str) or not path.strip('/'):
+            raise ValueError(f"第 {number} 个操作: path 必须为非空字符串")
+        item = {"op": op, "path": path.strip('/')}
+        if op == 'rename':
+            if not _valid_name(operation.get('new_name')):
+                raise ValueError(f"第 {number} 个操作: 新名称为空或包含非法字符")
+            item["new_name"] = operation['new_name']
+        elif op == 'move':
+            dest = operation.get('dest')
+            if not isinstance(dest, str):
+                raise ValueError(f"第 {number} 个操作: dest 必须为字符串（空字符串为根目录）")
+            item["dest"] = dest.strip('/')
+        elif op == 'chmod':
+            try:
+                item["mode"] = parse_mode(operation.get('mode'))
+            except ValueError as e:
+                raise ValueError(f"第 {number} 个操作: {e}")
+        result.append(item)
+    return result
+
+
+class BatchPlan:
+    """
+    批次执行前的虚拟文件系统视图：记录前面的操作造成的变化，其余路径按真实文件系统判断
+    路径均为已校验的绝对路径
+    """
+
+    def __init__(self):
+        # 路径 -> 该路径此时对应的、批次开始前的真实路径；'' 为批次中新建的空目录，None 为已不存在
+        self._overlay: Dict[str, Optional[str]] = {}
+
+    def _lookup(self, path: str) -> Tuple[bool, Optional[str]]:
+        """返回 (是否存在, 对应的真实路径；新建的目录为 '')"""
+        probe = path
+        while True:
+            if probe in self._overlay:
+                origin = self._overlay[probe]
+                if origin is None:
+                    return False, None
+                if origin == '':
+                    # 新建的目录中只有批次里创建或移入的条目（它们自己在 _overlay 中，已先被找到）
+                    return probe == path, '' if probe == path else None
+                real = origin + path[len(probe):]
+                return os.path.lexists(real), real
+            parent = os.path.dirname(probe)
+            if parent == probe:
+                return os.path.lexists(path), path
+            probe = parent
+
+    def exists(self, path: str) -> bool:
+        return self._lookup(path)[0]
+
+    def is_dir(self, path: str) -> bool:
+        """是否为目录（跟随符号链接）"""
+        exists, real = self._lookup(path)
+        return exists and (real == '' or os.path.isdir(real))
+
+    def is_real_dir(self, path: str) -> bool:
+        """是否为目录本身（不是指向目录的符号链接）"""
+        exists, real = self._lookup(path)
+        return exists and (real == '' or (os.path.isdir(real) and not os.path.islink(real)))
+
+    def _children(self, path: str) -> List[str]:
+        prefix = path + os.sep
+        return [key for key in self._overlay if key.startswith(prefix)]
+
+    def create(self, path: str):
+        self._overlay[path] = ''
+
+    def remove(self, path: str):
+        for key in self._children(path):
+            del self._overlay[key]
+        self._overlay[path] = None
+
+    def move(self, source: str, target: str):
+        """源及其下已记录的变化一起移到目标位置"""
+        origin = self._lookup(source)[1]
+        for key in self._children(source):
+            self._overlay[target + key[len(source):]] = self._overlay.pop(key)
+        self._overlay[source] = None
+        self._overlay[target] = origin
+
+
+class BatchTransaction:
+    """atomic 模式下记录已执行操作的撤销函数，以及全部成功后才执行的收尾函数"""
+
+    def __init__(self):
+        self._undo: List[Tuple[int, Callable[[], None]]] = []
+        self._finalize: List[Callable[[], None]] = []
+
+    def on_undo(self, index: int, undo: Callable[[], None]):
+        self._undo.append((index, undo))
+
+    def on_commit(self, finalize: Callable[[], None]):
+        self._finalize.append(finalize)
+
+    def rollback(self) -> Dict[int, str]:
+        """
+        倒序撤销已执行的操作，单个撤销失败时继续撤销其余的
+        :return: 操作序号 -> 撤销失败的原因
+        """
+        errors = {}
+        for index, undo in reversed(self._undo):
+            try:
+                undo()
+            except OSError as e:
+                logger.error(f"撤销批量操作 {index + 1} 失败: {e}")
+                errors[index] = e.strerror or str(e)
+        return errors
+
+    def commit(self) -> List[str]:
+        """
+        倒序执行收尾函数（后面的删除可能包含前面暂存的条目），失败时记录后继续
+        :return: 失败原因
+        """
+        errors = []
+        for finalize in reversed(self._finalize):
+            try:
+                finalize()
+            except FileNotFoundError:
+                # 已随包含它的目录一起删除
+                pass
+            except OSError as e:
+                logger.error(f"批量操作收尾失败: {e}")
+                errors.append(f"{e.filename or ''}: {e.strerror or e}")
+        return errors
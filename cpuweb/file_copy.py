@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+复制和移动模块（由后台任务调用）
+- 复制文件时依次尝试：FICLONE（btrfs/xfs 等文件系统上的 reflink，只共享数据块，瞬间完成）、
+  os.copy_file_range（在内核中复制，不经过用户态；部分文件系统上同样是 reflink）、pread/write
+- 大文件按 COPY_SLICE 分段复制，段之间检查取消标志并更新进度
+- 目录树由 tree_walker.walk 遍历；符号链接复制为链接本身，设备文件、管道等特殊文件跳过；
+  保留权限和修改时间（目录的权限和时间在其中的内容全部复制完成后设置）
+- 复制失败或被取消时删除不完整的目标（目标在任务开始前不存在）
+- 移动先尝试不覆盖目标的改名（renameat2 RENAME_NOREPLACE，同一文件系统内瞬间完成），
+  跨文件系统时复制完成后再删除源；任务排队期间目标被创建时失败，不会替换已存在的文件或空目录
+"""
+import os
+import stat
+import errno
+import fcntl
+import ctypes
+import ctypes.util
+import logging
+from typing import Callable, List, Optional
+
+from tree_walker import walk, WalkCancelled, WalkProgress
+from file_save import copy_range
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Linux 的 FICLONE ioctl（_IOW(0x94, 9, int)），让目标文件共享源文件的数据块
+FICLONE = 0x40049409
+# 大文件每段复制的字节数，段之间检查取消标志
+COPY_SLICE = 64 * 1024 * 1024
+# 结果中最多列出的失败条目数
+MAX_REPORTED_ERRORS = 20
+# renameat2 的参数：相对当前目录解析路径、目标已存在时失败
+AT_FDCWD = -100
+RENAME_NOREPLACE = 1
+
+_renameat2 = None
+try:
+    _renameat2 = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True).renameat2
+    _renameat2.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+except (OSError, AttributeError):
+    # 非 Linux 或 glibc < 2.28
+    pass
+
+
+def rename_noreplace(source: str, target: str):
+    """
+    改名，目标已存在时抛出 FileExistsError（os.rename 会静默替换已存在的文件或空目录）
+    内核或文件系统不支持 RENAME_NOREPLACE 时：文件和链接用硬链接后删除源，目录先检查再改名
+    """
+    if _renameat2 is not None:
+        if _renameat2(AT_FDCWD, os.fsencode(source), AT_FDCWD, os.fsencode(target), RENAME_NOREPLACE) == 0:
+            return
+        err = ctypes.get_errno()
+        if err == errno.EEXIST:
+            raise FileExistsError(err, os.strerror(err), target)
+        if err not in (errno.EINVAL, errno.ENOSYS):
+            raise OSError(err, os.strerror(err), source, None, target)
+    if os.path.isdir(source) and not os.path.islink(source):
+        if os.path.lexists(target):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), target)
+        os.rename(source, target)
+        return
+    # link 在目标已存在时失败
+    os.link(source, target, follow_symlinks=False)
+    os.unlink(source)
+
+
+def _clone(src: int, dst: int) -> bool:
+    try:
+        fcntl.ioctl(dst, FICLONE, src)
+        return True
+    except OSError:
+        # 文件系统不支持 reflink、跨文件系统或非 Linux 平台
+        return False
+
+
+def copy_file(source: str, target: str, st: os.stat_result, cancel: Optional[object] = None,
+              progress: Optional[WalkProgress] = None):
+    """
+    复制单个普通文件（目标不能已存在），保留权限和修改时间
+    :param st: 源文件的 stat 结果
+    :param cancel: 取消标志（threading.Event），被设置后抛出 WalkCancelled
+    :param progress: 进度对象，复制完成的字节数和文件数累加到其中
+    """
+    src = os.open(source, os.O_RDONLY | os.O_CLOEXEC)
+    try:
+        dst = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_CLOEXEC, 0o600)
+        try:
+            if _clone(src, dst):
+                if progress is not None:
+                    progress.bytes += st.st_size
+            else:
+                pos = 0
+                while pos < st.st_size:
+                    if cancel is not None and cancel.is_set():
+                        raise WalkCancelled()
+                    copied = copy_range(src, dst, pos, min(pos + COPY_SLICE, st.st_size))
+                    if copied == 0:
+                        # 文件在复制期间变短
+                        break
+                    pos += copied
+                    if progress is not None:
+                        progress.bytes += copied
+            os.fchmod(dst, stat.S_IMODE(st.st_mode))
+        except BaseException:
+            os.close(dst)
+            os.unlink(target)
+            raise
+        os.close(dst)
+    finally:
+        os.close(src)
+    os.utime(target, ns=(st.st_atime_ns, st.st_mtime_ns))
+    if progress is not None:
+        progress.files += 1
+
+
+def _copy_entry(source: str, target: str, st: os.stat_result, cancel, progress: WalkProgress, errors: List[str]):
+    """复制目录中的一个非目录条目；失败时记录后继续"""
+    progress.current = source
+    try:
+        if stat.S_ISLNK(st.st_mode):
+            os.symlink(os.readlink(source), target)
+            progress.files += 1
+        elif stat.S_ISREG(st.st_mode):
+            copy_file(source, target, st, cancel, progress)
+    except OSError as e:
+        progress.errors += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append(f"{source}: {e.strerror or e}")
+
+
+def copy_item(source: str, target: str, remove: Callable[[str], None], cancel=None,
+              progress: Optional[WalkProgress] = None) -> List[str]:
+    """
+    复制文件、符号链接或目录树
+    :param source: 源路径（已校验的绝对路径）
+    :param target: 目标路径（不能已存在）
+    :param remove: 删除路径的函数，复制失败或被取消时用于清理不完整的目标
+    :param cancel: 取消标志
+    :param progress: 进度对象
+    :return: 目录中复制失败的条目（最多 MAX_REPORTED_ERRORS 条），单个条目失败不会中断复制
+    """
+    progress = progress if progress is not None else WalkProgress()
+    st = os.lstat(source)
+    if stat.S_ISLNK(st.st_mode):
+        os.symlink(os.readlink(source), target)
+        progress.files += 1
+        return []
+    if not stat.S_ISDIR(st.st_mode):
+        progress.current = source
+        copy_file(source, target, st, cancel, progress)
+        return []
+
+    errors: List[str] = []
+    scan_progress = WalkProgress()
+    # 目录先以 0700 创建，保证复制期间可写，最后再设置原来的权限
+    os.mkdir(target, 0o700)
+    directories = [(target, st)]
+    try:
+        walker = walk(source, need_stat=True, cancel=cancel, progress=scan_progress)
+        try:
+            for dir_path, records, _ in walker:
+                target_dir = os.path.normpath(os.path.join(target, os.path.relpath(dir_path, source)))
+                progress.directories += 1
+                for name, is_dir, entry_st in records:
+                    entry_source = os.path.join(dir_path, name)
+                    entry_target = os.path.join(target_dir, name)
+                    if entry_st is None:
+                        progress.errors += 1
+                        if len(errors) < MAX_REPORTED_ERRORS:
+                            errors.append(f"{entry_source}: 无法读取文件信息")
+                    elif is_dir:
+                        os.mkdir(entry_target, 0o700)
+                        directories.append((entry_target, entry_st))
+                    else:
+                        _copy_entry(entry_source, entry_target, entry_st, cancel, progress, errors)
+        finally:
+            walker.close()
+        # 子目录在父目录之后加入，倒序设置，子目录的时间不会再被改变
+        for dir_path, dir_st in reversed(directories):
+            os.chmod(dir_path, stat.S_IMODE(dir_st.st_mode))
+            os.utime(dir_path, ns=(dir_st.st_atime_ns, dir_st.st_mtime_ns))
+    except BaseException:
+        logger.info(f"复制未完成，清理目标: {target}")
+        try:
+            remove(target)
+        except OSError as e:
+            logger.error(f"清理不完整的复制目标失败 {target}: {e}")
+        raise
+    progress.errors += scan_progress.errors
+    if scan_progress.errors and len(errors) < MAX_REPORTED_ERRORS:
+        errors.append(f"{scan_progress.errors} 个子目录无法读取，已跳过")
+    return errors
+
+
+def move_item(source: str, target: str, remove: Callable[[str], None], cancel=None,
+              progress: Optional[WalkProgress] = None) -> List[str]:
+    """
+    移动文件或目录：同一文件系统内直接改名，否则复制后删除源
+    :return: 复制失败的条目；有失败时保留源，不删除
+    :raises FileExistsError: 目标已存在
+    """
+    progress = progress if progress is not None else WalkProgress()
+    try:
+        rename_noreplace(source, target)
+        progress.files += 1
+        return []
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    logger.info(f"跨文件系统移动，复制后删除源: {source} -> {target}")
+    errors = copy_item(source, target, remove, cancel, progress)
+    if not errors:
+        remove(source)
+    return errors
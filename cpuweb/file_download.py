@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件下载模块
+- ETag（inode-大小-修改时间）和 Last-Modified 校验，If-None-Match / If-Modified-Since 命中时返回304
+- 支持单个字节区间（Range / If-Range），用于断点续传和视频拖动；多区间请求按整个文件返回
+- 响应体交给 WSGI 服务器的 wsgi.file_wrapper：gunicorn 下（未启用SSL时）用 sendfile 零拷贝从区间起点发送，
+  开发服务器则按块读取
+- 可选 X-Accel-Redirect 模式（环境变量 CPUWEB_ACCEL_REDIRECT 为 nginx 的 internal location 前缀）：
+  cpuweb 只做路径校验，文件内容、区间和条件请求都由 nginx 处理
+"""
+import os
+import mimetypes
+import unicodedata
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import quote
+
+from flask import Response, request
+from werkzeug.datastructures import Headers
+from werkzeug.http import http_date, is_resource_modified, parse_if_range_header, parse_range_header, quote_etag
+from werkzeug.wsgi import wrap_file
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# X-Accel-Redirect 前缀，为空时由 cpuweb 自己发送文件内容
+ACCEL_REDIRECT_PREFIX = os.environ.get('CPUWEB_ACCEL_REDIRECT', '')
+# 无法使用 sendfile 时每次读取的块大小（字节）
+READ_BLOCK = 1024 * 1024
+
+
+class FileRange:
+    """
+    文件中从当前位置开始的一段：read 不会越过区间末尾，fileno 交给服务器做 sendfile
+    （gunicorn 从文件描述符的当前偏移开始发送 Content-Length 字节）
+    """
+
+    def __init__(self, f, start: int, length: int):
+        self.file = f
+        self.remaining = length
+        f.seek(start)
+
+    def fileno(self) -> int:
+        return self.file.fileno()
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self.file.seek(offset, whence)
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def file_etag(st: os.stat_result) -> str:
+    """由 inode、大小和纳秒修改时间生成 ETag，文件被替换或修改后即变化"""
+    return f"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"
+
+
+def set_disposition(headers: Headers, filename: str):
+    """设置附件下载的 Content-Disposition，非ASCII文件名同时给出 filename*"""
+    simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+    if simple == filename:
+        headers.set('Content-Disposition', 'attachment', filename=filename)
+    else:
+        headers.set('Content-Disposition', 'attachment', filename=simple or 'download',
+                    **{'filename*': "UTF-8''" + quote(filename, safe="!#$&+^`|~")})
+
+
+def send_download(path: Path, rel_path: str) -> Response:
+    """
+    以附件形式发送文件（路径已经过安全校验）
+    :param path: 文件的绝对路径
+    :param rel_path: 相对基础路径的路径，X-Accel-Redirect 模式下拼接到前缀之后
+    :return: 200、206、304 或 416 响应
+    """
+    headers = Headers()
+    set_disposition(headers, path.name)
+    mimetype = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+
+    if ACCEL_REDIRECT_PREFIX:
+        headers['X-Accel-Redirect'] = ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + quote(rel_path)
+        return Response(headers=headers, mimetype=mimetype)
+
+    f = open(path, 'rb')
+    try:
+        st = os.fstat(f.fileno())
+        etag = file_etag(st)
+        last_modified = datetime.fromtimestamp(int(st.st_mtime), timezone.utc)
+        size = st.st_size
+        headers['ETag'] = quote_etag(etag)
+        headers['Last-Modified'] = http_date(last_modified)
+        headers['Accept-Ranges'] = 'bytes'
+        # 文件随时可能被修改：允许缓存，但每次使用前都要用 ETag 重新校验
+        headers['Cache-Control'] = 'no-cache'
+
+        if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            f.close()
+            return Response(status=304, headers=headers)
+
+        start, length, status = 0, size, 200
+        byte_range = parse_range_header(request.headers.get('Range'))
+        if byte_range is not None and byte_range.units == 'bytes' and _if_range_matches(etag, last_modified):
+            span = byte_range.range_for_length(size)
+            if span is not None:
+                start, length, status = span[0], span[1] - span[0], 206
+                headers['Content-Range'] = f"bytes {span[0]}-{span[1] - 1}/{size}"
+            elif len(byte_range.ranges) == 1:
+                f.close()
+                headers['Content-Range'] = f"bytes */{size}"
+                return Response(status=416, headers=headers)
+
+        headers['Content-Length'] = str(length)
+        body = wrap_file(request.environ, FileRange(f, start, length), READ_BLOCK)
+    except BaseException:
+        f.close()
+        raise
+    return Response(body, status=status, headers=headers, mimetype=mimetype, direct_passthrough=True)
+
+
+def _if_range_matches(etag: str, last_modified: datetime) -> bool:
+    """If-Range 与当前文件一致（或没有 If-Range）时才按区间返回，否则返回整个文件"""
+    if_range = parse_if_range_header(request.headers.get('If-Range'))
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return if_range.date == last_modified
+    return True
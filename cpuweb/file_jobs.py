@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后台文件任务模块
+删除、复制、移动、打包到服务器等耗时操作以任务方式执行：请求校验参数后立即返回任务ID，
+任务在每个进程一个的有界线程池（JOB_WORKERS）中排队执行，不再占用处理请求的线程。
+
+- 任务进度（WalkProgress：目录数、文件数、字节数、错误数、当前路径）由执行线程更新，
+  监视线程每 JOB_FLUSH_INTERVAL 秒把有变化的状态写入 JOB_STATE_DIR 中的 JSON 文件（先写临时文件再改名），
+  多个工作进程都能查询任何任务
+- 执行任务的进程在内存中持有任务对象，状态变化时直接唤醒同一进程中的SSE订阅者；其他进程按 JOB_POLL_INTERVAL 轮询状态文件
+- 取消：同一进程中直接设置取消标志；其他进程写入取消标记文件，由监视线程转交给执行线程。
+  取消在遍历下一层目录或复制下一块数据之前生效；已删除的内容不会恢复，复制会清理不完整的目标
+- 执行进程退出后仍处于排队/运行状态的任务报告为 interrupted
+- 已结束的任务保留 JOB_EXPIRE 秒，在下次提交任务时清理
+"""
+import os
+import re
+import json
+import time
+import secrets
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional
+
+from tree_walker import WalkCancelled, WalkProgress
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 任务状态文件目录
+JOB_STATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jobs')
+# 每个进程同时执行的任务数（其余排队）
+JOB_WORKERS = 2
+# 每个进程最多排队和执行中的任务数
+MAX_ACTIVE_JOBS = 64
+# 写入进度和检查取消标记的间隔（秒）
+JOB_FLUSH_INTERVAL = 0.5
+# 其他进程轮询状态文件的间隔（秒）
+JOB_POLL_INTERVAL = 0.5
+# SSE 没有变化时发送心跳的间隔（秒）
+JOB_HEARTBEAT = 15
+# 已结束的任务保留时间（秒）
+JOB_EXPIRE = 24 * 3600
+# 列表接口最多返回的任务数
+MAX_LISTED_JOBS = 100
+# 结束状态
+FINAL_STATES = ('succeeded', 'failed', 'cancelled', 'interrupted')
+
+_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class Job:
+    """一个任务（只存在于执行它的进程中）"""
+
+    def __init__(self, job_type: str, params: Dict, total: Optional[Dict]):
+        self.id = secrets.token_hex(16)
+        self.type = job_type
+        self.params = params
+        # 预计的总量（来自目录大小索引，可能不准确或缺失）
+        self.total = total
+        self.state = 'queued'
+        self.result: Optional[Dict] = None
+        self.progress = WalkProgress()
+        self.cancel = threading.Event()
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.version = 0
+        self._flushed: Optional[Dict] = None
+
+    def as_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "type": self.type,
+            "params": self.params,
+            "state": self.state,
+            "progress": self.progress.as_dict(),
+            "total": self.total,
+            "result": self.result,
+            "cancel_requested": self.cancel.is_set(),
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "pid": os.getpid(),
+            "version": self.version
+        }
+
+
+class JobManager:
+    def __init__(self, state_dir: str = JOB_STATE_DIR, workers: int = JOB_WORKERS):
+        """
+        初始化任务管理
+        :param state_dir: 状态文件目录
+        :param workers: 每个进程的任务线程数
+        """
+        self.state_dir = state_dir
+        self.workers = workers
+        self._jobs: Dict[str, Job] = {}
+        self._cond = threading.Condition()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._monitor: Optional[threading.Thread] = None
+        self._pid = None
+
+    def _state_path(self, job_id: str) -> str:
+        return os.path.join(self.state_dir, job_id + '.json')
+
+    def _cancel_path(self, job_id: str) -> str:
+        return os.path.join(self.state_dir, job_id + '.cancel')
+
+    def _ensure_started(self):
+        """延迟创建线程池和监视线程（fork 之后的子进程各自创建）"""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._jobs = {}
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='file-job')
+        self._monitor = threading.Thread(target=self._watch_jobs, name='file-job-monitor', daemon=True)
+        self._monitor.start()
+
+    def _write_state(self, job: Job):
+        """把任务状态原子地写入状态文件（在持有 _cond 时调用）"""
+        state = job.as_dict()
+        temp_path = self._state_path(job.id) + f'.{os.getpid()}.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(temp_path, self._state_path(job.id))
+        except OSError as e:
+            logger.warning(f"写入任务状态失败 {job.id}: {e}")
+
+    def _publish(self, job: Job):
+        """状态有变化时增加版本号、写入状态文件并唤醒订阅者"""
+        with self._cond:
+            snapshot = job.as_dict()
+            for key in ('version', 'progress'):
+                snapshot.pop(key)
+            snapshot['progress'] = {k: v for k, v in job.progress.as_dict().items() if k != 'elapsed'}
+            if snapshot == job._flushed:
+                return
+            job._flushed = snapshot
+            job.version += 1
+            self._write_state(job)
+            self._cond.notify_all()
+
+    def _watch_jobs(self):
+        """监视线程：定期写入进度，并把其他进程写入的取消标记转交给执行线程"""
+        while True:
+            time.sleep(JOB_FLUSH_INTERVAL)
+            with self._cond:
+                jobs = [job for job in self._jobs.values() if job.state not in FINAL_STATES]
+            for job in jobs:
+                if not job.cancel.is_set() and os.path.exists(self._cancel_path(job.id)):
+                    logger.info(f"任务 {job.id} 收到取消请求")
+                    job.cancel.set()
+                self._publish(job)
+
+    def _run(self, job: Job, run: Callable[[Job], Dict]):
+        if job.cancel.is_set():
+            job.state = 'cancelled'
+            job.result = {"success": False, "message": "任务在开始之前已取消"}
+        else:
+            job.state = 'running'
+            job.started = time.time()
+            self._publish(job)
+            try:
+                job.result = run(job)
+                if job.result.get("success"):
+                    job.state = 'succeeded'
+                else:
+                    # 任务自己处理了取消（例如批量操作撤销后返回结果数组）
+                    job.state = 'cancelled' if job.cancel.is_set() else 'failed'
+            except WalkCancelled:
+                job.state = 'cancelled'
+                job.result = {"success": False, "message": "任务已取消"}
+            except Exception as e:
+                logger.exception(f"任务 {job.id} ({job.type}) 失败")
+                job.state = 'failed'
+                job.result = {"success": False, "message": f"任务执行失败: {str(e)}"}
+        job.finished = time.time()
+        self._publish(job)
+        try:
+            os.unlink(self._cancel_path(job.id))
+        except FileNotFoundError:
+            pass
+        with self._cond:
+            self._jobs.pop(job.id, None)
+        logger.info(f"任务 {job.id} ({job.type}) 结束: {job.state}")
+
+    def expire(self):
+        """清理超过保留时间没有更新的状态文件和取消标记"""
+        try:
+            names = os.listdir(self.state_dir)
+        except FileNotFoundError:
+            return
+        deadline = time.time() - JOB_EXPIRE
+        for name in names:
+            path = os.path.join(self.state_dir, name)
+            try:
+                if os.path.getmtime(path) < deadline:
+                    os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def submit(self, job_type: str, params: Dict, run: Callable[[Job], Dict], total: Optional[Dict] = None) -> Dict:
+        """
+        提交任务
+        :param job_type: 任务类型（delete、copy、move、archive、batch 等）
+        :param params: 任务参数（原样记录在状态中，用于显示）
+        :param run: 在任务线程中调用 run(job)，返回结果字典；应定期检查 job.cancel 并更新 job.progress
+        :param total: 预计的总量 {"files": 文件数, "bytes": 字节数}
+        :return: 任务状态
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+        self.expire()
+        with self._cond:
+            self._ensure_started()
+            if len(self._jobs) >= MAX_ACTIVE_JOBS:
+                return {"success": False, "message": f"排队的任务过多（上限 {MAX_ACTIVE_JOBS}），请稍后再试", "status": 503}
+            job = Job(job_type, params, total)
+            self._jobs[job.id] = job
+        self._publish(job)
+        self._executor.submit(self._run, job, run)
+        logger.info(f"提交任务 {job.id} ({job_type}): {params}")
+        return {"success": True, "job": job.as_dict(), "status": 202}
+
+    def _read_state(self, job_id: str) -> Optional[Dict]:
+        try:
+            with open(self._state_path(job_id), encoding='utf-8') as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if state['state'] not in FINAL_STATES and not _process_alive(state['pid']):
+            state['state'] = 'interrupted'
+            state['result'] = {"success": False, "message": "执行任务的进程已退出，任务未完成"}
+        return state
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """查询任务状态，任务不存在或已过期时返回 None"""
+        if not _ID_PATTERN.match(job_id or ''):
+            return None
+        with self._cond:
+            job = self._jobs.get(job_id) if self._pid == os.getpid() else None
+            if job is not None:
+                return job.as_dict()
+        return self._read_state(job_id)
+
+    def list_jobs(self) -> List[Dict]:
+        """列出所有进程的任务，按创建时间倒序"""
+        try:
+            names = os.listdir(self.state_dir)
+        except FileNotFoundError:
+            return []
+        jobs = []
+        for name in names:
+            if name.endswith('.json'):
+                state = self.get(name[:-len('.json')])
+                if state is not None:
+                    jobs.append(state)
+        jobs.sort(key=lambda state: state['created'], reverse=True)
+        return jobs[:MAX_LISTED_JOBS]
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        """
+        请求取消任务（排队中的任务不再执行，执行中的任务在下一个检查点停止）
+        :return: 任务状态，任务不存在时返回 None
+        """
+        state = self.get(job_id)
+        if state is None or state['state'] in FINAL_STATES:
+            return state
+        with self._cond:
+            job = self._jobs.get(job_id) if self._pid == os.getpid() else None
+        if job is not None:
+            job.cancel.set()
+            self._publish(job)
+            return job.as_dict()
+        # 任务在其他进程中执行，写入取消标记
+        with open(self._cancel_path(job_id), 'w'):
+            pass
+        state['cancel_requested'] = True
+        return state
+
+    def watch(self, job_id: str) -> Iterator[Optional[Dict]]:
+        """
+        订阅任务状态：先生成当前状态，之后每次变化生成新状态，任务结束后停止；没有变化时生成 None（心跳）
+        """
+        version = None
+        last_sent = time.time()
+        while True:
+            with self._cond:
+                job = self._jobs.get(job_id) if self._pid == os.getpid() else None
+                if job is not None:
+                    # 同一进程中执行的任务：等待状态变化的通知
+                    self._cond.wait_for(lambda: job.version != version or job.id not in self._jobs, JOB_HEARTBEAT)
+            state = self.get(job_id)
+            if state is None:
+                return
+            if state['version'] != version or state['state'] in FINAL_STATES:
+                version = state['version']
+                last_sent = time.time()
+                yield state
+                if state['state'] in FINAL_STATES:
+                    return
+            elif time.time() - last_sent >= JOB_HEARTBEAT:
+                last_sent = time.time()
+                yield None
+            if job is None:
+                time.sleep(JOB_POLL_INTERVAL)
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -5,26 +5,86 @@
 提供安全的文件操作功能，包括浏览、创建、删除、重命名、上传、下载等
 """
 import os
-import shutil
+import time
+import json
+import threading
+import stat
+import errno
+import base64
 import mimetypes
 import logging
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Union, Optional
 
+from listing_cache import ListingCache, DEFAULT_MAX_BYTES
+from size_index import DirectorySizeIndex, MAX_DEPTH
+from search_index import FilenameIndex, MAX_SEARCH_LIMIT
+from content_index import ContentIndex, MAX_CONTENT_RESULTS
+from tree_walker import scan_directory, walk, WalkProgress, WalkCancelled
+from chunked_upload import UploadSessions, DEFAULT_CHUNK_SIZE, MAX_BATCH_FILES, commit_file, store_file
+from archive_stream import ARCHIVE_FORMATS, parse_level, stream_archive, zstandard
+from text_preview import TextPreviewer, detect_encoding, MAX_PREVIEW_LINES, SAMPLE_BYTES, TEXT_ENCODINGS
+from log_tail import LogTailer, DEFAULT_TAIL_LINES, MAX_TAIL_LINES
+from file_download import file_etag
+from file_save import SaveConflict, apply_patches, normalize_patches, save_content
+from file_jobs import JobManager
+from file_copy import copy_item, move_item, rename_noreplace, MAX_REPORTED_ERRORS
+from file_batch import BatchPlan, BatchTransaction, normalize_operations, stage_path
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 目录列表可返回的字段（name、path、type 始终返回）
+LIST_FIELDS = (
+    'name', 'path', 'type', 'size', 'modified', 'created', 'accessed',
+    'permissions', 'mime_type', 'is_readable', 'is_writable', 'is_executable'
+)
+# 需要 stat 信息的字段
+STAT_FIELDS = {'size', 'modified', 'created', 'accessed', 'permissions'}
+# 目录列表支持的排序字段
+SORT_KEYS = ('name', 'size', 'mtime')
+# 单页最多返回的条目数
+MAX_PAGE_LIMIT = 5000
+# 可以预览的文本文件扩展名（同时决定哪些文件建立内容索引）
+TEXT_EXTENSIONS = {
+    '.txt', '.py', '.js', '.html', '.htm', '.css', '.json', '.xml',
+    '.md', '.csv', '.log', '.ini', '.cfg', '.yml', '.yaml', '.sh',
+    '.sql', '.ts', '.tsx', '.jsx', '.vue', '.dart', '.go', '.java',
+    '.cpp', '.c', '.h', '.hpp', '.rb', '.php', '.pl', '.pm'
+}
+# 差异保存接受的编码（read_file_content 可能返回的编码）
+SAVE_ENCODINGS = {'utf-8-sig', 'latin-1', *TEXT_ENCODINGS}
+
 class FileManager:
-    def __init__(self, base_path: str = "/home/bi9bjv", max_file_size: int = 10 * 1024 * 1024):  # 10MB默认限制
+    def __init__(self, base_path: str = "/home/bi9bjv", max_file_size: int = 10 * 1024 * 1024,  # 10MB默认限制
+                 listing_cache_size: int = DEFAULT_MAX_BYTES):
         """
         初始化文件管理器
         :param base_path: 基础路径，所有操作将限制在此路径下
         :param max_file_size: 最大文件大小限制（字节）
+        :param listing_cache_size: 目录列表缓存的内存上限（字节），为0时禁用
         """
         self.base_path = Path(base_path).resolve()
         self.max_file_size = max_file_size
+        self.listing_cache = ListingCache(listing_cache_size)
+        # 目录大小索引，由采集进程（或开发服务器）调用 start() 后在后台维护
+        self.size_index = DirectorySizeIndex(str(self.base_path))
+        # 文件名搜索索引复用目录大小索引的扫描结果和数据库
+        self.search_index = FilenameIndex(self.size_index.db_path)
+        self.size_index.add_listener(self.search_index)
+        # 文本文件内容索引同样由目录大小索引的扫描结果维护文件清单
+        self.content_index = ContentIndex(str(self.base_path), self.size_index.db_path, TEXT_EXTENSIONS, max_file_size)
+        self.size_index.add_listener(self.content_index)
+        # 分块断点续传的上传会话
+        self.uploads = UploadSessions(str(self.base_path))
+        # 分段预览的行索引缓存
+        self.previewer = TextPreviewer()
+        # 日志跟踪的共享读取器
+        self.tailer = LogTailer()
+        # 删除、复制、移动等耗时操作的后台任务
+        self.jobs = JobManager()
         self._validate_base_path()
         
     def _validate_base_path(self):
@@ -81,12 +141,100 @@ class FileManager:
             "is_executable": os.access(path, os.X_OK)
         }
     
-    def list_directory(self, path: str = "") -> Dict:
+    @staticmethod
+    def _format_time(timestamp: float) -> str:
+        return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+    @staticmethod
+    def _sort_records(records: List[tuple], sort: str, reverse: bool):
+        """目录始终在前，目录和文件分别按指定字段排序，名称作为次要排序键"""
+        if sort == 'size':
+            key = lambda r: (0 if r[1] else r[2].st_size, r[0].lower())
+        elif sort == 'mtime':
+            key = lambda r: (r[2].st_mtime_ns, r[0].lower())
+        else:
+            key = lambda r: r[0].lower()
+        records.sort(key=key, reverse=reverse)
+        # 排序是稳定的，再按类型分组即可让目录在前且保持组内顺序
+        records.sort(key=lambda r: not r[1])
+
+    def _record_info(self, dir_path: Path, rel_dir: str, record: tuple, fields: set) -> Dict:
+        """根据扫描结果生成请求字段的信息，只计算被请求的字段"""
+        name, is_dir, st = record
+        info = {
+            "name": name,
+            "path": f"{rel_dir}/{name}" if rel_dir else name,
+            "type": "directory" if is_dir else "file"
+        }
+        if 'size' in fields:
+            info["size"] = st.st_size if stat.S_ISREG(st.st_mode) else 0
+        if 'modified' in fields:
+            info["modified"] = self._format_time(st.st_mtime)
+        if 'created' in fields:
+            info["created"] = self._format_time(st.st_ctime)
+        if 'accessed' in fields:
+            info["accessed"] = self._format_time(st.st_atime)
+        if 'permissions' in fields:
+            info["permissions"] = oct(st.st_mode)[-3:]
+        if 'mime_type' in fields:
+            info["mime_type"] = mimetypes.guess_type(name)[0]
+        full_path = os.path.join(dir_path, name)
+        if 'is_readable' in fields:
+            info["is_readable"] = os.access(full_path, os.R_OK)
+        if 'is_writable' in fields:
+            info["is_writable"] = os.access(full_path, os.W_OK)
+        if 'is_executable' in fields:
+            info["is_executable"] = os.access(full_path, os.X_OK)
+        return info
+
+    @staticmethod
+    def _encode_cursor(offset: int, dir_stat: os.stat_result, sort: str, order: str) -> str:
+        data = {'o': offset, 'm': dir_stat.st_mtime_ns, 'i': dir_stat.st_ino, 's': sort, 'r': order}
+        return base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode().rstrip('=')
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Optional[Dict]:
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            if isinstance(data, dict) and isinstance(data.get('o'), int) and data['o'] >= 0:
+                return data
+        except (ValueError, TypeError):
+            pass
+        return None
+
+    def list_directory(self, path: str = "", limit: Optional[int] = None, cursor: Optional[str] = None,
+                       sort: str = 'name', order: str = 'asc', fields: Optional[List[str]] = None) -> Dict:
         """
         列出目录内容
         :param path: 要列出的目录路径
+        :param limit: 每页条目数，为空时返回全部
+        :param cursor: 上一页返回的 next_cursor
+        :param sort: 排序字段 name/size/mtime（目录始终在前）
+        :param order: 排序方向 asc/desc
+        :param fields: 需要返回的字段，为空时返回全部字段（name、path、type 始终返回）
         :return: 包含目录内容的字典
         """
+        if sort not in SORT_KEYS:
+            return {"success": False, "message": f"无效的排序字段，仅支持: {', '.join(SORT_KEYS)}"}
+        if order not in ('asc', 'desc'):
+            return {"success": False, "message": "无效的排序方向，仅支持 'asc' 或 'desc'"}
+        if fields:
+            unknown = [f for f in fields if f not in LIST_FIELDS]
+            if unknown:
+                return {"success": False, "message": f"未知的字段: {', '.join(unknown)}"}
+            field_set = set(fields)
+        else:
+            field_set = set(LIST_FIELDS)
+        if limit is not None and not 1 <= limit <= MAX_PAGE_LIMIT:
+            return {"success": False, "message": f"limit 必须在 1 到 {MAX_PAGE_LIMIT} 之间"}
+        offset = 0
+        cursor_data = None
+        if cursor:
+            cursor_data = self._decode_cursor(cursor)
+            if cursor_data is None or cursor_data.get('s') != sort or cursor_data.get('r') != order:
+                return {"success": False, "message": "无效的分页游标"}
+            offset = cursor_data['o']
+
         safe_path = self._safe_path(path)
         if not safe_path:
             return {"success": False, "message": "路径不安全或不存在"}
@@ -98,28 +246,37 @@ class FileManager:
             return {"success": False, "message": "指定路径不是目录"}
         
         try:
-            items = []
-            for item in safe_path.iterdir():
-                try:
-                    item_info = self._get_file_info(item)
-                    items.append(item_info)
-                except PermissionError:
-                    # 如果无法访问某个文件/目录，跳过它
-                    logger.warning(f"无法访问: {item}, 跳过...")
-                    continue
-            
-            # 按类型和名称排序（目录在前，然后按名称）
-            items.sort(key=lambda x: (x["type"] != "directory", x["name"].lower()))
+            dir_stat = safe_path.stat()
+            need_stat = bool(field_set & STAT_FIELDS) or sort != 'name'
+            cache_key = str(safe_path)
+            entry = self.listing_cache.get(cache_key, dir_stat, need_stat)
+            if entry is None:
+                token = self.listing_cache.begin(cache_key)
+                entry = self.listing_cache.put(cache_key, dir_stat, scan_directory(str(safe_path), need_stat),
+                                               need_stat, token)
+            records = self.listing_cache.sorted_records(entry, sort, order, self._sort_records)
+
+            rel_dir = str(safe_path.relative_to(self.base_path)) if safe_path != self.base_path else ""
+            end = len(records) if limit is None else min(offset + limit, len(records))
+            items = [self._record_info(safe_path, rel_dir, record, field_set) for record in records[offset:end]]
             
-            return {
+            result = {
                 "success": True,
                 "items": items,
-                "current_path": str(safe_path.relative_to(self.base_path)) if safe_path != self.base_path else "",
+                "current_path": rel_dir,
                 "parent_path": str(safe_path.parent.relative_to(self.base_path)) 
                     if safe_path.parent != self.base_path and str(safe_path.parent).startswith(str(self.base_path)) 
                     else None,
-                "total_items": len(items)
+                "total_items": len(records),
+                "offset": offset,
+                "sort": sort,
+                "order": order,
+                "next_cursor": self._encode_cursor(end, dir_stat, sort, order) if end < len(records) else None
             }
+            if cursor_data is not None:
+                # 翻页期间目录发生了变化，客户端可以选择从头重新加载
+                result["changed"] = (cursor_data.get('m'), cursor_data.get('i')) != (dir_stat.st_mtime_ns, dir_stat.st_ino)
+            return result
             
         except PermissionError:
             return {"success": False, "message": "无权限访问该目录"}
@@ -168,6 +325,7 @@ class FileManager:
         
         try:
             new_dir_path.mkdir(parents=True, exist_ok=True)
+            self.listing_cache.invalidate(str(parent_safe_path))
             return {"success": True, "message": "目录创建成功", "path": str(new_dir_path.relative_to(self.base_path))}
         except PermissionError:
             return {"success": False, "message": "无权限创建目录"}
@@ -175,10 +333,35 @@ class FileManager:
             logger.error(f"创建目录失败: {e}")
             return {"success": False, "message": f"创建目录失败: {str(e)}"}
     
-    def delete_item(self, path: str) -> Dict:
+    def _remove_tree(self, root: Path, cancel: Optional[threading.Event] = None,
+                     progress: Optional[WalkProgress] = None):
+        """
+        删除目录树：遍历时在扫描线程中并行删除每层的文件（包括符号链接），最后从最深处开始删除空目录
+        :param root: 要删除的目录
+        :param cancel: 取消标志（已删除的文件不会恢复）
+        :param progress: 进度对象
+        """
+        def unlink_files(dir_path: str, records: List[tuple]):
+            for name, is_dir, _ in records:
+                if not is_dir:
+                    try:
+                        os.unlink(os.path.join(dir_path, name))
+                    except FileNotFoundError:
+                        pass
+
+        directories = [dir_path for dir_path, _, _ in walk(str(root), need_stat=False, visit=unlink_files,
+                                                            cancel=cancel, progress=progress)]
+        # 遍历结果中父目录总在子目录之前，倒序即可先删子目录
+        for dir_path in reversed(directories):
+            os.rmdir(dir_path)
+
+    def delete_item(self, path: str, cancel: Optional[threading.Event] = None,
+                    progress: Optional[WalkProgress] = None) -> Dict:
         """
         删除文件或目录
         :param path: 要删除的文件/目录路径
+        :param cancel: 取消标志
+        :param progress: 进度对象
         :return: 操作结果
         """
         safe_path = self._safe_path(path)
@@ -187,10 +370,14 @@ class FileManager:
         
         try:
             if safe_path.is_dir():
-                shutil.rmtree(safe_path)
+                self._remove_tree(safe_path, cancel, progress)
+                self.listing_cache.invalidate(str(safe_path), recursive=True)
             else:
                 safe_path.unlink()
+            self.listing_cache.invalidate(str(safe_path.parent))
             return {"success": True, "message": "删除成功"}
+        except WalkCancelled:
+            return {"success": False, "message": "删除已取消，部分内容可能已被删除"}
         except PermissionError:
             return {"success": False, "message": "无权限删除该文件/目录"}
         except OSError as e:
@@ -203,6 +390,509 @@ class FileManager:
             logger.error(f"删除失败: {e}")
             return {"success": False, "message": f"删除失败: {str(e)}"}
     
+    def _rel(self, path: Path) -> str:
+        return str(path.relative_to(self.base_path)) if path != self.base_path else ""
+    
+    def _safe_entry(self, path: str) -> Optional[Path]:
+        """与 _safe_path 相同，但不解析最后一级的符号链接（复制、移动的是链接本身）"""
+        if not path or path.endswith('/'):
+            return None
+        parent = self._safe_path(os.path.dirname(path))
+        name = os.path.basename(path)
+        if parent is None or name in ('', '.', '..'):
+            return None
+        return parent / name
+    
+    def _remove_path(self, path: str, cancel: Optional[threading.Event] = None,
+                     progress: Optional[WalkProgress] = None):
+        """删除文件、链接或目录树（清理不完整的复制目标、移动后删除源、批量删除）"""
+        if os.path.isdir(path) and not os.path.islink(path):
+            self._remove_tree(Path(path), cancel, progress)
+        else:
+            os.unlink(path)
+            if progress is not None:
+                progress.files += 1
+    
+    def _estimate(self, roots: List[Path]) -> Optional[Dict]:
+        """由目录大小索引估计任务的总文件数和字节数，有目录尚未索引时返回 None"""
+        files, size = 0, 0
+        for root in roots:
+            if root.is_dir() and not root.is_symlink():
+                summary = self.size_index.query(self._rel(root))
+                if summary is None:
+                    return None
+                files += summary["file_count"]
+                size += summary["size_bytes"]
+            else:
+                files += 1
+                size += root.lstat().st_size
+        return {"files": files, "bytes": size}
+    
+    def submit_job(self, job_type: str, paths: List[str], dest: Optional[str] = None,
+                   fmt: str = 'zip', level: Optional[str] = None) -> Dict:
+        """
+        提交后台任务，参数在此同步校验，任务在后台线程池中执行
+        :param job_type: delete、copy、move 或 archive（打包为服务器上的文件）
+        :param paths: 要处理的路径列表
+        :param dest: 目标目录（copy、move、archive）
+        :param fmt: 打包格式（archive）
+        :param level: 压缩级别（archive）
+        :return: 任务状态（status 202），通过 /api/jobs/<id> 查询进度和结果
+        """
+        if job_type not in ('delete', 'copy', 'move', 'archive'):
+            return {"success": False, "message": f"不支持的任务类型: {job_type}", "status": 400}
+        if not paths or not isinstance(paths, list) or not all(isinstance(p, str) and p for p in paths):
+            return {"success": False, "message": "paths 必须为非空的路径列表", "status": 400}
+        
+        roots: List[Path] = []
+        for path in paths:
+            safe_path = self._safe_entry(path) if job_type in ('copy', 'move') else self._safe_path(path)
+            if not safe_path or not os.path.lexists(safe_path):
+                return {"success": False, "message": f"路径不存在: {path}", "status": 404}
+            if safe_path == self.base_path:
+                return {"success": False, "message": "不能操作根目录", "status": 400}
+            if safe_path not in roots:
+                roots.append(safe_path)
+        params = {"paths": [self._rel(root) for root in roots]}
+        
+        target_dir = None
+        if job_type != 'delete':
+            target_dir = self._safe_path(dest or '')
+            if dest is None or not target_dir or not target_dir.is_dir():
+                return {"success": False, "message": "目标目录不存在或不安全", "status": 400}
+            params["dest"] = self._rel(target_dir)
+        
+        if job_type == 'delete':
+            run = self._delete_job(roots)
+        elif job_type == 'archive':
+            for root in roots:
+                # 打包结果先写入目标目录中的临时文件，目标在被打包的目录中时会把未完成的输出一起打包
+                if root.is_dir() and (target_dir == root or root in target_dir.parents):
+                    return {"success": False, "message": f"不能把打包结果保存到被打包的目录 {root.name} 或其子目录中",
+                            "status": 400}
+            result = self.archive(params["paths"], fmt, level)
+            if not result["success"]:
+                return result
+            result["stream"].close()
+            target = target_dir / result["filename"]
+            if os.path.lexists(target):
+                return {"success": False, "message": f"目标已存在: {result['filename']}", "status": 409}
+            params.update({"format": fmt, "level": level, "filename": result["filename"]})
+            run = self._archive_job(params["paths"], fmt, level, target)
+        else:
+            targets = []
+            for root in roots:
+                target = target_dir / root.name
+                if os.path.lexists(target) or target in targets:
+                    return {"success": False, "message": f"目标已存在: {root.name}", "status": 409}
+                if root.is_dir() and not root.is_symlink() and (target_dir == root or root in target_dir.parents):
+                    return {"success": False, "message": f"不能把 {root.name} 复制或移动到自身或其子目录中", "status": 400}
+                targets.append(target)
+            run = self._copy_job(list(zip(roots, targets)), job_type == 'move')
+        return self.jobs.submit(job_type, params, run, self._estimate(roots))
+    
+    def _delete_job(self, roots: List[Path]):
+        def run(job) -> Dict:
+            deleted = 0
+            for root in roots:
+                job.progress.current = str(root)
+                is_dir = root.is_dir()
+                result = self.delete_item(self._rel(root), job.cancel, job.progress)
+                if not result["success"]:
+                    if job.cancel.is_set():
+                        raise WalkCancelled()
+                    return {"success": False, "message": f"{self._rel(root)}: {result['message']}", "deleted": deleted}
+                if not is_dir:
+                    job.progress.files += 1
+                deleted += 1
+            return {"success": True, "message": f"已删除 {deleted} 项", "deleted": deleted}
+        return run
+    
+    def _copy_job(self, pairs: List[tuple], move: bool):
+        operation, action = (move_item, "移动") if move else (copy_item, "复制")
+        
+        def run(job) -> Dict:
+            done, errors = 0, []
+            try:
+                for source, target in pairs:
+                    if job.cancel.is_set():
+                        raise WalkCancelled()
+                    try:
+                        errors += operation(str(source), str(target), self._remove_path, job.cancel, job.progress)
+                    except FileExistsError:
+                        # 提交时检查过，任务排队期间目标被创建
+                        return {"success": False, "message": f"目标已存在: {target.name}", "done": done}
+                    done += 1
+            finally:
+                for source, target in pairs:
+                    self.listing_cache.invalidate(str(source), recursive=True)
+                    self.listing_cache.invalidate(str(source.parent))
+                    self.listing_cache.invalidate(str(target.parent))
+            if errors:
+                return {"success": False, "message": f"{action}完成，但有 {job.progress.errors} 个条目失败",
+                        "done": done, "errors": errors}
+            return {"success": True, "message": f"已{action} {done} 项", "done": done}
+        return run
+    
+    def _archive_job(self, paths: List[str], fmt: str, level: Optional[str], target: Path):
+        def run(job) -> Dict:
+            result = self.archive(paths, fmt, level, job.cancel, job.progress)
+            if not result["success"]:
+                # 提交之后路径被删除等情况
+                result.pop("status", None)
+                return result
+            stream = result["stream"]
+            temp_path = str(target.parent / f".archive-{job.id}.part")
+            try:
+                with open(temp_path, 'xb') as f:
+                    for data in stream:
+                        f.write(data)
+                if not commit_file(temp_path, str(target), overwrite=False):
+                    return {"success": False, "message": f"目标已存在: {target.name}"}
+            finally:
+                stream.close()
+                try:
+                    os.unlink(temp_path)
+                except FileNotFoundError:
+                    pass
+            self.listing_cache.invalidate(str(target.parent))
+            return {"success": True, "message": f"已打包为 {target.name}", "path": self._rel(target),
+                    "size": target.stat().st_size}
+        return run
+    
+    def _resolve_batch(self, operations: List[Dict]) -> tuple:
+        """
+        解析批次中所有操作的路径，并在虚拟视图上按顺序模拟执行
+        :return: (步骤列表, 路径不安全的错误列表, 每个操作预检失败的原因或 None)
+        """
+        steps, invalid = [], []
+        for index, operation in enumerate(operations):
+            op, path = operation["op"], operation["path"]
+            step = dict(operation)
+            if op == 'chmod':
+                source = self._safe_path(path)
+            else:
+                source = self._safe_entry(path)
+            if source is None or source == self.base_path:
+                invalid.append(f"第 {index + 1} 个操作: 路径不安全: {path}")
+                continue
+            step["source"] = str(source)
+            if op == 'rename':
+                step["target"] = str(source.parent / operation["new_name"])
+            elif op == 'move':
+                dest = self._safe_path(operation["dest"])
+                if dest is None:
+                    invalid.append(f"第 {index + 1} 个操作: 目标目录不安全: {operation['dest']}")
+                    continue
+                step["dest_dir"] = str(dest)
+                step["target"] = str(dest / source.name)
+            elif op == 'mkdir':
+                step["target"] = step.pop("source")
+            steps.append(step)
+        if invalid:
+            return steps, invalid, []
+        
+        plan = BatchPlan()
+        predicted: List[Optional[str]] = []
+        for step in steps:
+            op, source, target = step["op"], step.get("source"), step.get("target")
+            error = None
+            if op == 'mkdir':
+                if not plan.is_dir(os.path.dirname(target)):
+                    error = "父目录不存在"
+                elif plan.exists(target):
+                    error = "目录已存在"
+                else:
+                    plan.create(target)
+            elif not plan.exists(source):
+                error = "文件或目录不存在"
+            elif op == 'delete':
+                plan.remove(source)
+            elif op in ('rename', 'move'):
+                if op == 'move' and not plan.is_dir(step["dest_dir"]):
+                    error = "目标目录不存在"
+                elif plan.exists(target):
+                    error = "目标已存在"
+                elif plan.is_real_dir(source) and (target + os.sep).startswith(source + os.sep):
+                    error = "不能移动到自身或其子目录中"
+                else:
+                    plan.move(source, target)
+            predicted.append(error)
+        return steps, [], predicted
+    
+    def _batch_step(self, index: int, step: Dict, tx: Optional[BatchTransaction],
+                    cancel: Optional[threading.Event], progress: WalkProgress) -> Dict:
+        """执行批次中的一个操作；atomic 模式下（tx 不为 None）同时登记撤销和收尾函数；失败时抛出 OSError"""
+        op, source, target = step["op"], step.get("source"), step.get("target")
+        if op == 'mkdir':
+            os.mkdir(target)
+            if tx is not None:
+                tx.on_undo(index, lambda: os.rmdir(target))
+            return {"success": True, "message": "目录创建成功", "new_path": self._rel(Path(target))}
+        if op == 'chmod':
+            old_mode = stat.S_IMODE(os.stat(source).st_mode)
+            os.chmod(source, step["mode"])
+            if tx is not None:
+                tx.on_undo(index, lambda: os.chmod(source, old_mode))
+            return {"success": True, "message": "权限已修改", "mode": format(step["mode"], '04o')}
+        
+        if not os.path.lexists(source):
+            raise FileNotFoundError(errno.ENOENT, "文件或目录不存在", source)
+        if op == 'delete':
+            if tx is None:
+                self._remove_path(source, cancel, progress)
+            else:
+                # 先改名暂存，全部操作成功后再删除
+                staged = self._stage(index, source, tx)
+                tx.on_commit(lambda: self._remove_path(staged, progress=progress))
+            return {"success": True, "message": "删除成功"}
+        
+        if os.path.lexists(target):
+            raise FileExistsError(errno.EEXIST, "目标已存在", target)
+        result = {"success": True, "message": "重命名成功" if op == 'rename' else "移动成功",
+                  "new_path": self._rel(Path(target))}
+        if op == 'move' and tx is None:
+            errors = move_item(source, target, self._remove_path, cancel, progress)
+            if errors:
+                return {"success": False, "message": f"移动完成，但有 {len(errors)} 个条目失败，已保留源",
+                        "errors": errors}
+            return result
+        try:
+            # 预检之后目标可能被其他进程创建，不能静默替换
+            rename_noreplace(source, target)
+            progress.files += 1
+            if tx is not None:
+                tx.on_undo(index, lambda: rename_noreplace(target, source))
+            return result
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+        # atomic 模式下跨文件系统移动：源暂存后复制，全部操作成功后再删除暂存的源
+        staged = self._stage(index, source, tx)
+        errors = copy_item(staged, target, self._remove_path, cancel, progress)
+        if errors:
+            self._remove_path(target)
+            return {"success": False, "message": f"有 {len(errors)} 个条目无法复制", "errors": errors}
+        tx.on_undo(index, lambda: self._remove_path(target))
+        tx.on_commit(lambda: self._remove_path(staged))
+        return result
+    
+    @staticmethod
+    def _stage(index: int, source: str, tx: BatchTransaction) -> str:
+        staged = stage_path(source)
+        os.rename(source, staged)
+        tx.on_undo(index, lambda: os.rename(staged, source))
+        return staged
+    
+    @staticmethod
+    def _os_error_message(e: OSError) -> str:
+        if isinstance(e, PermissionError):
+            return "无权限"
+        if isinstance(e, FileNotFoundError):
+            return "文件或目录不存在"
+        if isinstance(e, FileExistsError):
+            return "目标已存在"
+        if e.errno == errno.ENOTEMPTY:
+            return "目录不为空"
+        return e.strerror or str(e)
+    
+    def _run_batch(self, steps: List[Dict], predicted: List[Optional[str]], atomic: bool,
+                   cancel: Optional[threading.Event] = None, progress: Optional[WalkProgress] = None) -> Dict:
+        """按顺序执行批次，返回与操作一一对应的结果数组"""
+        progress = progress if progress is not None else WalkProgress()
+        results = [{"index": index, "op": step["op"], "path": step["path"]} for index, step in enumerate(steps)]
+        tx = BatchTransaction() if atomic else None
+        failed_at, cancelled, cleanup_errors = None, False, []
+        touched = set()
+        try:
+            for index, step in enumerate(steps):
+                result = results[index]
+                if cancel is not None and cancel.is_set():
+                    cancelled = True
+                if cancelled or predicted[index]:
+                    result.update(success=False, message="已取消，未执行" if cancelled else predicted[index])
+                    if atomic:
+                        failed_at = index
+                        break
+                    continue
+                progress.current = step.get("source") or step["target"]
+                for path in (step.get("source"), step.get("target")):
+                    if path:
+                        touched.add(path)
+                try:
+                    result.update(self._batch_step(index, step, tx, cancel, progress))
+                except WalkCancelled:
+                    cancelled = True
+                    result.update(success=False, message="已取消" if atomic else "已取消，部分内容可能已被删除")
+                except OSError as e:
+                    result.update(success=False, message=self._os_error_message(e))
+                if not result["success"] and atomic:
+                    failed_at = index
+                    break
+            
+            if atomic and failed_at is None:
+                cleanup_errors = tx.commit()
+            elif atomic:
+                rollback_errors = tx.rollback()
+                for result in results[:failed_at]:
+                    result.pop("new_path", None)
+                    if result["index"] in rollback_errors:
+                        result.update(success=False, rolled_back=False,
+                                      message=f"已执行，撤销失败: {rollback_errors[result['index']]}")
+                    else:
+                        result.update(success=False, rolled_back=True, message="已执行，已撤销")
+                for result in results[failed_at + 1:]:
+                    result.update(success=False, message="未执行")
+        finally:
+            for path in touched:
+                self.listing_cache.invalidate(path, recursive=True)
+                self.listing_cache.invalidate(os.path.dirname(path))
+        
+        failed = [result for result in results if not result["success"]]
+        summary = {
+            "success": not failed and not cancelled,
+            "atomic": atomic,
+            "results": results,
+            "succeeded": len(results) - len(failed),
+            "failed": len(failed)
+        }
+        if atomic and failed_at is not None:
+            summary["rolled_back"] = True
+            summary["message"] = "已取消，已撤销已执行的操作" if cancelled else \
+                f"第 {failed_at + 1} 个操作失败（{results[failed_at]['message']}），已撤销之前的操作"
+        elif failed:
+            summary["message"] = f"完成 {summary['succeeded']} 个操作，{len(failed)} 个失败"
+        else:
+            summary["message"] = f"已完成 {len(results)} 个操作"
+        summary["errors"] = [f"{result['path']}: {result['message']}" for result in failed
+                             if not result.get("rolled_back") and result["message"] != "未执行"][:MAX_REPORTED_ERRORS]
+        summary["errors"] += cleanup_errors
+        if cleanup_errors:
+            logger.warning(f"批量删除后有暂存条目未能删除: {cleanup_errors}")
+        return summary
+    
+    def batch(self, operations: list, atomic: bool = False, run_async: bool = False) -> Dict:
+        """
+        批量执行文件操作（delete、rename、mkdir、move、chmod），按顺序执行并返回与操作一一对应的结果
+        :param operations: 操作列表，格式见 file_batch.normalize_operations
+        :param atomic: 全部成功或全部不执行：预检失败时不执行任何操作，执行中失败时撤销已执行的操作
+        :param run_async: 作为后台任务执行（status 202），结果数组为任务的 result
+        :return: 操作结果；atomic 批次未能执行时 status 为 409
+        """
+        try:
+            operations = normalize_operations(operations)
+        except ValueError as e:
+            return {"success": False, "message": str(e), "status": 400}
+        steps, invalid, predicted = self._resolve_batch(operations)
+        if invalid:
+            return {"success": False, "message": invalid[0], "errors": invalid[:MAX_REPORTED_ERRORS], "status": 400}
+        
+        if atomic and any(predicted):
+            results = [{"index": index, "op": step["op"], "path": step["path"], "success": False,
+                        "message": predicted[index] or "未执行"} for index, step in enumerate(steps)]
+            failed = [result for result in results if predicted[result["index"]]]
+            return {"success": False, "message": f"预检发现 {len(failed)} 个操作无法执行，未执行任何操作",
+                    "atomic": True, "results": results, "succeeded": 0, "failed": len(results),
+                    "errors": [f"{result['path']}: {result['message']}" for result in failed][:MAX_REPORTED_ERRORS],
+                    "status": 409}
+        
+        if run_async:
+            params = {"paths": [step["path"] for step in steps], "operations": operations, "atomic": atomic}
+            deletes = [Path(step["source"]) for index, step in enumerate(steps)
+                       if step["op"] == 'delete' and not predicted[index]]
+            # 只有全部为删除时才能由目录大小索引估计进度
+            total = self._estimate(deletes) if len(deletes) == len(steps) else None
+            return self.jobs.submit('batch', params,
+                                    lambda job: self._run_batch(steps, predicted, atomic, job.cancel, job.progress),
+                                    total)
+        
+        result = self._run_batch(steps, predicted, atomic)
+        if atomic and not result["success"]:
+            result["status"] = 409
+        return result
+    
+    def upload_init(self, path: str, filename: str, size: int, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                    overwrite: bool = False, create_dirs: bool = False) -> Dict:
+        """
+        创建分块上传会话（之后按偏移量上传分块，最后调用 upload_finalize）
+        :param path: 目标目录
+        :param filename: 文件名
+        :param size: 文件总大小（字节）
+        :param chunk_size: 建议的分块大小（字节）
+        :param overwrite: 目标文件已存在时是否覆盖
+        :param create_dirs: 目标目录不存在时是否逐级创建（上传文件夹时使用）
+        :return: 会话状态，包含 upload_id 和已接收的区间
+        """
+        if not filename or filename in ('.', '..') or any(c in filename for c in '/\\\0'):
+            return {"success": False, "message": "文件名包含非法字符", "status": 400}
+        if size < 0 or chunk_size <= 0:
+            return {"success": False, "message": "文件大小和分块大小无效", "status": 400}
+        safe_path = self._safe_path(path)
+        if not safe_path:
+            return {"success": False, "message": "目标路径不存在或不安全", "status": 400}
+        try:
+            if create_dirs and not safe_path.exists():
+                safe_path.mkdir(parents=True, exist_ok=True)
+                self.listing_cache.invalidate(str(safe_path.parent))
+            if not safe_path.is_dir():
+                return {"success": False, "message": "目标路径不存在或不安全", "status": 400}
+            return self.uploads.create(safe_path, filename, size, chunk_size, overwrite)
+        except PermissionError:
+            return {"success": False, "message": "无权限在目标目录中创建文件", "status": 403}
+    
+    def upload_batch(self, path: str, files: List[tuple], overwrite: bool = False) -> Dict:
+        """
+        在一个请求中上传多个小文件（每个文件先写入临时文件再原子改名）
+        :param path: 目标目录
+        :param files: [(相对目标目录的文件路径, 内容流)]，路径中的子目录不存在时逐级创建
+        :param overwrite: 目标文件已存在时是否覆盖
+        :return: 每个文件的结果（results），部分文件失败时整体仍为成功，由调用方按结果重试或提示
+        """
+        if not files:
+            return {"success": False, "message": "没有文件被上传", "status": 400}
+        if len(files) > MAX_BATCH_FILES:
+            return {"success": False, "message": f"单次最多上传 {MAX_BATCH_FILES} 个文件", "status": 413}
+        safe_dir = self._safe_path(path)
+        if not safe_dir or not safe_dir.is_dir():
+            return {"success": False, "message": "目标路径不存在或不安全", "status": 400}
+        rel_dir = str(safe_dir.relative_to(self.base_path)) if safe_dir != self.base_path else ""
+        
+        results = []
+        for rel_path, stream in files:
+            parts = rel_path.split('/') if rel_path else ['']
+            target = None
+            if not any(p in ('', '.', '..') or '\\' in p or '\0' in p for p in parts):
+                target = self._safe_path(os.path.join(rel_dir, *parts))
+            if target is None:
+                results.append({"path": rel_path, "success": False, "message": "文件名包含非法字符"})
+                continue
+            try:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                if store_file(stream, str(target), overwrite):
+                    results.append({"path": rel_path, "success": True})
+                else:
+                    results.append({"path": rel_path, "success": False, "message": "文件已存在"})
+            except PermissionError:
+                results.append({"path": rel_path, "success": False, "message": "无权限写入"})
+            except OSError as e:
+                logger.error(f"批量上传 {rel_path} 失败: {e}")
+                results.append({"path": rel_path, "success": False, "message": f"写入失败: {e.strerror or e}"})
+        self.listing_cache.invalidate(str(safe_dir), recursive=True)
+        uploaded = sum(1 for r in results if r["success"])
+        return {"success": True, "uploaded": uploaded, "failed": len(results) - uploaded, "results": results}
+    
+    def upload_finalize(self, upload_id: str, sha256: Optional[str] = None) -> Dict:
+        """
+        完成分块上传：校验后原子改名为目标文件
+        :param upload_id: 会话ID
+        :param sha256: 整个文件的 SHA-256（十六进制），提供时校验
+        :return: 结果
+        """
+        result = self.uploads.finalize(upload_id, sha256)
+        if result["success"]:
+            self.listing_cache.invalidate(str((self.base_path / result["path"]).parent))
+        return result
+    
     def rename_item(self, path: str, new_name: str) -> Dict:
         """
         重命名文件或目录
@@ -223,6 +913,8 @@ class FileManager:
         
         try:
             safe_path.rename(new_path)
+            self.listing_cache.invalidate(str(safe_path), recursive=True)
+            self.listing_cache.invalidate(str(safe_path.parent))
             return {
                 "success": True, 
                 "message": "重命名成功",
@@ -247,49 +939,67 @@ class FileManager:
             size /= 1024.0
         return f"{size:.2f} PB"
     
-    def get_directory_stats(self, path: str = "") -> Dict:
+    def get_directory_stats(self, path: str = "", depth: int = 0) -> Dict:
         """
-        获取目录统计信息
+        获取目录统计信息（读取目录大小索引，不遍历目录树）
         :param path: 目录路径
-        :return: 包含统计信息的字典
+        :param depth: 同时返回几层子目录的大小（0~MAX_DEPTH），用于绘制占用分布图
+        :return: 包含统计信息的字典；stale 为真表示索引中该子树还有待重扫的目录，as_of 为数据对应的时间
         """
+        if not 0 <= depth <= MAX_DEPTH:
+            return {"success": False, "message": f"depth 必须在 0 到 {MAX_DEPTH} 之间"}
         safe_path = self._safe_path(path)
         if not safe_path or not safe_path.exists():
             return {"success": False, "message": "路径不存在"}
         
         try:
-            total_size = 0
-            file_count = 0
-            dir_count = 0
-            
-            def _count_items_recursive(item_path: Path):
-                nonlocal total_size, file_count, dir_count
-                for sub_item in item_path.iterdir():
-                    try:
-                        if sub_item.is_file():
-                            file_count += 1
-                            total_size += sub_item.stat().st_size
-                        elif sub_item.is_dir():
-                            dir_count += 1
-                            _count_items_recursive(sub_item)  # 递归遍历子目录
-                    except PermissionError:
-                        # 跳过无法访问的文件/目录
-                        continue
-            
+            rel_path = str(safe_path.relative_to(self.base_path)) if safe_path != self.base_path else ""
             if safe_path.is_file():
-                file_count = 1
-                total_size = safe_path.stat().st_size
-            else:
-                _count_items_recursive(safe_path)
+                size = safe_path.stat().st_size
+                return {
+                    "success": True,
+                    "path": rel_path,
+                    "file_count": 1,
+                    "directory_count": 0,
+                    "total_items": 1,
+                    "size": self.format_size(size),
+                    "size_bytes": size,
+                    "as_of": time.time(),
+                    "stale": False,
+                    "indexed": True
+                }
+            
+            summary = self.size_index.query(rel_path, depth)
+            if summary is None or summary["stale"]:
+                # 尚未索引或结果过时，让后台优先扫描这个子树
+                self.size_index.prioritize(rel_path)
+            if summary is None:
+                return {
+                    "success": True,
+                    "path": rel_path,
+                    "file_count": 0,
+                    "directory_count": 0,
+                    "total_items": 0,
+                    "size": self.format_size(0),
+                    "size_bytes": 0,
+                    "as_of": None,
+                    "stale": True,
+                    "indexed": False
+                }
             
             return {
                 "success": True,
-                "path": str(safe_path.relative_to(self.base_path)),
-                "file_count": file_count,
-                "directory_count": dir_count,
-                "total_items": file_count + dir_count,
-                "size": self.format_size(total_size),
-                "size_bytes": total_size
+                "path": rel_path,
+                "file_count": summary["file_count"],
+                "directory_count": summary["directory_count"],
+                "total_items": summary["file_count"] + summary["directory_count"],
+                "size": self.format_size(summary["size_bytes"]),
+                "size_bytes": summary["size_bytes"],
+                "files_size_bytes": summary["files_size_bytes"],
+                "as_of": summary["as_of"],
+                "stale": summary["stale"],
+                "indexed": True,
+                **({"children": summary["children"]} if "children" in summary else {})
             }
             
         except PermissionError:
@@ -298,6 +1008,112 @@ class FileManager:
             logger.error(f"获取统计信息失败: {e}")
             return {"success": False, "message": f"获取统计信息失败: {str(e)}"}
     
+    def search(self, q: str, path: str = "", entry_type: Optional[str] = None, min_size: Optional[int] = None,
+               modified_after: Optional[float] = None, limit: int = 100, cursor: Optional[str] = None) -> Dict:
+        """
+        按文件名搜索（不区分大小写的子串匹配，读取后台维护的文件名索引）
+        :param q: 查询字符串
+        :param path: 搜索范围（目录路径）
+        :param entry_type: 只返回 file 或 directory
+        :param min_size: 最小文件大小（字节）
+        :param modified_after: 只返回修改时间晚于该时间戳的条目
+        :param limit: 每页条目数
+        :param cursor: 上一页返回的 next_cursor
+        :return: 搜索结果；stale 为真表示索引尚未完成该目录的扫描，结果可能不完整
+        """
+        if not q:
+            return {"success": False, "message": "搜索关键字不能为空"}
+        if entry_type not in (None, 'file', 'directory'):
+            return {"success": False, "message": "无效的类型，仅支持 'file' 或 'directory'"}
+        if not 1 <= limit <= MAX_SEARCH_LIMIT:
+            return {"success": False, "message": f"limit 必须在 1 到 {MAX_SEARCH_LIMIT} 之间"}
+        safe_path = self._safe_path(path)
+        if not safe_path or not safe_path.is_dir():
+            return {"success": False, "message": "搜索路径不存在或不是目录"}
+        
+        try:
+            rel_path = str(safe_path.relative_to(self.base_path)) if safe_path != self.base_path else ""
+            result = self.search_index.search(q, rel_path, entry_type, min_size, modified_after, limit, cursor)
+            if result["success"]:
+                summary = self.size_index.query(rel_path)
+                result["stale"] = summary is None or summary["stale"]
+                result["query"] = q
+                result["path"] = rel_path
+            return result
+        except Exception as e:
+            logger.error(f"搜索失败: {e}")
+            return {"success": False, "message": f"搜索失败: {str(e)}"}
+    
+    def search_content(self, q: str, path: str = "", limit: int = 200) -> Dict:
+        """
+        搜索文本文件内容（不区分大小写的子串匹配）
+        已索引的文件读取后台维护的内容索引，尚未索引的文件在进程池中直接扫描
+        :param q: 查询字符串
+        :param path: 搜索范围（目录路径）
+        :param limit: 最多返回的匹配行数
+        :return: 参数校验结果；成功时 events 为 (事件名, 数据) 的生成器，依次产生 match 事件和最后的 done 事件
+        """
+        if not q:
+            return {"success": False, "message": "搜索关键字不能为空"}
+        if not 1 <= limit <= MAX_CONTENT_RESULTS:
+            return {"success": False, "message": f"limit 必须在 1 到 {MAX_CONTENT_RESULTS} 之间"}
+        safe_path = self._safe_path(path)
+        if not safe_path or not safe_path.is_dir():
+            return {"success": False, "message": "搜索路径不存在或不是目录"}
+        
+        rel_path = str(safe_path.relative_to(self.base_path)) if safe_path != self.base_path else ""
+        summary = self.size_index.query(rel_path)
+        
+        def events():
+            # 目录大小索引还没有扫描过该目录时，文件清单中没有它的文件，整体扫描
+            for event, data in self.content_index.search(q, rel_path, limit, scan_all=summary is None):
+                if event == 'done':
+                    data.update(query=q, path=rel_path, stale=summary is None or summary["stale"])
+                yield event, data
+        
+        return {"success": True, "events": events()}
+    
+    def archive(self, paths: List[str], fmt: str = 'zip', level: Optional[str] = None,
+                cancel: Optional[threading.Event] = None, progress: Optional[WalkProgress] = None) -> Dict:
+        """
+        打包下载文件或目录（边遍历边压缩，不生成临时文件）
+        :param paths: 要打包的路径列表（多选时为同一目录下的多个条目）
+        :param fmt: 打包格式 zip、tar.gz 或 tar.zst
+        :param level: 压缩级别，未指定时使用该格式的默认级别
+        :param cancel: 取消标志（打包到服务器的后台任务使用）
+        :param progress: 进度对象
+        :return: 参数校验结果；成功时 stream 为数据块生成器，filename 和 mimetype 用于响应头
+        """
+        if fmt not in ARCHIVE_FORMATS:
+            return {"success": False, "message": f"不支持的打包格式: {fmt}", "status": 400}
+        if fmt == 'tar.zst' and zstandard is None:
+            return {"success": False, "message": "未安装 zstandard，无法生成 tar.zst", "status": 400}
+        mimetype, extension, _, low, high = ARCHIVE_FORMATS[fmt]
+        compress_level = parse_level(fmt, level)
+        if compress_level is None:
+            return {"success": False, "message": f"压缩级别必须在 {low} 到 {high} 之间", "status": 400}
+        if not paths:
+            return {"success": False, "message": "路径不能为空", "status": 400}
+        
+        roots = []
+        for path in paths:
+            safe_path = self._safe_path(path)
+            if not safe_path or not safe_path.exists():
+                return {"success": False, "message": f"路径不存在: {path}", "status": 404}
+            if str(safe_path) not in roots:
+                roots.append(str(safe_path))
+        
+        if len(roots) == 1:
+            name = Path(roots[0]).name
+        else:
+            name = Path(os.path.commonpath([os.path.dirname(root) for root in roots])).name or 'download'
+        return {
+            "success": True,
+            "stream": stream_archive(roots, fmt, compress_level, cancel, progress),
+            "filename": name + extension,
+            "mimetype": mimetype
+        }
+    
     def read_file_content(self, path: str, max_size: Optional[int] = None) -> Dict:
         """
         读取文件内容
@@ -305,13 +1121,6 @@ class FileManager:
         :param max_size: 最大大小限制（如果提供，则覆盖实例的默认限制）
         :return: 包含文件内容的字典
         """
-        allowed_text_extensions = {
-            '.txt', '.py', '.js', '.html', '.htm', '.css', '.json', '.xml', 
-            '.md', '.csv', '.log', '.ini', '.cfg', '.yml', '.yaml', '.sh',
-            '.sql', '.ts', '.tsx', '.jsx', '.vue', '.dart', '.go', '.java',
-            '.cpp', '.c', '.h', '.hpp', '.rb', '.php', '.pl', '.pm'
-        }
-        
         if max_size is None:
             max_size = self.max_file_size
         
@@ -335,89 +1144,213 @@ class FileManager:
             
             # 检查文件扩展名，只允许显示文本文件
             file_ext = safe_path.suffix.lower()
-            if file_ext not in allowed_text_extensions:
+            if file_ext not in TEXT_EXTENSIONS:
                 # 对于非文本文件，返回文件信息而不是内容
                 return {
                     "success": False,
-                    "message": f"不支持的文件类型: {file_ext}，仅支持以下文本类型: {', '.join(sorted(allowed_text_extensions))}",
+                    "message": f"不支持的文件类型: {file_ext}，仅支持以下文本类型: {', '.join(sorted(TEXT_EXTENSIONS))}",
                     "type": "unsupported",
                     "file_info": self._get_file_info(safe_path)
                 }
             
-            # 尝试以文本模式读取文件
-            try:
-                with open(safe_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-                return {
-                    "success": True,
-                    "content": content,
-                    "type": "text",
-                    "lines": len(content.splitlines()),
-                    "size": self.format_size(len(content.encode('utf-8')))
-                }
-            except UnicodeDecodeError:
-                # 如果不是UTF-8编码，尝试其他常见编码
-                for encoding in ['gbk', 'gb2312', 'latin-1']:
-                    try:
-                        with open(safe_path, "r", encoding=encoding) as f:
-                            content = f.read()
-                        return {
-                            "success": True,
-                            "content": content,
-                            "type": "text",
-                            "encoding": encoding,
-                            "lines": len(content.splitlines()),
-                            "size": self.format_size(len(content.encode('utf-8')))
-                        }
-                    except UnicodeDecodeError:
-                        continue
-                
-                # 如果所有编码都失败，返回二进制文件信息
+            # 只读取一次，根据开头的样本检测编码后解码
+            with open(safe_path, "rb") as f:
+                data = f.read()
+                etag = file_etag(os.fstat(f.fileno()))
+            encoding = detect_encoding(data[:SAMPLE_BYTES], at_eof=len(data) <= SAMPLE_BYTES)
+            if encoding is None:
                 return {
                     "success": False,
                     "message": "文件为二进制格式或不支持的编码，无法预览",
                     "type": "binary",
                     "file_info": self._get_file_info(safe_path)
                 }
+            try:
+                content = data.decode(encoding)
+            except UnicodeDecodeError:
+                # 样本之后出现了不符合该编码的字节
+                encoding = 'latin-1'
+                content = data.decode(encoding)
+            result = {
+                "success": True,
+                "content": content,
+                "type": "text",
+                "lines": data.count(b'\n') + (1 if data and not data.endswith(b'\n') else 0),
+                "size": self.format_size(len(data)),
+                # 保存时作为 base_etag，检测编辑期间文件是否被修改
+                "etag": etag
+            }
+            if encoding != 'utf-8':
+                result["encoding"] = encoding
+            return result
         except PermissionError:
             return {"success": False, "message": "无权限读取文件"}
         except Exception as e:
             logger.error(f"读取文件失败: {e}")
             return {"success": False, "message": f"读取文件失败: {str(e)}"}
     
-    def write_file_content(self, path: str, content: str, overwrite: bool = True) -> Dict:
+    def preview_file(self, path: str, offset: Optional[int] = None, line: Optional[int] = None,
+                     before: Optional[int] = None, lines: int = 500) -> Dict:
         """
-        写入文件内容
+        分段预览文本文件（不受文件大小限制）
+        :param path: 文件路径
+        :param offset: 从该字节位置所在行的下一行开始
+        :param line: 从该行开始（从1开始）
+        :param before: 读取在该字节位置之前结束的行
+        :param lines: 行数
+        :return: 窗口内容，offset/end 为窗口的字节范围，下一页和上一页分别以 offset=end 和 before=offset 请求
+        """
+        if sum(value is not None for value in (offset, line, before)) > 1:
+            return {"success": False, "message": "offset、line 和 before 只能指定一个", "status": 400}
+        if not 1 <= lines <= MAX_PREVIEW_LINES:
+            return {"success": False, "message": f"lines 必须在 1 到 {MAX_PREVIEW_LINES} 之间", "status": 400}
+        if line is not None and line < 1:
+            return {"success": False, "message": "line 必须大于0", "status": 400}
+        
+        safe_path = self._safe_path(path)
+        if not safe_path or not safe_path.is_file():
+            return {"success": False, "message": "文件不存在或无权访问", "status": 404}
+        try:
+            result = self.previewer.read(str(safe_path), offset=offset, line=line, before=before, lines=lines)
+            if not result["success"]:
+                result["file_info"] = self._get_file_info(safe_path)
+            return result
+        except PermissionError:
+            return {"success": False, "message": "无权限读取文件", "status": 403}
+        except OSError as e:
+            logger.error(f"预览文件失败: {e}")
+            return {"success": False, "message": f"预览文件失败: {str(e)}", "status": 500}
+    
+    def tail_file(self, path: str, lines: int = DEFAULT_TAIL_LINES, follow: bool = True) -> Dict:
+        """
+        跟踪文件末尾（tail -F）
+        :param path: 文件路径
+        :param lines: 开始时返回的末尾行数
+        :param follow: 是否持续返回新追加的内容
+        :return: 参数校验结果；成功时 events 为 (事件名, 数据) 的生成器
+        """
+        if not 0 <= lines <= MAX_TAIL_LINES:
+            return {"success": False, "message": f"lines 必须在 0 到 {MAX_TAIL_LINES} 之间", "status": 400}
+        safe_path = self._safe_path(path)
+        if not safe_path or not safe_path.is_file():
+            return {"success": False, "message": "文件不存在或无权访问", "status": 404}
+        try:
+            with open(safe_path, 'rb') as f:
+                sample = f.read(SAMPLE_BYTES)
+        except PermissionError:
+            return {"success": False, "message": "无权限读取文件", "status": 403}
+        encoding = detect_encoding(sample, at_eof=len(sample) < SAMPLE_BYTES)
+        if encoding is None:
+            return {"success": False, "message": "文件为二进制格式或不支持的编码，无法跟踪", "status": 400}
+        return {"success": True, "events": self.tailer.follow(str(safe_path), encoding, lines, follow)}
+    
+    def write_file_content(self, path: str, content: str, overwrite: bool = True,
+                           base_etag: Optional[str] = None, fsync: bool = True, encoding: str = 'utf-8') -> Dict:
+        """
+        写入文件内容（先写临时文件再原子改名，中途失败不会留下不完整的文件）
         :param path: 文件路径
         :param content: 要写入的内容
         :param overwrite: 是否覆盖已存在的文件
-        :return: 操作结果
+        :param base_etag: 编辑所基于的 ETag（读取文件时返回），文件已被修改时返回冲突；为 None 时不检查
+        :param fsync: 改名前是否把数据刷到磁盘
+        :param encoding: 写入的编码（读取文件时返回的编码，utf-8-sig 会写入BOM）
+        :return: 操作结果，包含新文件的 etag
         """
+        if not isinstance(encoding, str) or encoding not in SAVE_ENCODINGS:
+            return {"success": False, "message": f"不支持的编码: {encoding}", "status": 400}
         safe_path = self._safe_path(path)
         if not safe_path:
-            return {"success": False, "message": "路径不安全"}
+            return {"success": False, "message": "路径不安全", "status": 400}
         
         if safe_path.exists() and not overwrite:
-            return {"success": False, "message": "文件已存在，且不允许覆盖"}
+            return {"success": False, "message": "文件已存在，且不允许覆盖", "status": 409}
+        if safe_path.is_dir():
+            return {"success": False, "message": "不能写入目录", "status": 400}
+        try:
+            data = content.encode(encoding)
+        except UnicodeEncodeError as e:
+            return {"success": False, "message": f"内容无法用 {encoding} 编码: {str(e)}", "status": 400}
         
         try:
             # 确保父目录存在
             safe_path.parent.mkdir(parents=True, exist_ok=True)
             
-            with open(safe_path, "w", encoding="utf-8") as f:
-                f.write(content)
+            saved, st = save_content(str(safe_path), data, overwrite, base_etag, fsync)
+            if not saved:
+                return {"success": False, "message": "文件已存在，且不允许覆盖", "status": 409}
+            # 覆盖已有文件不会改变目录的 mtime
+            self.listing_cache.invalidate(str(safe_path.parent))
             
             return {
                 "success": True,
                 "message": "文件保存成功",
                 "path": str(safe_path.relative_to(self.base_path)),
-                "size": self.format_size(len(content.encode('utf-8')))
+                "size": self.format_size(len(data)),
+                "etag": file_etag(st)
             }
+        except SaveConflict as e:
+            return self._save_conflict(e)
         except PermissionError:
-            return {"success": False, "message": "无权限写入文件"}
+            return {"success": False, "message": "无权限写入文件", "status": 403}
         except Exception as e:
             logger.error(f"写入文件失败: {e}")
-            return {"success": False, "message": f"写入文件失败: {str(e)}"}
+            return {"success": False, "message": f"写入文件失败: {str(e)}", "status": 500}
+    
+    def patch_file_content(self, path: str, patches: list, base_etag: str, encoding: str = 'utf-8',
+                           fsync: bool = True) -> Dict:
+        """
+        按行区间修改文件（编辑器只发送修改过的部分），未修改的部分在内核中复制，原子保存
+        :param path: 文件路径
+        :param patches: 修改区间列表，每项为 {"start": 起始行, "end": 结束行（不含）, "content": 替换的文本}，
+                        行号从1开始，相对于 base_etag 对应的文件
+        :param base_etag: 编辑所基于的 ETag，文件已被修改时返回冲突
+        :param encoding: 读取文件时返回的编码，替换的文本按此编码写入
+        :param fsync: 改名前是否把数据刷到磁盘
+        :return: 操作结果，包含新文件的 etag 和实际写入的字节数
+        """
+        if not base_etag or not isinstance(base_etag, str):
+            return {"success": False, "message": "差异保存需要 base_etag", "status": 400}
+        if not isinstance(encoding, str) or encoding not in SAVE_ENCODINGS:
+            return {"success": False, "message": f"不支持的编码: {encoding}", "status": 400}
+        try:
+            patches = normalize_patches(patches)
+        except ValueError as e:
+            return {"success": False, "message": str(e), "status": 400}
+        safe_path = self._safe_path(path)
+        if not safe_path or not safe_path.is_file():
+            return {"success": False, "message": "文件不存在或无权访问", "status": 404}
+        
+        try:
+            st, written = apply_patches(str(safe_path), patches, encoding, base_etag, fsync)
+            self.listing_cache.invalidate(str(safe_path.parent))
+            
+            return {
+                "success": True,
+                "message": "文件保存成功",
+                "path": str(safe_path.relative_to(self.base_path)),
+                "size": self.format_size(st.st_size),
+                "etag": file_etag(st),
+                "written": written
+            }
+        except SaveConflict as e:
+            return self._save_conflict(e)
+        except (ValueError, UnicodeEncodeError) as e:
+            return {"success": False, "message": f"修改区间无效: {str(e)}", "status": 400}
+        except PermissionError:
+            return {"success": False, "message": "无权限写入文件", "status": 403}
+        except Exception as e:
+            logger.error(f"修改文件失败: {e}")
+            return {"success": False, "message": f"修改文件失败: {str(e)}", "status": 500}
+    
+    @staticmethod
+    def _save_conflict(e: SaveConflict) -> Dict:
+        return {
+            "success": False,
+            "message": "文件在编辑期间已被修改或删除，请重新加载后再保存",
+            "type": "conflict",
+            "etag": e.etag,
+            "status": 409
+        }
 
 # 创建文件管理器实例
 file_manager = FileManager(base_path="/home/bi9bjv")
\ No newline at end of file
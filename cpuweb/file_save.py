@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件保存模块
+- 原子保存：内容先写入同一目录中的临时文件（可选 fsync），再用 os.replace 改名为目标文件，
+  写入中途崩溃或磁盘写满时原文件保持不变；覆盖已有文件时保留其权限和属主
+- 差异保存：编辑器只发送修改过的行区间（patch），服务端把原文件中未修改的字节区间用
+  os.copy_file_range 在内核中复制到临时文件（btrfs/xfs 等支持 reflink 的文件系统上只共享数据块），
+  只有修改的行从用户态写入
+- 乐观并发：读取时返回 ETag（file_download.file_etag），保存时携带 base_etag，
+  文件在此期间被修改或替换时返回冲突，不覆盖别人的修改
+"""
+import os
+import stat
+import codecs
+import secrets
+import threading
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+from chunked_upload import commit_file, fsync_dir
+from file_download import file_etag
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 临时文件名前缀和后缀
+SAVE_TEMP_PREFIX = '.save-'
+SAVE_TEMP_SUFFIX = '.tmp'
+# 扫描行位置和复制数据的块大小（字节）
+SAVE_BLOCK = 1024 * 1024
+# 单次保存最多包含的修改区间数
+MAX_PATCHES = 1000
+
+# 检查 ETag 到改名之间持有，同一进程中的并发保存不会互相覆盖
+_replace_lock = threading.Lock()
+
+
+class SaveConflict(Exception):
+    """文件在编辑期间已被修改"""
+
+    def __init__(self, etag: Optional[str]):
+        super().__init__("文件已被修改")
+        self.etag = etag
+
+
+def _write_all(fd: int, data: bytes):
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def copy_range(src: int, dst: int, start: int, end: int) -> int:
+    """把 src 中 [start, end) 追加到 dst 的当前位置，优先在内核中复制；返回复制的字节数"""
+    pos = start
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while pos < end:
+                copied = os.copy_file_range(src, dst, end - pos, pos)
+                if copied == 0:
+                    break
+                pos += copied
+        except OSError:
+            # 跨文件系统、内核不支持等情况，剩余部分改为读写复制
+            pass
+    while pos < end:
+        block = os.pread(src, min(SAVE_BLOCK, end - pos), pos)
+        if not block:
+            break
+        _write_all(dst, block)
+        pos += len(block)
+    return pos - start
+
+
+def _line_offsets(fd: int, lines: List[int], start: int, size: int) -> Dict[int, int]:
+    """
+    一次顺序扫描求出各行（从1开始）的起始字节位置
+    :param start: 第1行的起始位置（跳过BOM）
+    :return: 行号 -> 字节位置；最后一个换行之后的下一行（行数+2）为文件末尾
+    :raises ValueError: 行号超出文件范围
+    """
+    wanted = sorted(set(lines))
+    offsets = {}
+    i = 0
+    while i < len(wanted) and wanted[i] == 1:
+        offsets[1] = start
+        i += 1
+    newlines = 0
+    pos = start
+    while i < len(wanted) and pos < size:
+        block = os.pread(fd, SAVE_BLOCK, pos)
+        if not block:
+            break
+        count = block.count(b'\n')
+        index, seen = -1, 0
+        # 第 k 行从第 k-1 个换行符之后开始
+        while i < len(wanted) and wanted[i] - 1 - newlines <= count:
+            while seen < wanted[i] - 1 - newlines:
+                index = block.index(b'\n', index + 1)
+                seen += 1
+            offsets[wanted[i]] = pos + index + 1
+            i += 1
+        newlines += count
+        pos += len(block)
+    for line in wanted[i:]:
+        if line != newlines + 2:
+            raise ValueError(f"行号 {line} 超出文件范围（共 {newlines + 1} 行）")
+        offsets[line] = size
+    return offsets
+
+
+def normalize_patches(patches) -> List[Tuple[int, int, str]]:
+    """
+    校验修改区间：每项为 {"start": 起始行, "end": 结束行（不含）, "content": 替换的文本}，行号从1开始，
+    start == end 表示在该行之前插入；区间按行号排列且互不重叠
+    :raises ValueError: 格式错误
+    """
+    if not isinstance(patches, list) or not patches:
+        raise ValueError("patches 必须为非空列表")
+    if len(patches) > MAX_PATCHES:
+        raise ValueError(f"单次保存最多 {MAX_PATCHES} 个修改区间")
+    result = []
+    previous_end = 1
+    for patch in patches:
+        if not isinstance(patch, dict):
+            raise ValueError("修改区间格式错误")
+        start, end, content = patch.get('start'), patch.get('end'), patch.get('content', '')
+        if not isinstance(start, int) or not isinstance(end, int) or isinstance(start, bool) or isinstance(end, bool):
+            raise ValueError("start、end 必须为整数")
+        if not isinstance(content, str):
+            raise ValueError("content 必须为字符串")
+        if start < previous_end or end < start:
+            raise ValueError("修改区间必须按行号排列且互不重叠")
+        result.append((start, end, content))
+        previous_end = end
+    return result
+
+
+def _open_temp(target: str, st: Optional[os.stat_result]) -> Tuple[str, int]:
+    """在目标目录中创建临时文件；覆盖已有文件时沿用其权限和属主"""
+    temp_path = os.path.join(os.path.dirname(target), f"{SAVE_TEMP_PREFIX}{secrets.token_hex(16)}{SAVE_TEMP_SUFFIX}")
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_CLOEXEC, 0o666)
+    if st is not None:
+        try:
+            os.fchmod(fd, stat.S_IMODE(st.st_mode))
+            if (st.st_uid, st.st_gid) != (os.getuid(), os.getgid()):
+                os.fchown(fd, st.st_uid, st.st_gid)
+        except PermissionError:
+            # 非 root 运行时无法改为其他属主，保存为当前用户的文件
+            pass
+    return temp_path, fd
+
+
+def _same_file(a: os.stat_result, b: os.stat_result) -> bool:
+    return (a.st_dev, a.st_ino, a.st_size, a.st_mtime_ns) == (b.st_dev, b.st_ino, b.st_size, b.st_mtime_ns)
+
+
+def _save(target: str, fill: Callable[[int], None], base: Optional[os.stat_result], check: bool,
+          overwrite: bool, fsync: bool) -> Tuple[bool, os.stat_result]:
+    """
+    写入临时文件后原子改名为目标文件
+    :param fill: 向临时文件描述符写入内容
+    :param base: 目标文件原来的状态（不存在时为 None），新文件沿用其权限和属主
+    :param check: 改名前目标文件已不是 base 时抛出 SaveConflict
+    :return: (是否保存，目标文件已存在且不允许覆盖时为 False, 新文件的状态)
+    """
+    temp_path, fd = _open_temp(target, base)
+    try:
+        try:
+            fill(fd)
+            if fsync:
+                os.fsync(fd)
+            st = os.fstat(fd)
+        finally:
+            os.close(fd)
+        with _replace_lock:
+            if check:
+                try:
+                    current = os.stat(target)
+                except FileNotFoundError:
+                    current = None
+                if current is None or base is None or not _same_file(current, base):
+                    raise SaveConflict(file_etag(current) if current is not None else None)
+            saved = commit_file(temp_path, target, overwrite)
+        if saved and fsync:
+            fsync_dir(os.path.dirname(target))
+    finally:
+        # 改名成功后临时文件已不存在；失败、冲突或目标已存在时删除
+        try:
+            os.unlink(temp_path)
+        except FileNotFoundError:
+            pass
+    return saved, st
+
+
+def save_content(target: str, data: bytes, overwrite: bool = True, base_etag: Optional[str] = None,
+                 fsync: bool = True) -> Tuple[bool, os.stat_result]:
+    """
+    原子地保存整个文件的内容
+    :param base_etag: 编辑所基于的 ETag，文件已被修改时抛出 SaveConflict；为 None 时不检查
+    :return: 同 _save
+    """
+    base = None
+    try:
+        base = os.stat(target)
+    except FileNotFoundError:
+        if base_etag is not None:
+            raise SaveConflict(None)
+    if base is not None and base_etag is not None and file_etag(base) != base_etag:
+        raise SaveConflict(file_etag(base))
+    return _save(target, lambda fd: _write_all(fd, data), base, base_etag is not None, overwrite, fsync)
+
+
+def apply_patches(target: str, patches: List[Tuple[int, int, str]], encoding: str, base_etag: str,
+                  fsync: bool = True) -> Tuple[os.stat_result, int]:
+    """
+    按行区间修改文件并原子保存
+    :param patches: normalize_patches 的结果，行号相对于 base_etag 对应的文件
+    :param encoding: 文件编码，替换的文本按此编码写入
+    :return: (新文件的状态, 从用户态写入的字节数)
+    :raises SaveConflict: 文件已被修改
+    :raises ValueError: 行号超出文件范围
+    """
+    src = os.open(target, os.O_RDONLY | os.O_CLOEXEC)
+    try:
+        base = os.fstat(src)
+        if file_etag(base) != base_etag:
+            raise SaveConflict(file_etag(base))
+        # BOM 不属于第1行的内容，替换的文本也不再写入 BOM
+        start = 0
+        if encoding == 'utf-8-sig':
+            start = len(codecs.BOM_UTF8) if os.pread(src, len(codecs.BOM_UTF8), 0) == codecs.BOM_UTF8 else 0
+            encoding = 'utf-8'
+        offsets = _line_offsets(src, [line for patch in patches for line in patch[:2]], start, base.st_size)
+        written = 0
+
+        def fill(fd: int):
+            nonlocal written
+            copy_range(src, fd, 0, start)
+            pos = start
+            for first, last, content in patches:
+                copy_range(src, fd, pos, offsets[first])
+                data = content.encode(encoding)
+                _write_all(fd, data)
+                written += len(data)
+                pos = offsets[last]
+            copy_range(src, fd, pos, base.st_size)
+
+        _, st = _save(target, fill, base, True, True, fsync)
+    finally:
+        os.close(src)
+    return st, written
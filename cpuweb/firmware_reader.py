@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+固件信息读取模块 - 电压、ARM实测频率、降频状态
+优先通过 /dev/vcio 邮箱接口一次ioctl批量读取（不创建子进程），
+其次使用 sysfs hwmon/cpufreq，最后在后台线程中定期调用 vcgencmd 并缓存结果，
+保证采集线程永远不会被子进程阻塞
+"""
+import os
+import glob
+import time
+import fcntl
+import ctypes
+import shutil
+import struct
+import threading
+import subprocess
+import logging
+from typing import Dict, List
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+VCIO_DEVICE = '/dev/vcio'
+
+# 邮箱属性接口 ioctl 请求码: _IOWR(100, 0, char *)
+IOCTL_MBOX_PROPERTY = (3 << 30) | (ctypes.sizeof(ctypes.c_void_p) << 16) | (100 << 8) | 0
+
+# 邮箱属性标签
+TAG_GET_VOLTAGE = 0x00030003
+TAG_GET_THROTTLED = 0x00030046
+TAG_GET_CLOCK_RATE_MEASURED = 0x00030047
+VOLTAGE_ID_CORE = 1
+CLOCK_ID_ARM = 3
+MBOX_RESPONSE_SUCCESS = 0x80000000
+
+# vcgencmd 降级方案的刷新间隔（秒）
+VCGENCMD_REFRESH_INTERVAL = 10
+
+# get_throttled 各位含义
+THROTTLED_FLAGS = {
+    0: 'under_voltage',
+    1: 'arm_freq_capped',
+    2: 'throttled',
+    3: 'soft_temp_limit',
+    16: 'under_voltage_occurred',
+    17: 'arm_freq_capped_occurred',
+    18: 'throttled_occurred',
+    19: 'soft_temp_limit_occurred',
+}
+
+
+def decode_throttled(value: int) -> List[str]:
+    """
+    将 get_throttled 位掩码解码为标志名称列表
+    :param value: 位掩码
+    :return: 已置位的标志名称
+    """
+    return [name for bit, name in THROTTLED_FLAGS.items() if value & (1 << bit)]
+
+
+class MailboxSource:
+    """通过 /dev/vcio 邮箱属性接口读取固件信息，一次ioctl返回全部数值"""
+    name = 'mailbox'
+
+    def __init__(self):
+        self._fd = os.open(VCIO_DEVICE, os.O_RDWR)
+        # 先试读一次，确认固件支持这些标签
+        try:
+            self.read()
+        except Exception:
+            os.close(self._fd)
+            raise
+
+    def read(self) -> Dict:
+        # 消息格式: [总长度, 请求码, (标签, 值缓冲区长度, 请求/响应码, 值...)*, 结束标签0]
+        words = [
+            0, 0,
+            TAG_GET_VOLTAGE, 8, 0, VOLTAGE_ID_CORE, 0,
+            TAG_GET_CLOCK_RATE_MEASURED, 8, 0, CLOCK_ID_ARM, 0,
+            TAG_GET_THROTTLED, 4, 0, 0,
+            0
+        ]
+        words[0] = len(words) * 4
+        buf = bytearray(struct.pack(f'<{len(words)}I', *words))
+        fcntl.ioctl(self._fd, IOCTL_MBOX_PROPERTY, buf, True)
+        resp = struct.unpack(f'<{len(words)}I', buf)
+        if resp[1] != MBOX_RESPONSE_SUCCESS:
+            raise OSError(f"邮箱请求失败: 0x{resp[1]:08x}")
+        return {
+            'voltage': round(resp[6] / 1000000.0, 4),  # 微伏 -> 伏
+            'arm_clock': resp[11],                     # Hz
+            'throttled': resp[15]
+        }
+
+    def close(self):
+        os.close(self._fd)
+
+
+class SysfsSource:
+    """通过 sysfs hwmon 电压传感器和 cpufreq 读取，适用于非树莓派设备"""
+    name = 'sysfs'
+
+    def __init__(self):
+        self._voltage_path = None
+        self._undervoltage_path = None
+        for hwmon in sorted(glob.glob('/sys/class/hwmon/hwmon*')):
+            hwmon_name = self._read_text(os.path.join(hwmon, 'name'))
+            if hwmon_name == 'rpi_volt':
+                alarm = os.path.join(hwmon, 'in0_lcrit_alarm')
+                if os.path.exists(alarm):
+                    self._undervoltage_path = alarm
+                continue
+            for label_path in sorted(glob.glob(os.path.join(hwmon, 'in*_label'))):
+                label = self._read_text(label_path).lower()
+                if self._voltage_path is None and ('core' in label or 'cpu' in label):
+                    self._voltage_path = label_path.replace('_label', '_input')
+        self._clock_path = next(
+            (path for path in ('/sys/devices/system/cpu/cpu0/cpufreq/cpuinfo_cur_freq',
+                               '/sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq')
+             if os.access(path, os.R_OK)),
+            None
+        )
+        if not self._voltage_path and not self._undervoltage_path:
+            raise OSError("未找到可用的 sysfs 电压传感器")
+
+    @staticmethod
+    def _read_text(path: str) -> str:
+        try:
+            with open(path, 'r') as f:
+                return f.read().strip()
+        except OSError:
+            return ''
+
+    def read(self) -> Dict:
+        voltage = self._read_text(self._voltage_path) if self._voltage_path else ''
+        clock = self._read_text(self._clock_path) if self._clock_path else ''
+        alarm = self._read_text(self._undervoltage_path) if self._undervoltage_path else ''
+        return {
+            'voltage': round(int(voltage) / 1000.0, 4) if voltage else 0,  # 毫伏 -> 伏
+            'arm_clock': int(clock) * 1000 if clock else 0,                 # kHz -> Hz
+            'throttled': 1 if alarm == '1' else 0                           # 仅能反映当前欠压
+        }
+
+    def close(self):
+        pass
+
+
+class VcgencmdSource:
+    """在后台线程中定期调用 vcgencmd，读取时只返回缓存，不阻塞调用方"""
+    name = 'vcgencmd'
+
+    def __init__(self, refresh_interval: float = VCGENCMD_REFRESH_INTERVAL):
+        if not shutil.which('vcgencmd'):
+            raise OSError("未找到 vcgencmd 命令")
+        self.refresh_interval = refresh_interval
+        self._cache = {'voltage': 0, 'arm_clock': 0, 'throttled': 0}
+        self._last_refresh = 0.0
+        self._refreshing = threading.Lock()
+
+    @staticmethod
+    def _run(*args) -> str:
+        result = subprocess.run(['vcgencmd', *args], capture_output=True, text=True, timeout=5)
+        if result.returncode != 0:
+            return ''
+        # 输出格式: volt=0.9260V / frequency(48)=1500000000 / throttled=0x0
+        return result.stdout.strip().split('=', 1)[-1]
+
+    def _refresh(self):
+        try:
+            cache = dict(self._cache)
+            voltage = self._run('measure_volts', 'core')
+            if voltage:
+                cache['voltage'] = round(float(voltage.rstrip('V')), 4)
+            clock = self._run('measure_clock', 'arm')
+            if clock:
+                cache['arm_clock'] = int(clock)
+            throttled = self._run('get_throttled')
+            if throttled:
+                cache['throttled'] = int(throttled, 16)
+            self._cache = cache
+        except Exception as e:
+            logger.debug(f"vcgencmd 读取失败: {e}")
+        finally:
+            self._last_refresh = time.time()
+            self._refreshing.release()
+
+    def read(self) -> Dict:
+        if time.time() - self._last_refresh >= self.refresh_interval and self._refreshing.acquire(blocking=False):
+            threading.Thread(target=self._refresh, daemon=True).start()
+        return self._cache
+
+    def close(self):
+        pass
+
+
+class FirmwareReader:
+    def __init__(self):
+        """初始化固件读取器，按优先级探测可用的数据源"""
+        self.source = None
+        for source_class in (MailboxSource, SysfsSource, VcgencmdSource):
+            try:
+                self.source = source_class()
+                logger.info(f"固件信息数据源: {self.source.name}")
+                break
+            except Exception as e:
+                logger.debug(f"数据源 {source_class.name} 不可用: {e}")
+        if self.source is None:
+            logger.info("未找到可用的固件信息数据源，电压和降频状态将显示为0")
+
+    def read(self) -> Dict:
+        """
+        批量读取电压、ARM实测频率和降频状态
+        :return: {'voltage': 伏, 'arm_clock': Hz, 'throttled': 位掩码}
+        """
+        if self.source is None:
+            return {'voltage': 0, 'arm_clock': 0, 'throttled': 0}
+        try:
+            return self.source.read()
+        except Exception as e:
+            logger.debug(f"读取固件信息失败: {e}")
+            return {'voltage': 0, 'arm_clock': 0, 'throttled': 0}
+
+    def measure_volts(self) -> float:
+        """获取核心电压（伏）"""
+        return self.read()['voltage']
+
+    def measure_clock(self) -> int:
+        """获取ARM实测频率（Hz）"""
+        return self.read()['arm_clock']
+
+    def get_throttled(self) -> int:
+        """获取降频/欠压状态位掩码"""
+        return self.read()['throttled']
+
+
+# 创建固件读取器实例
+firmware_reader = FirmwareReader()
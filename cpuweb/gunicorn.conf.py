@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+gunicorn 生产模式配置
+用法: gunicorn -c gunicorn.conf.py app:app
+
+- 预派生多个 gthread 工作进程，每个进程使用线程池处理请求（SSE长连接各占一个线程）
+- 主进程在派生工作进程之前创建共享内存并启动唯一的采集进程，工作进程只读取快照
+- 主进程中的监视线程在采集进程意外退出时重新派生它（gunicorn 只重启自己的工作进程）
+- 不能开启 preload_app：应用必须在工作进程中导入，才能挂载到共享内存
+"""
+import os
+
+import shared_state
+
+bind = os.environ.get('CPUWEB_BIND', '0.0.0.0:9001')
+workers = int(os.environ.get('CPUWEB_WORKERS', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('CPUWEB_THREADS', 16))
+keepalive = 5
+timeout = 60
+graceful_timeout = 10
+preload_app = False
+proc_name = 'cpuweb'
+accesslog = None
+errorlog = '-'
+
+
+def on_starting(server):
+    shared_state.start_collector()
+    server.log.info(f"共享内存 {shared_state.board.size} 字节，采集进程 PID: {shared_state.collector_pid}")
+
+
+def when_ready(server):
+    shared_state.supervise_collector()
+
+
+def post_fork(server, worker):
+    shared_state.role = 'worker'
+
+
+def on_exit(server):
+    shared_state.stop_collector()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+inotify 目录监视模块
+通过 ctypes 直接调用 libc 的 inotify 接口（不依赖第三方库），由一个后台线程读取事件并回调。
+仅在 Linux 上可用，其他平台或监视数量达到上限时 watch() 返回 False，调用方需自行降级
+"""
+import os
+import sys
+import errno
+import struct
+import ctypes
+import ctypes.util
+import threading
+import logging
+from typing import Callable, Dict, Optional
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# inotify 事件掩码（linux/inotify.h）
+IN_ACCESS = 0x00000001
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+# 目录内容或条目属性发生变化
+DIRECTORY_EVENTS = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+                    IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+_EVENT_HEADER = struct.Struct('iIII')
+# 单次读取的缓冲区大小
+READ_SIZE = 64 * 1024
+
+
+class InotifyWatcher:
+    def __init__(self, callback: Callable[[str, int, str], None], mask: int = DIRECTORY_EVENTS, name: str = 'inotify'):
+        """
+        初始化监视器（延迟到第一次 watch() 时才创建 inotify 实例和读取线程）
+        :param callback: 事件回调 callback(目录路径, 事件掩码, 条目名称)；队列溢出时以空路径和 IN_Q_OVERFLOW 调用
+        :param mask: 监视的事件掩码
+        :param name: 读取线程名称
+        """
+        self.callback = callback
+        self.mask = mask
+        self.name = name
+        self.available = sys.platform.startswith('linux')
+        self._fd: Optional[int] = None
+        self._libc = None
+        self._wd_to_path: Dict[int, str] = {}
+        self._path_to_wd: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stats = {'events': 0, 'overflows': 0, 'watch_failures': 0}
+
+    def _start(self) -> bool:
+        if self._fd is not None:
+            return True
+        if not self.available:
+            return False
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+            fd = libc.inotify_init1(IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        except (OSError, AttributeError) as e:
+            logger.info(f"inotify 不可用: {e}")
+            self.available = False
+            return False
+        self._libc = libc
+        self._fd = fd
+        threading.Thread(target=self._run, name=self.name, daemon=True).start()
+        return True
+
+    def watch(self, path: str) -> bool:
+        """
+        监视目录（重复监视同一路径是安全的）
+        :param path: 目录路径
+        :return: 是否监视成功
+        """
+        with self._lock:
+            if path in self._path_to_wd:
+                return True
+            if not self._start():
+                return False
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), self.mask | IN_ONLYDIR)
+            if wd < 0:
+                err = ctypes.get_errno()
+                self._stats['watch_failures'] += 1
+                if err == errno.ENOSPC:
+                    logger.warning("inotify 监视数量已达到上限（fs.inotify.max_user_watches）")
+                return False
+            # 同一目录（同一inode）可能以不同路径监视，只保留最新的路径
+            old_path = self._wd_to_path.get(wd)
+            if old_path is not None:
+                self._path_to_wd.pop(old_path, None)
+            self._wd_to_path[wd] = path
+            self._path_to_wd[path] = wd
+            return True
+
+    def unwatch(self, path: str):
+        """取消监视目录"""
+        with self._lock:
+            wd = self._path_to_wd.pop(path, None)
+            if wd is None:
+                return
+            self._wd_to_path.pop(wd, None)
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def is_watched(self, path: str) -> bool:
+        return path in self._path_to_wd
+
+    def stats(self) -> Dict:
+        """获取监视统计"""
+        return {'available': self.available, 'watches': len(self._path_to_wd), **self._stats}
+
+    def _run(self):
+        while True:
+            try:
+                data = os.read(self._fd, READ_SIZE)
+            except InterruptedError:
+                continue
+            except OSError as e:
+                logger.error(f"读取 inotify 事件失败: {e}")
+                return
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                raw_name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length]
+                offset += _EVENT_HEADER.size + length
+                self._stats['events'] += 1
+                if mask & IN_Q_OVERFLOW:
+                    # 事件队列溢出，部分事件已丢失，由调用方整体失效
+                    self._stats['overflows'] += 1
+                    self._dispatch('', mask, '')
+                    continue
+                with self._lock:
+                    path = self._wd_to_path.get(wd)
+                    if mask & IN_IGNORED and path is not None:
+                        # 目录被删除或监视被移除
+                        self._wd_to_path.pop(wd, None)
+                        self._path_to_wd.pop(path, None)
+                if path is not None:
+                    self._dispatch(path, mask, os.fsdecode(raw_name.rstrip(b'\0')))
+
+    def _dispatch(self, path: str, mask: int, name: str):
+        try:
+            self.callback(path, mask, name)
+        except Exception as e:
+            logger.error(f"处理 inotify 事件失败: {e}")
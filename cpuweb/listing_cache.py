@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录列表缓存模块
+缓存 os.scandir 的扫描结果（以及各排序方式下的顺序），按 (解析后的路径, 目录 st_mtime_ns, st_ino) 校验，
+LRU 淘汰并限制估算内存占用。
+
+目录的 mtime 只在条目增删改名时变化，文件内容或属性变化不会反映在目录上，
+因此在 Linux 上由 inotify 监视每个已缓存的目录并立即失效；无法监视时缓存条目只保留 UNWATCHED_TTL 秒
+"""
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from inotify_watcher import (InotifyWatcher, IN_ATTRIB, IN_CREATE, IN_DELETE, IN_MOVED_FROM, IN_MOVED_TO,
+                             IN_DELETE_SELF, IN_MOVE_SELF, IN_Q_OVERFLOW, IN_IGNORED)
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 默认内存上限（字节）
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+# 无法使用 inotify 监视的缓存条目有效期（秒）
+UNWATCHED_TTL = 5.0
+# 单条扫描结果的估算内存占用（元组 + 名称对象），以及 stat_result 的额外占用（字节）
+RECORD_BYTES = 120
+STAT_BYTES = 480
+# 每个排序顺序中每条记录的引用占用（字节）
+ORDER_BYTES = 8
+# 会改变目录自身属性（mtime、条目数）的事件，同时失效上级目录的缓存
+_PARENT_EVENTS = IN_ATTRIB | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+
+
+class ListingEntry:
+    """一个目录的缓存条目"""
+    __slots__ = ('path', 'key', 'records', 'has_stat', 'orders', 'size', 'created', 'watched')
+
+    def __init__(self, path: str, key: Tuple[int, int], records: List[tuple], has_stat: bool, watched: bool):
+        self.path = path
+        self.key = key
+        self.records = records
+        self.has_stat = has_stat
+        self.orders: Dict[Tuple[str, str], List[tuple]] = {}
+        self.size = sum(len(r[0]) for r in records) + len(records) * (RECORD_BYTES + (STAT_BYTES if has_stat else 0))
+        self.created = time.monotonic()
+        self.watched = watched
+
+
+class ListingCache:
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        初始化目录列表缓存
+        :param max_bytes: 估算内存占用上限（字节），为0时禁用缓存
+        """
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, ListingEntry]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # 正在扫描的目录 -> 扫描开始后收到的失效次数，扫描期间发生变化的结果不写入缓存
+        self._pending: Dict[str, int] = {}
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+        self._watcher = InotifyWatcher(self._on_event, name='listing-cache-inotify')
+
+    def get(self, path: str, dir_stat: os.stat_result, need_stat: bool) -> Optional[ListingEntry]:
+        """
+        查找缓存
+        :param path: 解析后的目录路径
+        :param dir_stat: 目录当前的 stat 结果
+        :param need_stat: 是否需要包含 stat 信息的扫描结果
+        :return: 有效的缓存条目，未命中时返回 None
+        """
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                expired = not entry.watched and time.monotonic() - entry.created > UNWATCHED_TTL
+                if entry.key != (dir_stat.st_mtime_ns, dir_stat.st_ino) or expired:
+                    self._remove(entry)
+                    self._stats['invalidations'] += 1
+                elif entry.has_stat or not need_stat:
+                    self._entries.move_to_end(path)
+                    self._stats['hits'] += 1
+                    return entry
+            self._stats['misses'] += 1
+            return None
+
+    def begin(self, path: str) -> int:
+        """
+        在扫描目录之前调用：先建立监视，再返回当前的失效序号交给 put()
+        :param path: 解析后的目录路径
+        :return: 失效序号
+        """
+        if self.max_bytes > 0:
+            self._watcher.watch(path)
+        with self._lock:
+            return self._pending.setdefault(path, 0)
+
+    def put(self, path: str, dir_stat: os.stat_result, records: List[tuple], has_stat: bool, epoch: int) -> ListingEntry:
+        """
+        写入扫描结果
+        :param path: 解析后的目录路径
+        :param dir_stat: 扫描前目录的 stat 结果
+        :param records: _scan_directory 的结果
+        :param has_stat: 扫描结果是否包含 stat 信息
+        :param epoch: begin() 返回的失效序号
+        :return: 缓存条目（扫描期间发生变化或超过内存上限时返回未缓存的条目）
+        """
+        entry = ListingEntry(path, (dir_stat.st_mtime_ns, dir_stat.st_ino), records, has_stat,
+                             self._watcher.is_watched(path))
+        with self._lock:
+            old = self._entries.get(path)
+            if old is not None:
+                self._remove(old, unwatch=False)
+            if self._pending.pop(path, None) != epoch or entry.size > self.max_bytes:
+                # 扫描期间收到了失效事件（结果可能已经过时）或超过内存上限，只用于本次请求
+                if entry.watched:
+                    self._watcher.unwatch(path)
+                entry.watched = False
+                return entry
+            self._entries[path] = entry
+            self._bytes += entry.size
+            self._evict()
+        return entry
+
+    def sorted_records(self, entry: ListingEntry, sort: str, order: str,
+                       sorter: Callable[[List[tuple], str, bool], None]) -> List[tuple]:
+        """
+        获取指定排序方式下的记录，首次请求时排序并缓存
+        :param entry: 缓存条目
+        :param sort: 排序字段
+        :param order: 排序方向 asc/desc
+        :param sorter: 原地排序函数 sorter(records, sort, reverse)
+        :return: 排序后的记录列表（只读）
+        """
+        records = entry.orders.get((sort, order))
+        if records is not None:
+            return records
+        records = list(entry.records)
+        sorter(records, sort, order == 'desc')
+        with self._lock:
+            if (sort, order) not in entry.orders:
+                entry.orders[(sort, order)] = records
+                size = len(records) * ORDER_BYTES
+                entry.size += size
+                if self._entries.get(entry.path) is entry:
+                    self._bytes += size
+                    self._evict()
+        return records
+
+    def invalidate(self, path: str, recursive: bool = False):
+        """
+        失效指定目录的缓存（文件管理器自身的写操作调用，不依赖 inotify）
+        :param path: 解析后的目录路径
+        :param recursive: 是否同时失效所有子目录
+        """
+        with self._lock:
+            self._invalidate(path)
+            if recursive:
+                prefix = path.rstrip(os.sep) + os.sep
+                for key in [k for k in list(self._entries) + list(self._pending) if k.startswith(prefix)]:
+                    self._invalidate(key)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            for path in self._pending:
+                self._pending[path] += 1
+            for entry in list(self._entries.values()):
+                self._remove(entry)
+
+    def stats(self) -> Dict:
+        """获取缓存统计"""
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                **self._stats,
+                'hit_rate': round(self._stats['hits'] / lookups, 4) if lookups else 0,
+                'inotify': self._watcher.stats()
+            }
+
+    def _on_event(self, path: str, mask: int, name: str):
+        if mask & IN_Q_OVERFLOW:
+            logger.warning("inotify 事件队列溢出，清空目录列表缓存")
+            self.clear()
+            return
+        with self._lock:
+            if mask & IN_IGNORED:
+                # 监视已被内核移除（目录被删除或所在文件系统被卸载），条目不能再保证有效
+                if path in self._pending:
+                    self._pending[path] += 1
+                entry = self._entries.get(path)
+                if entry is not None:
+                    self._remove(entry, unwatch=False)
+                    self._stats['invalidations'] += 1
+                return
+            self._invalidate(path)
+            if mask & _PARENT_EVENTS:
+                # 上级目录的列表中包含该目录的 mtime
+                self._invalidate(os.path.dirname(path))
+
+    def _invalidate(self, path: str):
+        if path in self._pending:
+            self._pending[path] += 1
+        entry = self._entries.get(path)
+        if entry is not None:
+            self._remove(entry)
+            self._stats['invalidations'] += 1
+
+    def _remove(self, entry: ListingEntry, unwatch: bool = True):
+        del self._entries[entry.path]
+        self._bytes -= entry.size
+        if unwatch and entry.watched:
+            self._watcher.unwatch(entry.path)
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            _, entry = next(iter(self._entries.items()))
+            self._remove(entry)
+            self._stats['evictions'] += 1
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日志跟踪模块（tail -F）
+- 同一进程中跟踪同一文件的多个客户端共用一个读取线程：新追加的内容只读取、解码一次，
+  放入有界的积压队列后唤醒所有跟随者，落后超过积压范围的跟随者跳过中间的内容
+- Linux 上由 inotify 监视文件所在目录，文件被写入、创建或改名时立即唤醒读取线程；
+  同时定期 stat 检查（无法使用 inotify 时缩短间隔），不会因为漏掉事件而停止更新
+- 文件被改名轮转（inode 变化）时先读完旧文件剩余的内容，再从新文件开头继续；
+  文件变短（copytruncate 或被清空）时从开头重新读取
+- 读取使用 os.pread，不改变共享文件描述符的位置；描述符只在持有锁时关闭
+"""
+import os
+import codecs
+import threading
+import logging
+from collections import deque
+from typing import Dict, Iterator, Optional, Tuple
+
+from inotify_watcher import (InotifyWatcher, IN_ATTRIB, IN_CLOSE_WRITE, IN_CREATE, IN_DELETE, IN_MODIFY,
+                             IN_MOVED_FROM, IN_MOVED_TO)
+from text_preview import read_backward
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 文件所在目录中需要唤醒读取线程的事件
+TAIL_EVENTS = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+# 无法使用 inotify 时的轮询间隔（秒）
+TAIL_POLL_INTERVAL = 1.0
+# 使用 inotify 时兜底检查的间隔（秒）
+TAIL_WATCHED_POLL = 5.0
+# 每次读取的块大小和每轮最多读取的字节数（其余留到下一轮，避免长时间持有数据不发送）
+TAIL_READ_BLOCK = 64 * 1024
+TAIL_MAX_READ = 4 * 1024 * 1024
+# 共享读取器保留的最近内容（字符数）
+TAIL_BACKLOG_CHARS = 1024 * 1024
+# 跟踪开始时返回的默认行数和最大行数
+DEFAULT_TAIL_LINES = 100
+MAX_TAIL_LINES = 5000
+# 没有新内容时发送心跳的间隔（秒），同时用于发现已断开的客户端
+TAIL_HEARTBEAT = 15
+# 每个进程最多同时跟踪的文件数
+MAX_SHARED_TAILS = 64
+
+
+class _PositionalReader:
+    """以 os.pread 实现 seek/read 的只读视图，供 read_backward 使用"""
+
+    def __init__(self, fd: int):
+        self.fd = fd
+        self.pos = 0
+
+    def seek(self, pos: int):
+        self.pos = pos
+
+    def read(self, size: int) -> bytes:
+        data = os.pread(self.fd, size, self.pos)
+        self.pos += len(data)
+        return data
+
+
+class SharedTail:
+    """一个文件的共享读取器"""
+
+    def __init__(self, path: str, encoding: str, poll_interval: float):
+        self.path = path
+        self.encoding = encoding
+        self.poll_interval = poll_interval
+        self.followers = 0
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._closed = False
+        # 积压队列：(序号, 事件名, 数据)
+        self._backlog = deque()
+        self._backlog_chars = 0
+        self._seq = 0
+        self._fd: Optional[int] = None
+        self._inode = None
+        self._pos = 0
+        self._missing = False
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        self._open(at_end=True)
+        self._thread = threading.Thread(target=self._run, name='log-tail', daemon=True)
+        self._thread.start()
+
+    def _open(self, at_end: bool) -> bool:
+        try:
+            fd = os.open(self.path, os.O_RDONLY | os.O_CLOEXEC)
+        except FileNotFoundError:
+            return False
+        st = os.fstat(fd)
+        with self._cond:
+            self._fd = fd
+            self._inode = (st.st_dev, st.st_ino)
+            self._pos = st.st_size if at_end else 0
+        self._decoder.reset()
+        self._missing = False
+        return True
+
+    def _close_fd(self):
+        with self._cond:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def wake(self):
+        self._wake.set()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._wake.set()
+
+    def _publish(self, event: str, data: Dict, pos: Optional[int] = None):
+        """在锁内追加到积压队列并唤醒跟随者；pos 为读取到的新位置"""
+        size = len(data.get('text', ''))
+        with self._cond:
+            if pos is not None:
+                self._pos = pos
+            self._seq += 1
+            self._backlog.append((self._seq, event, data))
+            self._backlog_chars += size
+            while len(self._backlog) > 1 and self._backlog_chars > TAIL_BACKLOG_CHARS:
+                _, _, old = self._backlog.popleft()
+                self._backlog_chars -= len(old.get('text', ''))
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            if self._closed:
+                break
+            try:
+                self._check()
+            except OSError as e:
+                logger.warning(f"跟踪文件 {self.path} 失败: {e}")
+        self._close_fd()
+
+    def _read_new(self) -> bool:
+        """读取当前描述符中新追加的内容，返回是否还有没读完的部分"""
+        pos = self._pos
+        parts = []
+        read = 0
+        while read < TAIL_MAX_READ:
+            data = os.pread(self._fd, TAIL_READ_BLOCK, pos)
+            if not data:
+                break
+            pos += len(data)
+            read += len(data)
+            parts.append(self._decoder.decode(data))
+        if read:
+            self._publish('data', {"text": ''.join(parts)}, pos)
+        return read >= TAIL_MAX_READ
+
+    def _check(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+
+        if self._fd is None:
+            # 文件之前不存在，重新出现后从开头读取
+            if st is not None and self._open(at_end=False):
+                self._publish('rotated', {"message": "文件已重新创建，从开头继续"}, 0)
+                self._read_new()
+            return
+
+        if st is not None and (st.st_dev, st.st_ino) != self._inode:
+            # 轮转：读完旧文件中剩余的内容，再切换到新文件
+            while self._read_new():
+                pass
+            self._close_fd()
+            if self._open(at_end=False):
+                self._publish('rotated', {"message": "文件已轮转，从新文件开头继续"}, 0)
+            self._wake.set()
+            return
+
+        if st is None and not self._missing:
+            # 文件被删除或改名但还没有新文件，旧描述符上仍可能有写入
+            self._missing = True
+            self._publish('deleted', {"message": "文件已被删除或移走，等待重新创建"})
+
+        if os.fstat(self._fd).st_size < self._pos:
+            self._decoder.reset()
+            self._publish('truncated', {"message": "文件已被截断，从开头继续"}, 0)
+        if self._read_new():
+            self._wake.set()
+
+    def follow(self, lines: int) -> Iterator[Tuple[str, Optional[Dict]]]:
+        """
+        跟随者：先返回当前末尾的 lines 行，之后返回新追加的内容和轮转等通知
+        :return: 生成 (事件名, 数据)；没有新内容时生成 ('keepalive', None)
+        """
+        with self._cond:
+            seq = self._seq
+            text = ''
+            if lines > 0 and self._fd is not None:
+                # 在锁内读取，读取线程不会在此期间关闭描述符或推进位置
+                _, data = read_backward(_PositionalReader(self._fd), self._pos, lines)
+                text = data.decode(self.encoding, errors='replace')
+        yield 'data', {"text": text, "initial": True}
+
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._seq > seq or self._closed, TAIL_HEARTBEAT)
+                if self._closed:
+                    return
+                entries = [entry for entry in self._backlog if entry[0] > seq]
+                skipped = bool(entries) and entries[0][0] > seq + 1
+                seq = self._seq
+            if not entries:
+                yield 'keepalive', None
+                continue
+            if skipped:
+                yield 'lag', {"message": "跟踪落后太多，已跳过部分内容"}
+            # 连续的数据合并为一个事件
+            pending = []
+            for _, event, data in entries:
+                if event == 'data':
+                    pending.append(data['text'])
+                    continue
+                if pending:
+                    yield 'data', {"text": ''.join(pending)}
+                    pending = []
+                yield event, data
+            if pending:
+                yield 'data', {"text": ''.join(pending)}
+
+
+class LogTailer:
+    """管理共享读取器：按路径复用，最后一个跟随者离开时关闭"""
+
+    def __init__(self):
+        self._tails: Dict[str, SharedTail] = {}
+        self._dir_refs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._watcher = InotifyWatcher(self._on_event, mask=TAIL_EVENTS, name='tail-inotify')
+
+    def _on_event(self, dir_path: str, mask: int, name: str):
+        if not dir_path:
+            # 事件队列溢出，唤醒所有读取器
+            tails = list(self._tails.values())
+        else:
+            tail = self._tails.get(os.path.join(dir_path, name))
+            tails = [tail] if tail is not None else []
+        for tail in tails:
+            tail.wake()
+
+    def _acquire(self, path: str, encoding: str) -> Optional[SharedTail]:
+        with self._lock:
+            tail = self._tails.get(path)
+            if tail is None:
+                if len(self._tails) >= MAX_SHARED_TAILS:
+                    return None
+                dir_path = os.path.dirname(path)
+                watched = self._watcher.watch(dir_path)
+                if watched:
+                    self._dir_refs[dir_path] = self._dir_refs.get(dir_path, 0) + 1
+                tail = SharedTail(path, encoding, TAIL_WATCHED_POLL if watched else TAIL_POLL_INTERVAL)
+                self._tails[path] = tail
+            tail.followers += 1
+            return tail
+
+    def _release(self, tail: SharedTail):
+        with self._lock:
+            tail.followers -= 1
+            if tail.followers > 0:
+                return
+            self._tails.pop(tail.path, None)
+            tail.close()
+            dir_path = os.path.dirname(tail.path)
+            if dir_path in self._dir_refs:
+                self._dir_refs[dir_path] -= 1
+                if self._dir_refs[dir_path] == 0:
+                    del self._dir_refs[dir_path]
+                    self._watcher.unwatch(dir_path)
+
+    def follow(self, path: str, encoding: str, lines: int, follow: bool = True) -> Iterator[Tuple[str, Optional[Dict]]]:
+        """
+        跟踪文件
+        :param path: 文件的绝对路径（已经过安全校验）
+        :param encoding: 文件编码
+        :param lines: 开始时返回的末尾行数
+        :param follow: 为 False 时只返回末尾的 lines 行
+        :return: 生成 (事件名, 数据)，事件为 data、rotated、truncated、deleted、lag、keepalive 或 failed
+        """
+        if not follow:
+            with open(path, 'rb') as f:
+                _, data = read_backward(f, os.fstat(f.fileno()).st_size, lines)
+            yield 'data', {"text": data.decode(encoding, errors='replace'), "initial": True}
+            return
+
+        # 在生成器内部获取，客户端在第一次迭代之前断开时不会泄漏引用计数
+        tail = self._acquire(path, encoding)
+        if tail is None:
+            yield 'failed', {"message": f"同时跟踪的文件数已达到上限 ({MAX_SHARED_TAILS})"}
+            return
+        try:
+            yield from tail.follow(lines)
+        finally:
+            self._release(tail)
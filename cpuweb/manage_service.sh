@@ -4,8 +4,7 @@
 # 服务配置
 SERVICE_NAME="cpuweb"
 SERVICE_USER="bi9bjv"
-PYTHON_ENV="/home/bi9bjv/miniconda3/envs/cpuweb/bin/python"
-APP_PATH="/home/bi9bjv/python/cpuweb/app.py"
+START_SCRIPT="/home/bi9bjv/python/cpuweb/start.sh"
 LOG_FILE="/home/bi9bjv/python/cpuweb/service.log"
 PID_FILE="/home/bi9bjv/python/cpuweb/service.pid"
 
@@ -42,9 +41,7 @@ start_service() {
     
     # 激活conda环境并启动服务
     su - $SERVICE_USER -c "
-        source /home/bi9bjv/miniconda3/etc/profile.d/conda.sh
-        conda activate cpuweb
-        nohup $PYTHON_ENV $APP_PATH > $LOG_FILE 2>&1 &
+        CPUWEB_SERVER=${CPUWEB_SERVER:-prefork} nohup /bin/bash $START_SCRIPT > $LOG_FILE 2>&1 &
         echo \$! > $PID_FILE
     "
     
@@ -136,14 +133,22 @@ Description=CPUWeb System Monitor Service
 After=network.target
 
 [Service]
-Type=forking
+Type=simple
 User=bi9bjv
-Group=bi9bjv
 WorkingDirectory=/home/bi9bjv/python/cpuweb
-ExecStart=/bin/bash -c 'source /home/bi9bjv/miniconda3/etc/profile.d/conda.sh && conda activate cpuweb && /home/bi9bjv/miniconda3/envs/cpuweb/bin/python /home/bi9bjv/python/cpuweb/app.py'
-ExecReload=/bin/kill -HUP \$MAINPID
+Environment="PATH=/home/bi9bjv/miniconda3/envs/cpuweb/bin:/home/bi9bjv/miniconda3/bin:/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"
+# 服务器模式: prefork（gunicorn 多进程）或 dev（Flask 开发服务器）
+Environment="CPUWEB_SERVER=${CPUWEB_SERVER:-prefork}"
+Environment="CPUWEB_WORKERS=${CPUWEB_WORKERS:-2}"
+# 由nginx发送下载的文件内容（需配合 nginx_config_example.conf 中的 /_protected/ location）
+#Environment="CPUWEB_ACCEL_REDIRECT=/_protected/"
+ExecStart=/bin/bash $START_SCRIPT --server \${CPUWEB_SERVER}
+KillMode=mixed
 Restart=always
-RestartSec=3
+RestartSec=10
+StandardOutput=journal
+StandardError=journal
+SyslogIdentifier=cpuweb
 
 [Install]
 WantedBy=multi-user.target
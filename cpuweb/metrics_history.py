@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+系统指标历史模块
+使用预分配的定长环形缓冲区保存采集线程产生的时间序列，内存占用固定，
+查询时在服务端完成降采样，前端只需拉取少量数据点即可绘制曲线
+"""
+import math
+import threading
+import logging
+from array import array
+from typing import Dict, Optional
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 默认采集间隔（秒），与 app.py 中的后台采集线程保持一致
+DEFAULT_SAMPLE_INTERVAL = 0.5
+# 默认保留时长（秒），24小时
+DEFAULT_RETENTION = 24 * 3600
+# 单次查询最多返回的数据点数量
+MAX_POINTS = 2000
+
+# 指标名称 -> system_info 中的 (分类, 字段)
+HISTORY_METRICS = {
+    'cpu.percent': ('cpu', 'percent'),
+    'cpu.temp': ('cpu', 'temp'),
+    'cpu.freq': ('cpu', 'freq'),
+    'cpu.voltage': ('cpu', 'voltage'),
+    'power.watts': ('power', 'watts'),
+    'memory.percent': ('memory', 'percent'),
+    'memory.used': ('memory', 'used'),
+    'disk.percent': ('disk', 'percent'),
+    'disk.used': ('disk', 'used'),
+    'network.upload_speed': ('network', 'upload_speed'),
+    'network.download_speed': ('network', 'download_speed'),
+    'io.read_speed': ('io', 'read_speed'),
+    'io.write_speed': ('io', 'write_speed'),
+}
+
+
+class MetricsHistory:
+    def __init__(self, sample_interval: float = DEFAULT_SAMPLE_INTERVAL, retention: int = DEFAULT_RETENTION):
+        """
+        初始化指标历史缓冲区
+        :param sample_interval: 采集间隔（秒），用于计算缓冲区容量
+        :param retention: 保留时长（秒）
+        """
+        self.capacity = int(math.ceil(retention / sample_interval))
+        self.metrics = list(HISTORY_METRICS.keys())
+        # 时间戳使用双精度，指标值使用单精度以节省内存
+        self._timestamps = array('d', bytes(8 * self.capacity))
+        self._values = {name: array('f', bytes(4 * self.capacity)) for name in self.metrics}
+        # [下一次写入的位置, 已写入的样本数量（不超过容量）]
+        self._state = array('q', [0, 0])
+        self._lock = threading.Lock()
+
+    @property
+    def _head(self) -> int:
+        return self._state[0]
+
+    @_head.setter
+    def _head(self, value: int):
+        self._state[0] = value
+
+    @property
+    def _count(self) -> int:
+        return self._state[1]
+
+    @_count.setter
+    def _count(self, value: int):
+        self._state[1] = value
+
+    def shared_size(self) -> int:
+        """
+        返回挂载到共享内存所需的字节数
+        :return: 字节数
+        """
+        return 16 + 8 * self.capacity + 4 * self.capacity * len(self.metrics)
+
+    def attach(self, buffer: memoryview):
+        """
+        将缓冲区切换到共享内存（多进程模式），采集进程写入、工作进程直接读取同一份数据。
+        工作进程不持有采集进程的锁，查询时最新一个样本可能尚未写完，对曲线绘制没有影响
+        :param buffer: 大小不小于 shared_size() 的共享内存区域
+        """
+        with self._lock:
+            self._state = buffer[:16].cast('q')
+            offset = 16
+            self._timestamps = buffer[offset:offset + 8 * self.capacity].cast('d')
+            offset += 8 * self.capacity
+            values = {}
+            for name in self.metrics:
+                values[name] = buffer[offset:offset + 4 * self.capacity].cast('f')
+                offset += 4 * self.capacity
+            self._values = values
+
+    def memory_usage(self) -> int:
+        """
+        返回缓冲区占用的字节数
+        :return: 字节数
+        """
+        total = self._timestamps.itemsize * len(self._timestamps)
+        for values in self._values.values():
+            total += values.itemsize * len(values)
+        return total
+
+    def record(self, timestamp: float, info: Dict):
+        """
+        记录一次采样
+        :param timestamp: 采样时间（Unix时间戳）
+        :param info: system_info 字典
+        """
+        with self._lock:
+            head = self._head
+            self._timestamps[head] = timestamp
+            for name, (group, field) in HISTORY_METRICS.items():
+                try:
+                    value = float(info.get(group, {}).get(field, 0) or 0)
+                except (TypeError, ValueError):
+                    value = 0.0
+                self._values[name][head] = value
+            self._head = (head + 1) % self.capacity
+            if self._count < self.capacity:
+                self._count += 1
+
+    def _physical(self, logical: int) -> int:
+        """将逻辑下标（0为最旧样本）转换为数组中的物理下标"""
+        return (self._head - self._count + logical) % self.capacity
+
+    def _slice(self, data, start: int) -> array:
+        """按时间顺序截取从逻辑下标 start 开始的所有样本（需持有锁）"""
+        begin = self._physical(start)
+        length = self._count - start
+        end = begin + length
+        # 数组和共享内存视图都支持缓冲区协议，按字节直接复制
+        view = memoryview(data)
+        result = array('d' if data is self._timestamps else 'f')
+        if end <= self.capacity:
+            result.frombytes(view[begin:end].cast('B'))
+        else:
+            result.frombytes(view[begin:].cast('B'))
+            result.frombytes(view[:end - self.capacity].cast('B'))
+        return result
+
+    def query(self, metric: str, since: Optional[float] = None, step: Optional[float] = None) -> Dict:
+        """
+        查询指标历史并按时间桶降采样
+        :param metric: 指标名称，例如 cpu.percent
+        :param since: 起始时间（Unix时间戳），为空时返回全部历史
+        :param step: 降采样步长（秒），为空时自动选择使结果不超过 MAX_POINTS
+        :return: 包含时间戳、平均值、最小值、最大值的字典
+        """
+        if metric not in self._values:
+            return {"success": False, "message": f"未知的指标: {metric}，可用指标: {', '.join(self.metrics)}"}
+
+        with self._lock:
+            # 时间戳按逻辑下标单调递增，二分查找起始位置
+            lo, hi = 0, self._count
+            if since is not None:
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if self._timestamps[self._physical(mid)] < since:
+                        lo = mid + 1
+                    else:
+                        hi = mid
+            timestamps = self._slice(self._timestamps, lo)
+            values = self._slice(self._values[metric], lo)
+
+        result = {
+            "success": True,
+            "metric": metric,
+            "step": step,
+            "samples": len(timestamps),
+            "timestamps": [],
+            "avg": [],
+            "min": [],
+            "max": []
+        }
+        if not timestamps:
+            return result
+
+        first = timestamps[0]
+        span = timestamps[-1] - first
+        min_step = span / MAX_POINTS if span > 0 else 0
+        if step is None or step < min_step:
+            step = min_step
+        result["step"] = round(step, 3)
+
+        if step <= 0:
+            # 样本数很少或时间跨度为0，不需要降采样
+            result["timestamps"] = [round(t, 3) for t in timestamps]
+            result["avg"] = result["min"] = result["max"] = [round(v, 2) for v in values]
+            return result
+
+        bucket_start = first
+        total = 0.0
+        count = 0
+        low = high = 0.0
+        for t, v in zip(timestamps, values):
+            if t >= bucket_start + step and count:
+                result["timestamps"].append(round(bucket_start, 3))
+                result["avg"].append(round(total / count, 2))
+                result["min"].append(round(low, 2))
+                result["max"].append(round(high, 2))
+                bucket_start += step * ((t - bucket_start) // step)
+                count = 0
+            if count == 0:
+                total = v
+                low = high = v
+            else:
+                total += v
+                if v < low:
+                    low = v
+                elif v > high:
+                    high = v
+            count += 1
+
+        result["timestamps"].append(round(bucket_start, 3))
+        result["avg"].append(round(total / count, 2))
+        result["min"].append(round(low, 2))
+        result["max"].append(round(high, 2))
+        return result
+
+
+# 创建指标历史实例
+metrics_history = MetricsHistory()
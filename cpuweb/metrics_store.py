@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+持久化指标存储模块
+使用 SQLite WAL 模式保存 1分钟/10分钟/1小时 三级汇总数据，服务重启后历史不丢失。
+
+写入策略（减少SD卡磨损）：
+- 采集线程只在内存中累加各时间桶的 sum/min/max/count，不直接写盘
+- 后台写入线程每 FLUSH_INTERVAL 秒在一个事务中批量 upsert，随后执行一次 checkpoint，
+  即每个刷新周期只有一次 WAL fsync 和一次数据库 fsync
+- 主键为 (resolution, bucket, metric)，同一次刷新写入的行在B树中相邻，
+  每个分辨率通常只涉及1~2个页面
+- 写放大 = (WAL帧字节 + checkpoint回写字节) / 逻辑行字节，由 status() 实时统计
+- 多进程模式下只有采集进程在第一次写入时打开写连接；工作进程以只读方式查询，
+  未写盘的时间桶由采集进程通过共享内存槽位发布（attach）
+"""
+import os
+import time
+import atexit
+import sqlite3
+import threading
+import logging
+from typing import Dict, Optional
+from urllib.parse import quote
+
+from metrics_history import HISTORY_METRICS
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'metrics.db')
+
+# 批量写入间隔（秒）
+FLUSH_INTERVAL = 60
+# 清理过期数据的间隔（秒）
+PRUNE_INTERVAL = 3600
+# 汇总分辨率（秒） -> 保留时长（秒）
+RESOLUTIONS = {
+    60: 7 * 24 * 3600,       # 1分钟汇总保留7天
+    600: 30 * 24 * 3600,     # 10分钟汇总保留30天
+    3600: 365 * 24 * 3600,   # 1小时汇总保留1年
+}
+# 单次查询最多返回的数据点数量
+MAX_POINTS = 2000
+# 每行逻辑数据大小估算：resolution、bucket、metric、sum、min、max、count 各8字节
+ROW_BYTES = 7 * 8
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS rollups (
+    resolution INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    metric INTEGER NOT NULL,
+    sum REAL NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (resolution, bucket, metric)
+) WITHOUT ROWID;
+"""
+
+UPSERT = """
+INSERT INTO rollups (resolution, bucket, metric, sum, min, max, count)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (resolution, bucket, metric) DO UPDATE SET
+    sum = sum + excluded.sum,
+    min = MIN(min, excluded.min),
+    max = MAX(max, excluded.max),
+    count = count + excluded.count
+"""
+
+
+class MetricsStore:
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, flush_interval: float = FLUSH_INTERVAL):
+        """
+        初始化持久化指标存储
+        :param db_path: SQLite 数据库文件路径
+        :param flush_interval: 批量写入间隔（秒）
+        """
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self._pending: Dict[tuple, list] = {}
+        self._lock = threading.Lock()          # 保护内存累加器
+        self._write_lock = threading.Lock()    # 保护写连接
+        self._stop = threading.Event()
+        self._thread = None
+        self._metric_ids: Dict[str, int] = {}
+        self._last_prune = 0.0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._page_size = 0
+        self._slot = None
+        self._writer = True
+        self._stats = {
+            'flushes': 0,
+            'rows_written': 0,
+            'logical_bytes': 0,
+            'wal_bytes': 0,
+            'checkpoint_bytes': 0,
+            'last_flush_ms': 0.0
+        }
+
+    def attach(self, slot, writer: bool):
+        """
+        挂载共享内存槽位（多进程模式），采集进程发布未写盘的时间桶、工作进程读取
+        :param slot: shared_state.SharedSlot
+        :param writer: 是否为采集进程
+        """
+        self._slot = slot
+        self._writer = writer
+
+    def _connection(self) -> sqlite3.Connection:
+        """写连接，第一次写入时打开（只有采集进程会写入，工作进程导入模块时不创建数据库）"""
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # WAL模式下 NORMAL 只在 checkpoint 时 fsync，提交本身不落盘
+            conn.execute('PRAGMA synchronous=NORMAL')
+            # 关闭自动 checkpoint，由刷新周期统一执行
+            conn.execute('PRAGMA wal_autocheckpoint=0')
+            conn.executescript(SCHEMA)
+            self._page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+            self._conn = conn
+            for metric_id, name in conn.execute('SELECT id, name FROM metrics'):
+                self._metric_ids[name] = metric_id
+            for name in HISTORY_METRICS:
+                self._metric_id(name)
+            conn.commit()
+        return self._conn
+
+    def _metric_id(self, name: str) -> int:
+        metric_id = self._metric_ids.get(name)
+        if metric_id is None:
+            cursor = self._conn.execute('INSERT OR IGNORE INTO metrics (name) VALUES (?)', (name,))
+            metric_id = cursor.lastrowid or self._conn.execute(
+                'SELECT id FROM metrics WHERE name = ?', (name,)).fetchone()[0]
+            self._metric_ids[name] = metric_id
+        return metric_id
+
+    def record(self, timestamp: float, info: Dict):
+        """
+        在内存中累加一次采样（不写盘）
+        :param timestamp: 采样时间（Unix时间戳）
+        :param info: system_info 字典
+        """
+        with self._lock:
+            for name, (group, field) in HISTORY_METRICS.items():
+                try:
+                    value = float(info.get(group, {}).get(field, 0) or 0)
+                except (TypeError, ValueError):
+                    continue
+                for resolution in RESOLUTIONS:
+                    key = (resolution, int(timestamp // resolution) * resolution, name)
+                    acc = self._pending.get(key)
+                    if acc is None:
+                        self._pending[key] = [value, value, value, 1]
+                    else:
+                        acc[0] += value
+                        if value < acc[1]:
+                            acc[1] = value
+                        if value > acc[2]:
+                            acc[2] = value
+                        acc[3] += 1
+            self._publish()
+
+    def _publish(self):
+        """发布未写盘的时间桶（调用方持有 _lock，保证两个线程的写入不交错）"""
+        if self._slot is not None and self._writer:
+            self._slot.write_json([[*key, *acc] for key, acc in self._pending.items()])
+
+    def flush(self):
+        """将内存中的汇总数据批量写入数据库并执行一次 checkpoint"""
+        with self._write_lock:
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        start = time.perf_counter()
+        conn = self._connection()
+        rows = [
+            (resolution, bucket, self._metric_id(name), acc[0], acc[1], acc[2], acc[3])
+            for (resolution, bucket, name), acc in sorted(pending.items())
+        ]
+        with conn:
+            conn.executemany(UPSERT, rows)
+        # 已写盘的时间桶从共享槽位中移除，避免工作进程重复合并
+        with self._lock:
+            self._publish()
+
+        now = time.time()
+        if now - self._last_prune >= PRUNE_INTERVAL:
+            self._prune(now)
+
+        # checkpoint 返回 (busy, WAL帧数, 已回写帧数)；RESTART 让下次写入复用WAL文件开头，不改变文件大小
+        _, wal_frames, checkpointed = conn.execute('PRAGMA wal_checkpoint(RESTART)').fetchone()
+        frame_bytes = self._page_size + 24
+        self._stats['flushes'] += 1
+        self._stats['rows_written'] += len(rows)
+        self._stats['logical_bytes'] += len(rows) * ROW_BYTES
+        self._stats['wal_bytes'] += max(wal_frames, 0) * frame_bytes
+        self._stats['checkpoint_bytes'] += max(checkpointed, 0) * self._page_size
+        self._stats['last_flush_ms'] = (time.perf_counter() - start) * 1000
+
+    def prune(self, now: Optional[float] = None):
+        """
+        按各分辨率的保留时长删除过期数据
+        :param now: 当前时间
+        """
+        with self._write_lock:
+            self._prune(now or time.time())
+
+    def _prune(self, now: float):
+        conn = self._connection()
+        with conn:
+            for resolution, retention in RESOLUTIONS.items():
+                conn.execute(
+                    'DELETE FROM rollups WHERE resolution = ? AND bucket < ?',
+                    (resolution, now - retention)
+                )
+        self._last_prune = now
+
+    def query(self, metric: str, start: Optional[float] = None, end: Optional[float] = None,
+              resolution: Optional[int] = None) -> Dict:
+        """
+        范围查询汇总数据（使用主键索引）
+        :param metric: 指标名称
+        :param start: 起始时间，默认为 end 前24小时
+        :param end: 结束时间，默认为当前时间
+        :param resolution: 分辨率（60/600/3600），为空时自动选择使结果不超过 MAX_POINTS
+        :return: 包含时间戳、平均值、最小值、最大值的字典
+        """
+        if metric not in HISTORY_METRICS:
+            return {"success": False, "message": f"未知的指标: {metric}"}
+        end = end or time.time()
+        start = start if start is not None else end - 24 * 3600
+        if resolution is None:
+            resolution = next((r for r in sorted(RESOLUTIONS) if (end - start) / r <= MAX_POINTS), max(RESOLUTIONS))
+        elif resolution not in RESOLUTIONS:
+            return {"success": False, "message": f"无效的分辨率，仅支持: {', '.join(map(str, sorted(RESOLUTIONS)))}"}
+
+        # 未写盘的数据也合并进结果，保证最近一个刷新周期可见（工作进程读取采集进程发布的副本）
+        if self._writer:
+            with self._lock:
+                entries = [[*key, *acc] for key, acc in self._pending.items()]
+        else:
+            entries = self._slot.read_json() or []
+        pending = {
+            bucket: acc for res, bucket, name, *acc in entries
+            if res == resolution and name == metric and start <= bucket <= end
+        }
+
+        # 只读连接：不创建数据库文件；采集进程尚未写入时（文件或表不存在）视为无数据
+        try:
+            conn = sqlite3.connect(f'file:{quote(self.db_path)}?mode=ro', uri=True)
+            try:
+                rows = conn.execute(
+                    'SELECT r.bucket, r.sum, r.min, r.max, r.count FROM rollups r '
+                    'JOIN metrics m ON m.id = r.metric '
+                    'WHERE r.resolution = ? AND r.bucket >= ? AND r.bucket <= ? AND m.name = ? ORDER BY r.bucket',
+                    (resolution, int(start // resolution) * resolution, end, metric)
+                ).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.OperationalError:
+            rows = []
+
+        merged = {bucket: [total, low, high, count] for bucket, total, low, high, count in rows}
+        for bucket, acc in pending.items():
+            if bucket in merged:
+                row = merged[bucket]
+                merged[bucket] = [row[0] + acc[0], min(row[1], acc[1]), max(row[2], acc[2]), row[3] + acc[3]]
+            else:
+                merged[bucket] = list(acc)
+
+        buckets = sorted(merged)
+        return {
+            "success": True,
+            "metric": metric,
+            "resolution": resolution,
+            "timestamps": buckets,
+            "avg": [round(merged[b][0] / merged[b][3], 2) for b in buckets],
+            "min": [round(merged[b][1], 2) for b in buckets],
+            "max": [round(merged[b][2], 2) for b in buckets]
+        }
+
+    def status(self) -> Dict:
+        """获取写入统计，包括写放大系数"""
+        stats = dict(self._stats)
+        physical = stats['wal_bytes'] + stats['checkpoint_bytes']
+        stats['write_amplification'] = round(physical / stats['logical_bytes'], 2) if stats['logical_bytes'] else 0
+        stats['flush_interval'] = self.flush_interval
+        stats['db_size'] = os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0
+        stats['last_flush_ms'] = round(stats['last_flush_ms'], 2)
+        return stats
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"写入指标数据库失败: {e}")
+
+    def start(self):
+        """启动后台写入线程，进程退出时写入剩余数据"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def close(self):
+        """停止写入线程并写入剩余数据"""
+        self._stop.set()
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"写入指标数据库失败: {e}")
+
+
+# 创建持久化指标存储实例（数据库在第一次写入时打开）
+metrics_store = MetricsStore()
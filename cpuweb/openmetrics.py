@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prometheus/OpenMetrics 导出模块
+采集线程每个周期渲染一次文本并缓存，/metrics 抓取只返回缓存的字节，不会触发额外的 psutil 调用。
+计数器使用 psutil 的原始累计值（字节、次数），不做单位换算和取整
+同时渲染两种格式：OpenMetrics 1.0（TYPE 使用不含 _total 的族名，带 UNIT 和 # EOF），
+以及 Prometheus 文本格式 0.0.4（TYPE 必须与样本名一致，计数器写 _total 名称，没有 UNIT 和 EOF）
+"""
+import threading
+import logging
+from typing import Dict, List, Optional
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 传感器单位 -> (指标名后缀, 换算系数)
+SENSOR_FAMILIES = {
+    '°C': ('temperature_celsius', 1),
+    'V': ('voltage_volts', 1),
+    'A': ('current_amperes', 1),
+    'W': ('power_watts', 1),
+    'RPM': ('fan_rpm', 1),
+    '%': ('capacity_ratio', 0.01),
+}
+
+
+def _escape(value: str) -> str:
+    """转义标签值中的反斜杠、双引号和换行"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _Writer:
+    """按指标族收集数据，再分别渲染为两种格式"""
+
+    def __init__(self):
+        # (族名称, 类型, 说明, 单位, 样本名, [(标签字典, 数值)])
+        self.families: List[tuple] = []
+
+    def family(self, name: str, metric_type: str, help_text: str, samples, unit: Optional[str] = None):
+        """
+        输出一个指标族
+        :param name: 指标族名称（计数器不含 _total 后缀）
+        :param metric_type: gauge 或 counter
+        :param help_text: 说明
+        :param samples: [(标签字典, 数值)] 或单个数值
+        :param unit: OpenMetrics 单位（必须是名称的后缀）
+        """
+        if not isinstance(samples, list):
+            samples = [({}, samples)]
+        samples = [(labels, value) for labels, value in samples if value is not None]
+        if not samples:
+            return
+        sample_name = f'{name}_total' if metric_type == 'counter' else name
+        self.families.append((name, metric_type, help_text, unit, sample_name, samples))
+
+    def render(self, openmetrics: bool) -> bytes:
+        """
+        :param openmetrics: True 为 OpenMetrics 1.0，False 为 Prometheus 文本格式 0.0.4
+        """
+        lines = []
+        for name, metric_type, help_text, unit, sample_name, samples in self.families:
+            if openmetrics:
+                lines.append(f'# TYPE {name} {metric_type}')
+                if unit:
+                    lines.append(f'# UNIT {name} {unit}')
+                lines.append(f'# HELP {name} {help_text}')
+            else:
+                lines.append(f'# HELP {sample_name} {help_text}')
+                lines.append(f'# TYPE {sample_name} {metric_type}')
+            for labels, value in samples:
+                label_str = ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                lines.append(f'{sample_name}{{{label_str}}} {value}' if label_str else f'{sample_name} {value}')
+        if openmetrics:
+            lines.append('# EOF')
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class MetricsExposition:
+    def __init__(self):
+        """初始化导出缓存"""
+        # 格式（True 为 OpenMetrics）-> 最近一次渲染的文本
+        self._payloads = {True: b'# EOF\n', False: b''}
+        self._lock = threading.Lock()
+        self._slots = None
+        self._writer = True
+        self._versions = {True: 0, False: 0}
+
+    def attach(self, slot, text_slot, writer: bool):
+        """
+        挂载共享内存槽位（多进程模式），采集进程写入、工作进程读取
+        :param slot: OpenMetrics 文本的 shared_state.SharedSlot
+        :param text_slot: Prometheus 0.0.4 文本的槽位
+        :param writer: 是否为采集进程
+        """
+        self._slots = {True: slot, False: text_slot}
+        self._writer = writer
+
+    def payload(self, openmetrics: bool = True) -> bytes:
+        """
+        最近一次渲染的文本
+        :param openmetrics: True 为 OpenMetrics 1.0，False 为 Prometheus 文本格式 0.0.4
+        """
+        if not self._writer:
+            slot = self._slots[openmetrics]
+            if slot.version() != self._versions[openmetrics]:
+                result = slot.read()
+                if result:
+                    self._versions[openmetrics], self._payloads[openmetrics] = result[0], result[3]
+        return self._payloads[openmetrics]
+
+    def render(self, info: Dict, fan: Dict, raw: Dict, sensors: List[Dict], collector: Dict):
+        """
+        渲染并缓存指标文本，由采集线程每个周期调用一次
+        :param info: system_info 字典
+        :param fan: fan_control 字典
+        :param raw: psutil 原始数据（memory、disk、network、io、cpu_stats）
+        :param sensors: 传感器描述列表（sensor_registry.describe()）
+        :param collector: 采集线程状态
+        """
+        w = _Writer()
+        cpu = info.get('cpu', {})
+        cores = info.get('cores', {})
+
+        w.family('cpuweb_cpu_usage_percent', 'gauge', 'CPU usage', cpu.get('percent'))
+        w.family('cpuweb_cpu_frequency_hertz', 'gauge', 'Current CPU frequency',
+                 cpu.get('freq', 0) * 1000000, 'hertz')
+        w.family('cpuweb_cpu_core_usage_percent', 'gauge', 'Per-core CPU usage',
+                 [({'core': i}, v) for i, v in enumerate(cores.get('percent', []))])
+        w.family('cpuweb_cpu_core_frequency_hertz', 'gauge', 'Per-core CPU frequency',
+                 [({'core': i}, v * 1000000) for i, v in enumerate(cores.get('freq', []))], 'hertz')
+        w.family('cpuweb_load_average', 'gauge', 'System load average',
+                 [({'period': p}, v) for p, v in zip(('1m', '5m', '15m'), cores.get('load_avg', []))])
+        w.family('cpuweb_cpu_temperature_celsius', 'gauge', 'CPU temperature', cpu.get('temp'), 'celsius')
+        w.family('cpuweb_cpu_voltage_volts', 'gauge', 'CPU core voltage', cpu.get('voltage'), 'volts')
+        w.family('cpuweb_cpu_arm_clock_hertz', 'gauge', 'Measured ARM clock',
+                 cpu.get('arm_clock', 0) * 1000000, 'hertz')
+        w.family('cpuweb_cpu_throttled', 'gauge', 'Firmware get_throttled bitmask',
+                 int(cpu.get('throttled', '0x0'), 16))
+        w.family('cpuweb_power_watts', 'gauge', 'Power consumption (measured or estimated)',
+                 info.get('power', {}).get('watts'), 'watts')
+
+        cpu_stats = raw.get('cpu_stats')
+        if cpu_stats:
+            w.family('cpuweb_context_switches', 'counter', 'Context switches', cpu_stats.ctx_switches)
+            w.family('cpuweb_interrupts', 'counter', 'Interrupts', cpu_stats.interrupts)
+
+        memory = raw.get('memory')
+        if memory:
+            w.family('cpuweb_memory_total_bytes', 'gauge', 'Total memory', memory.total, 'bytes')
+            w.family('cpuweb_memory_used_bytes', 'gauge', 'Used memory', memory.used, 'bytes')
+            w.family('cpuweb_memory_available_bytes', 'gauge', 'Available memory', memory.available, 'bytes')
+
+        disk = raw.get('disk')
+        if disk:
+            w.family('cpuweb_disk_total_bytes', 'gauge', 'Root filesystem size', disk.total, 'bytes')
+            w.family('cpuweb_disk_used_bytes', 'gauge', 'Root filesystem used', disk.used, 'bytes')
+            w.family('cpuweb_disk_free_bytes', 'gauge', 'Root filesystem free', disk.free, 'bytes')
+
+        network = raw.get('network')
+        if network:
+            w.family('cpuweb_network_sent_bytes', 'counter', 'Bytes sent on all interfaces', network.bytes_sent, 'bytes')
+            w.family('cpuweb_network_received_bytes', 'counter', 'Bytes received on all interfaces',
+                     network.bytes_recv, 'bytes')
+
+        io = raw.get('io')
+        if io:
+            w.family('cpuweb_disk_read_bytes', 'counter', 'Bytes read from all disks', io.read_bytes, 'bytes')
+            w.family('cpuweb_disk_written_bytes', 'counter', 'Bytes written to all disks', io.write_bytes, 'bytes')
+
+        families: Dict[str, list] = {}
+        for sensor in sensors:
+            family = SENSOR_FAMILIES.get(sensor['unit'])
+            if family and sensor['value'] is not None:
+                families.setdefault(family[0], []).append(
+                    ({'sensor': sensor['name'], 'label': sensor['label']}, sensor['value'] * family[1]))
+        for suffix, samples in families.items():
+            w.family(f'cpuweb_sensor_{suffix}', 'gauge', 'Sysfs sensor reading', samples, suffix.rsplit('_', 1)[1])
+
+        w.family('cpuweb_fan_running', 'gauge', 'Fan running (1) or stopped (0)', int(bool(fan.get('is_running'))))
+        w.family('cpuweb_fan_auto_mode', 'gauge', 'Fan in auto mode (1) or manual (0)',
+                 int(fan.get('mode') == 'auto'))
+        w.family('cpuweb_fan_cycle_remaining_seconds', 'gauge', 'Seconds until next fan state switch',
+                 fan.get('current_cycle_remaining', 0), 'seconds')
+        w.family('cpuweb_fan_target_temperature_celsius', 'gauge', 'Fan auto mode target temperature',
+                 fan.get('target_temp'), 'celsius')
+
+        w.family('cpuweb_uptime_seconds', 'gauge', 'System uptime', info.get('uptime'), 'seconds')
+        w.family('cpuweb_collector_cpu_seconds', 'counter', 'CPU time spent by the collector thread',
+                 round(collector.get('cpu_time', 0), 6), 'seconds')
+        w.family('cpuweb_collector_interval_seconds', 'gauge', 'Current collector interval',
+                 collector.get('interval'), 'seconds')
+
+        payloads = {openmetrics: w.render(openmetrics) for openmetrics in (True, False)}
+        with self._lock:
+            self._payloads = payloads
+            if self._slots is not None:
+                for openmetrics, payload in payloads.items():
+                    self._slots[openmetrics].write(payload)
+
+
+# 创建导出实例
+metrics_exposition = MetricsExposition()
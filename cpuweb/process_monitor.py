@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+进程监控模块
+在多次刷新之间复用 psutil.Process 对象（cpu_percent 依赖上一次采样），
+只为新出现的PID创建对象并淘汰已退出的进程；仅在有客户端查看进程表时才刷新
+"""
+import time
+import threading
+import logging
+from typing import Dict, List, Optional
+
+import psutil
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 进程表最小刷新间隔（秒）
+PROCESS_REFRESH_INTERVAL = 5
+# 最后一次请求进程表后继续刷新的时长（秒）
+PROCESS_DEMAND_TIMEOUT = 30
+# 单次返回的最大进程数
+MAX_TOP = 100
+
+
+class ProcessMonitor:
+    def __init__(self, refresh_interval: float = PROCESS_REFRESH_INTERVAL):
+        """
+        初始化进程监控
+        :param refresh_interval: 最小刷新间隔（秒）
+        """
+        self.refresh_interval = refresh_interval
+        self._processes: Dict[int, psutil.Process] = {}
+        self._names: Dict[int, str] = {}
+        self._table: List[Dict] = []
+        self._last_refresh = 0.0
+        self._last_demand = 0.0
+        self._refresh_ms = 0.0
+        self._lock = threading.Lock()
+        # 多进程模式下的工作进程为 True：进程表由采集进程刷新，本进程只载入结果
+        self.remote = False
+
+    def mark_demand(self, timestamp: Optional[float] = None):
+        """
+        记录一次进程表请求
+        :param timestamp: 请求时间，默认为当前时间（多进程模式下由工作进程通过共享内存传入）
+        """
+        self._last_demand = max(self._last_demand, timestamp or time.time())
+
+    def wanted(self) -> bool:
+        """是否有客户端在查看进程表且已到达刷新间隔"""
+        now = time.time()
+        return (now - self._last_demand < PROCESS_DEMAND_TIMEOUT
+                and now - self._last_refresh >= self.refresh_interval)
+
+    def refresh(self):
+        """增量刷新进程表：新增PID创建 Process 对象，已退出的PID从缓存中淘汰"""
+        with self._lock:
+            start = time.perf_counter()
+            current_pids = set(psutil.pids())
+
+            # 淘汰已退出的进程
+            for pid in list(self._processes):
+                if pid not in current_pids:
+                    del self._processes[pid]
+                    self._names.pop(pid, None)
+
+            table = []
+            for pid in current_pids:
+                proc = self._processes.get(pid)
+                try:
+                    if proc is None:
+                        # 新进程首次调用 cpu_percent 只建立基准，返回0
+                        proc = psutil.Process(pid)
+                        self._processes[pid] = proc
+                        self._names[pid] = proc.name()
+                    with proc.oneshot():
+                        cpu = proc.cpu_percent(interval=None)
+                        rss = proc.memory_info().rss
+                        status = proc.status()
+                    table.append({
+                        'pid': pid,
+                        'name': self._names.get(pid, ''),
+                        'cpu_percent': round(cpu, 1),
+                        'rss': rss,
+                        'status': status
+                    })
+                except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                    self._processes.pop(pid, None)
+                    self._names.pop(pid, None)
+                except psutil.AccessDenied:
+                    continue
+
+            self._table = table
+            self._last_refresh = time.time()
+            self._refresh_ms = (time.perf_counter() - start) * 1000
+
+    def export(self) -> Dict:
+        """导出完整进程表，供采集进程写入共享内存"""
+        return {'table': self._table, 'as_of': self._last_refresh, 'refresh_ms': self._refresh_ms}
+
+    def load(self, data: Dict):
+        """
+        载入采集进程导出的进程表（工作进程使用，不在本进程中刷新）
+        :param data: export() 的返回值
+        """
+        self._table = data['table']
+        self._last_refresh = data['as_of']
+        self._refresh_ms = data['refresh_ms']
+
+    def top(self, n: int = 10, sort: str = 'cpu') -> Dict:
+        """
+        获取按CPU或内存排序的前N个进程
+        :param n: 返回数量
+        :param sort: 排序字段，cpu 或 rss
+        :return: 进程表；工作进程尚未收到采集进程的第一次刷新结果时返回 503（warming_up）
+        """
+        self.mark_demand()
+        if not self._last_refresh:
+            if self.remote:
+                # 不在请求线程中同步扫描所有进程，等待采集进程刷新
+                return {"success": False, "warming_up": True, "message": "进程表正在生成，请稍后重试", "status": 503}
+            self.refresh()
+        key = 'rss' if sort == 'rss' else 'cpu_percent'
+        table = self._table
+        top = sorted(table, key=lambda p: p[key], reverse=True)[:max(1, min(n, MAX_TOP))]
+        return {
+            "success": True,
+            "sort": 'rss' if sort == 'rss' else 'cpu',
+            "processes": top,
+            "total_processes": len(table),
+            "as_of": self._last_refresh,
+            "refresh_ms": round(self._refresh_ms, 2)
+        }
+
+
+# 创建进程监控实例
+process_monitor = ProcessMonitor()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名搜索索引模块
+在目录大小索引的数据库中维护 base_path 下所有条目的表（entries），并用 SQLite FTS5 trigram 分词器建立名称的三元组索引，
+任意位置的子串搜索（至少3个字符）直接命中索引，不需要扫描全表。
+
+- 作为目录大小索引的监听器：后台扫描或 inotify 触发的单层重扫结果先在内存中按目录合并，
+  随索引的批量写入与数据库中已有的条目做差异比较，只写入新增、删除和变化的条目
+- 缓冲的条目数超过 FLUSH_ROWS 或最早的变化超过 FLUSH_DELAY 秒时请求提前写入，内存占用有界
+- 查询在每个进程中直接读取数据库，按条目 id 做键集分页
+"""
+import os
+import json
+import time
+import base64
+import sqlite3
+import threading
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 缓冲的条目数上限，超过后请求立即写入
+FLUSH_ROWS = 50000
+# 变化最多缓冲的时间（秒），决定新文件在搜索结果中出现的延迟
+FLUSH_DELAY = 5.0
+# 三元组索引要求的最短查询长度，更短的查询退化为全表扫描
+MIN_TRIGRAM = 3
+# 单页最多返回的条目数
+MAX_SEARCH_LIMIT = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    is_dir INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS entries_dir ON entries (dir, name);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+    name, content='entries', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+    INSERT INTO entries_fts (rowid, name) VALUES (new.id, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+    INSERT INTO entries_fts (entries_fts, rowid, name) VALUES ('delete', old.id, old.name);
+END;
+"""
+
+_SELECT = 'SELECT e.id, e.dir, e.name, e.is_dir, e.size, e.mtime FROM '
+
+
+def _format_time(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class FilenameIndex:
+    def __init__(self, db_path: str):
+        """
+        初始化文件名搜索索引（由 DirectorySizeIndex.add_listener 注册后才会被维护）
+        :param db_path: 与目录大小索引共用的 SQLite 数据库文件路径
+        """
+        self.db_path = db_path
+        self._scans: Dict[str, List[tuple]] = {}
+        self._removed: set = set()
+        self._rows = 0
+        self._since = 0.0
+        self._lock = threading.Lock()
+
+    # ---- 目录大小索引的监听器接口（在索引维护线程中调用） ----
+
+    def setup(self, conn: sqlite3.Connection):
+        """创建表结构；SQLite 不支持 trigram 分词器（3.34 以前）时只创建普通表"""
+        conn.executescript(SCHEMA)
+        try:
+            conn.executescript(FTS_SCHEMA)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite 不支持 FTS5 trigram，文件名搜索将使用全表扫描: {e}")
+
+    def start(self):
+        """写入由目录大小索引的维护线程完成，没有自己的后台线程"""
+
+    def close(self):
+        """没有需要停止的后台线程"""
+
+    def scanned(self, rel_dir: str, records: List[tuple]):
+        """
+        目录完成一次单层扫描
+        :param rel_dir: 相对 base_path 的目录路径
+        :param records: [(名称, 是否目录, stat结果)]
+        """
+        with self._lock:
+            old = self._scans.get(rel_dir)
+            self._rows += len(records) - (len(old) if old is not None else 0)
+            self._scans[rel_dir] = records
+            if not self._since:
+                self._since = time.monotonic()
+
+    def removed(self, rel_dir: str):
+        """目录及其子树已被删除"""
+        with self._lock:
+            prefix = rel_dir + '/'
+            for key in [k for k in self._scans if not rel_dir or k == rel_dir or k.startswith(prefix)]:
+                self._rows -= len(self._scans.pop(key))
+            self._removed.add(rel_dir)
+            if not self._since:
+                self._since = time.monotonic()
+
+    def pending(self) -> bool:
+        """是否有待写入的变化"""
+        return bool(self._scans or self._removed)
+
+    def wants_flush(self) -> bool:
+        """缓冲的变化是否需要提前写入"""
+        return self._rows >= FLUSH_ROWS or bool(self._since and time.monotonic() - self._since >= FLUSH_DELAY)
+
+    def write(self, conn: sqlite3.Connection):
+        """在目录大小索引的写入事务中写入缓冲的变化"""
+        with self._lock:
+            scans, self._scans = self._scans, {}
+            removed, self._removed = self._removed, set()
+            self._rows = 0
+            self._since = 0.0
+        for rel_dir in removed:
+            if rel_dir:
+                conn.execute('DELETE FROM entries WHERE dir = ? OR (dir > ? AND dir < ?)',
+                             (rel_dir, rel_dir + '/', rel_dir + '0'))
+            else:
+                conn.execute('DELETE FROM entries')
+        inserts, updates, deletes = [], [], []
+        for rel_dir, records in scans.items():
+            existing = {name: (entry_id, is_dir, size, mtime) for entry_id, name, is_dir, size, mtime in conn.execute(
+                'SELECT id, name, is_dir, size, mtime FROM entries WHERE dir = ?', (rel_dir,))}
+            for name, is_dir, st in records:
+                row = (int(is_dir), 0 if is_dir else st.st_size, st.st_mtime)
+                old = existing.pop(name, None)
+                if old is None:
+                    inserts.append((rel_dir, name) + row)
+                elif old[1:] != row:
+                    updates.append(row + (old[0],))
+            deletes.extend((entry_id,) for entry_id, _, _, _ in existing.values())
+        conn.executemany('DELETE FROM entries WHERE id = ?', deletes)
+        conn.executemany('UPDATE entries SET is_dir = ?, size = ?, mtime = ? WHERE id = ?', updates)
+        conn.executemany('INSERT INTO entries (dir, name, is_dir, size, mtime) VALUES (?, ?, ?, ?, ?)', inserts)
+
+    # ---- 查询 ----
+
+    @staticmethod
+    def _encode_cursor(last_id: int) -> str:
+        return base64.urlsafe_b64encode(json.dumps({'i': last_id}).encode()).decode().rstrip('=')
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Optional[int]:
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            if isinstance(data, dict) and isinstance(data.get('i'), int):
+                return data['i']
+        except (ValueError, TypeError):
+            pass
+        return None
+
+    def search(self, q: str, path: str = '', entry_type: Optional[str] = None, min_size: Optional[int] = None,
+               modified_after: Optional[float] = None, limit: int = 100, cursor: Optional[str] = None) -> Dict:
+        """
+        搜索文件名（不区分大小写的子串匹配）
+        :param q: 查询字符串
+        :param path: 只搜索该目录（相对 base_path）下的条目
+        :param entry_type: file 或 directory
+        :param min_size: 最小文件大小（字节）
+        :param modified_after: 修改时间晚于该时间戳
+        :param limit: 每页条目数
+        :param cursor: 上一页返回的 next_cursor
+        :return: 搜索结果
+        """
+        last_id = 0
+        if cursor:
+            last_id = self._decode_cursor(cursor)
+            if last_id is None:
+                return {"success": False, "message": "无效的分页游标"}
+        if not os.path.exists(self.db_path):
+            return {"success": True, "items": [], "next_cursor": None, "indexed": False}
+
+        conditions, params = [], []
+        if path:
+            conditions.append('(e.dir = ? OR (e.dir > ? AND e.dir < ?))')
+            params.extend((path, path + '/', path + '0'))
+        if entry_type is not None:
+            conditions.append('e.is_dir = ?')
+            params.append(int(entry_type == 'directory'))
+        if min_size is not None:
+            conditions.append('e.size >= ?')
+            params.append(min_size)
+        if modified_after is not None:
+            conditions.append('e.mtime > ?')
+            params.append(modified_after)
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            has_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'entries_fts'").fetchone() is not None
+            if has_fts and len(q) >= MIN_TRIGRAM:
+                # 短语查询：三元组索引保证子串匹配，结果按 rowid 有序
+                sql = (_SELECT + 'entries_fts JOIN entries e ON e.id = entries_fts.rowid '
+                       'WHERE entries_fts MATCH ? AND entries_fts.rowid > ?')
+                params = ['"' + q.replace('"', '""') + '"', last_id] + params
+                order = ' ORDER BY entries_fts.rowid LIMIT ?'
+            else:
+                escaped = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                sql = _SELECT + "entries e WHERE e.name LIKE ? ESCAPE '\\' AND e.id > ?"
+                params = [f'%{escaped}%', last_id] + params
+                order = ' ORDER BY e.id LIMIT ?'
+            if conditions:
+                sql += ' AND ' + ' AND '.join(conditions)
+            rows = conn.execute(sql + order, params + [limit + 1]).fetchall()
+        except sqlite3.OperationalError as e:
+            # 维护线程尚未创建表
+            logger.warning(f"文件名搜索失败: {e}")
+            return {"success": True, "items": [], "next_cursor": None, "indexed": False}
+        finally:
+            conn.close()
+
+        items = []
+        for entry_id, rel_dir, name, is_dir, size, mtime in rows[:limit]:
+            items.append({
+                "name": name,
+                "path": f"{rel_dir}/{name}" if rel_dir else name,
+                "type": "directory" if is_dir else "file",
+                "size": size,
+                "modified": _format_time(mtime)
+            })
+        return {
+            "success": True,
+            "items": items,
+            "next_cursor": self._encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None,
+            "indexed": True
+        }
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+传感器注册模块
+启动时一次性发现所有 thermal zone、hwmon 和 power_supply 传感器并保持文件描述符打开，
+每个采集周期使用 os.pread 批量读取，避免反复探测路径和打开文件
+"""
+import os
+import re
+import glob
+import threading
+import logging
+from typing import Callable, Dict, List, Optional
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# sysfs 数值文件很短，一次读取足够
+READ_SIZE = 64
+
+
+class Sensor:
+    def __init__(self, name: str, path: str, unit: str, scale: float = 1.0, label: str = ''):
+        """
+        单个传感器
+        :param name: 指标名称，例如 thermal.cpu、hwmon0.power1
+        :param path: sysfs 文件路径
+        :param unit: 单位
+        :param scale: 原始值除以该系数得到带单位的值
+        :param label: 传感器描述
+        """
+        self.name = name
+        self.path = path
+        self.unit = unit
+        self.scale = scale
+        self.label = label
+        self.fd = None
+
+    def open(self):
+        self.fd = os.open(self.path, os.O_RDONLY)
+
+    def read(self) -> Optional[float]:
+        """使用 pread 从偏移0重新读取，sysfs 每次都会生成最新值"""
+        try:
+            raw = os.pread(self.fd, READ_SIZE, 0)
+            return round(int(raw.strip()) / self.scale, 3)
+        except (OSError, ValueError):
+            return None
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def _read_text(path: str) -> str:
+    """读取 sysfs 文本属性（仅在发现阶段使用）"""
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return ''
+
+
+def _metric_name(text: str) -> str:
+    """将 sysfs 中的名称规范化为指标名称片段"""
+    return re.sub(r'[^a-z0-9_]+', '_', text.lower()).strip('_')
+
+
+def discover_thermal_zones() -> List[Sensor]:
+    """发现所有 thermal zone，名称取自 type 属性（cpu-thermal -> thermal.cpu）"""
+    sensors = []
+    for zone in sorted(glob.glob('/sys/class/thermal/thermal_zone*'), key=lambda p: int(re.sub(r'\D', '', p) or 0)):
+        zone_type = _read_text(os.path.join(zone, 'type'))
+        short = _metric_name(re.sub(r'[-_]?thermal$', '', zone_type)) or os.path.basename(zone)
+        sensors.append(Sensor(f'thermal.{short}', os.path.join(zone, 'temp'), '°C', 1000.0, zone_type))
+    return sensors
+
+
+# hwmon 属性前缀 -> (单位, 换算系数)
+HWMON_TYPES = {
+    'temp': ('°C', 1000.0),
+    'in': ('V', 1000.0),
+    'curr': ('A', 1000.0),
+    'power': ('W', 1000000.0),
+    'fan': ('RPM', 1.0),
+}
+
+
+def discover_hwmon() -> List[Sensor]:
+    """发现所有 hwmon 传感器（hwmon0.temp1、hwmon0.power1 等）"""
+    sensors = []
+    for hwmon in sorted(glob.glob('/sys/class/hwmon/hwmon*')):
+        device = os.path.basename(hwmon)
+        chip = _read_text(os.path.join(hwmon, 'name'))
+        for input_path in sorted(glob.glob(os.path.join(hwmon, '*_input'))):
+            attr = os.path.basename(input_path)[:-len('_input')]
+            match = re.match(r'([a-z]+)(\d+)$', attr)
+            if not match or match.group(1) not in HWMON_TYPES:
+                continue
+            unit, scale = HWMON_TYPES[match.group(1)]
+            label = _read_text(os.path.join(hwmon, f'{attr}_label')) or chip
+            sensors.append(Sensor(f'{device}.{attr}', input_path, unit, scale, label))
+    return sensors
+
+
+# power_supply 属性 -> (单位, 换算系数)
+POWER_SUPPLY_ATTRS = {
+    'voltage_now': ('V', 1000000.0),
+    'current_now': ('A', 1000000.0),
+    'power_now': ('W', 1000000.0),
+    'capacity': ('%', 1.0),
+    'temp': ('°C', 10.0),
+}
+
+
+def discover_power_supply() -> List[Sensor]:
+    """发现所有 power_supply 数值属性（power_supply.battery.voltage_now 等）"""
+    sensors = []
+    for supply in sorted(glob.glob('/sys/class/power_supply/*')):
+        supply_name = _metric_name(os.path.basename(supply))
+        for attr, (unit, scale) in POWER_SUPPLY_ATTRS.items():
+            path = os.path.join(supply, attr)
+            if os.path.exists(path):
+                sensors.append(Sensor(f'power_supply.{supply_name}.{attr}', path, unit, scale, os.path.basename(supply)))
+    return sensors
+
+
+class SensorRegistry:
+    def __init__(self):
+        """初始化传感器注册表"""
+        self._providers: List[Callable[[], List[Sensor]]] = []
+        self._sensors: Dict[str, Sensor] = {}
+        self._values: Dict[str, Optional[float]] = {}
+        self._lock = threading.Lock()
+        self._discovered = False
+
+    def register_provider(self, provider: Callable[[], List[Sensor]]):
+        """
+        注册传感器发现函数
+        :param provider: 返回 Sensor 列表的函数
+        """
+        self._providers.append(provider)
+        self._discovered = False
+
+    def discover(self):
+        """运行所有发现函数并打开传感器文件，重复名称自动追加序号"""
+        with self._lock:
+            for sensor in self._sensors.values():
+                sensor.close()
+            self._sensors = {}
+            for provider in self._providers:
+                try:
+                    found = provider()
+                except Exception as e:
+                    logger.warning(f"传感器发现失败 {getattr(provider, '__name__', provider)}: {e}")
+                    continue
+                for sensor in found:
+                    name, index = sensor.name, 1
+                    while name in self._sensors:
+                        index += 1
+                        name = f'{sensor.name}_{index}'
+                    sensor.name = name
+                    try:
+                        sensor.open()
+                    except OSError as e:
+                        logger.debug(f"无法打开传感器 {sensor.path}: {e}")
+                        continue
+                    self._sensors[name] = sensor
+            self._discovered = True
+        logger.info(f"已发现 {len(self._sensors)} 个传感器")
+
+    def read_all(self) -> Dict[str, Optional[float]]:
+        """
+        批量读取所有传感器，每个采集周期调用一次
+        :return: 指标名称 -> 数值（读取失败为 None）
+        """
+        if not self._discovered:
+            self.discover()
+        with self._lock:
+            values = {name: sensor.read() for name, sensor in self._sensors.items()}
+            self._values = values
+        return values
+
+    def values(self) -> Dict[str, Optional[float]]:
+        """获取最近一次批量读取的结果"""
+        return self._values
+
+    def get(self, name: str) -> Optional[float]:
+        """
+        读取单个传感器的最新值（不触发批量读取）
+        :param name: 指标名称
+        """
+        sensor = self._sensors.get(name)
+        return sensor.read() if sensor else None
+
+    def find(self, prefix: str) -> List[str]:
+        """按前缀查找传感器名称"""
+        return [name for name in self._sensors if name.startswith(prefix)]
+
+    def describe(self) -> List[Dict]:
+        """列出所有传感器的元信息和最近读数"""
+        return [
+            {
+                "name": name,
+                "unit": sensor.unit,
+                "label": sensor.label,
+                "path": sensor.path,
+                "value": self._values.get(name)
+            }
+            for name, sensor in self._sensors.items()
+        ]
+
+
+# 创建传感器注册表实例并注册内置发现函数
+sensor_registry = SensorRegistry()
+sensor_registry.register_provider(discover_thermal_zones)
+sensor_registry.register_provider(discover_hwmon)
+sensor_registry.register_provider(discover_power_supply)
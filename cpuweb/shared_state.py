@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多进程共享状态模块
+生产模式（gunicorn 预派生多个工作进程）下，由主进程在派生任何子进程之前创建一块匿名共享内存（MAP_SHARED），
+随后派生唯一的采集进程；工作进程通过 fork 继承同一块内存，只读取采集进程发布的快照，不再各自运行采集线程。
+
+共享内存布局：
+- 头部：采集进程PID（采集进程意外退出时由主进程重新派生，见 supervise_collector）、最后一次客户端请求时间、最后一次进程表请求时间、采集频率状态
+- 槽位：system（/api/system 快照）、metrics / metrics_text（/metrics 文本）、processes（进程表）、
+  store（数据库统计）、store_pending（未写盘的指标汇总），每个槽位使用顺序锁（seqlock）+ 内容摘要，单写多读、无需跨进程锁
+- 区域：history（指标历史环形缓冲区）
+
+工作进程发往采集进程的命令（唤醒、风扇控制）通过 multiprocessing.Queue 传递
+"""
+import os
+import sys
+import json
+import mmap
+import time
+import queue
+import signal
+import struct
+import hashlib
+import logging
+import threading
+import multiprocessing
+from typing import Any, Dict, Optional, Tuple
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 槽位名称 -> 容量（字节）
+SLOT_SIZES = {
+    'system': 256 * 1024,
+    'metrics': 256 * 1024,
+    'metrics_text': 256 * 1024,
+    'processes': 512 * 1024,
+    'store': 16 * 1024,
+    'store_pending': 32 * 1024,
+}
+# 区域起始地址对齐（字节）
+ALIGNMENT = 64
+# 读取时遇到写入中的槽位最多重试次数
+READ_RETRIES = 100
+# 采集进程处于空闲频率时，同一工作进程两次唤醒请求的最小间隔（秒）
+WAKE_INTERVAL = 1.0
+# 采集进程检查主进程是否存活的间隔（秒）
+PARENT_CHECK_INTERVAL = 2.0
+# 主进程检查采集进程是否存活的间隔（秒）
+COLLECTOR_CHECK_INTERVAL = 5.0
+
+# 当前进程角色：None（开发服务器单进程）、'collector'（采集进程）、'worker'（工作进程）
+role: Optional[str] = None
+# 当前进程可见的共享内存，仅多进程模式下存在
+board: Optional['SharedBoard'] = None
+# 采集进程PID，仅在主进程中存在
+collector_pid = 0
+# 主进程中保护采集进程的派生与停止
+_collector_lock = threading.Lock()
+# 主进程退出时停止监视线程，不再重新派生采集进程
+_supervisor_stop = threading.Event()
+
+# 头部字段 -> (偏移, 格式)
+_HEADER_FIELDS = {
+    'collector_pid': (0, '<q'),
+    'client_activity': (8, '<d'),
+    'process_demand': (16, '<d'),
+    'collector_active': (24, '<q'),
+}
+_HEADER_SIZE = 32
+# 槽位头部：顺序号、版本号、发布时间、内容长度、内容摘要
+_SLOT_HEADER = struct.Struct('<QQdQ8s')
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class SharedSlot:
+    """共享内存中的单写多读槽位"""
+
+    def __init__(self, buffer: memoryview):
+        self._buf = buffer
+        self.capacity = len(buffer) - _SLOT_HEADER.size
+
+    def version(self) -> int:
+        """已发布的版本号（0表示尚未发布），只读取8字节，适合轮询"""
+        return struct.unpack_from('<Q', self._buf, 8)[0]
+
+    def write(self, payload: bytes, timestamp: Optional[float] = None) -> int:
+        """
+        发布新内容（只能由采集进程调用）
+        :param payload: 内容
+        :param timestamp: 发布时间，默认为当前时间
+        :return: 新版本号
+        """
+        if len(payload) > self.capacity:
+            raise ValueError(f"内容大小 {len(payload)} 超过槽位容量 {self.capacity}")
+        seq, version = struct.unpack_from('<QQ', self._buf, 0)
+        digest = hashlib.blake2b(payload, digest_size=8).digest()
+        # 顺序号为奇数表示正在写入
+        struct.pack_into('<Q', self._buf, 0, seq + 1)
+        self._buf[_SLOT_HEADER.size:_SLOT_HEADER.size + len(payload)] = payload
+        struct.pack_into(_SLOT_HEADER.format, self._buf, 0, seq + 2, version + 1,
+                         timestamp or time.time(), len(payload), digest)
+        return version + 1
+
+    def read(self) -> Optional[Tuple[int, float, str, bytes]]:
+        """
+        读取一份一致的内容
+        :return: (版本号, 发布时间, 摘要, 内容)，尚未发布或多次重试仍不一致时返回 None
+        """
+        for _ in range(READ_RETRIES):
+            seq, version, timestamp, length, digest = _SLOT_HEADER.unpack_from(self._buf, 0)
+            if version == 0:
+                return None
+            if seq % 2 == 0 and length <= self.capacity:
+                payload = bytes(self._buf[_SLOT_HEADER.size:_SLOT_HEADER.size + length])
+                # 顺序号未变化且摘要一致才说明读取期间没有发生写入
+                if (struct.unpack_from('<Q', self._buf, 0)[0] == seq
+                        and hashlib.blake2b(payload, digest_size=8).digest() == digest):
+                    return version, timestamp, digest.hex(), payload
+            time.sleep(0)
+        return None
+
+    def write_json(self, data: Any) -> int:
+        return self.write(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+    def read_json(self) -> Optional[Any]:
+        result = self.read()
+        return json.loads(result[3]) if result else None
+
+
+class SharedBoard:
+    def __init__(self, regions: Optional[Dict[str, int]] = None, slots: Optional[Dict[str, int]] = None):
+        """
+        创建匿名共享内存，必须在派生采集进程和工作进程之前调用
+        :param regions: 额外的原始区域名称 -> 大小（字节），例如指标历史缓冲区
+        :param slots: 槽位名称 -> 容量（字节）
+        """
+        self._layout: Dict[str, Tuple[int, int]] = {}
+        offset = _align(_HEADER_SIZE)
+        for name, size in (slots or SLOT_SIZES).items():
+            self._layout[name] = (offset, size + _SLOT_HEADER.size)
+            offset = _align(offset + size + _SLOT_HEADER.size)
+        for name, size in (regions or {}).items():
+            self._layout[name] = (offset, size)
+            offset = _align(offset + size)
+        self.size = offset
+        # fd=-1 的映射是匿名的 MAP_SHARED 内存，fork 后父子进程共享同一物理页，所有进程退出后自动释放
+        self._mmap = mmap.mmap(-1, self.size)
+        self._view = memoryview(self._mmap)
+        self._slots = {name: SharedSlot(self.region(name)) for name in (slots or SLOT_SIZES)}
+        self._commands = multiprocessing.get_context('fork').Queue()
+        self._last_wake = 0.0
+
+    def region(self, name: str) -> memoryview:
+        """获取原始区域"""
+        offset, size = self._layout[name]
+        return self._view[offset:offset + size]
+
+    def slot(self, name: str) -> SharedSlot:
+        """获取槽位"""
+        return self._slots[name]
+
+    def _get(self, field: str):
+        offset, fmt = _HEADER_FIELDS[field]
+        return struct.unpack_from(fmt, self._view, offset)[0]
+
+    def _set(self, field: str, value):
+        # 每个字段单独写入，不同进程写不同字段时互不覆盖
+        offset, fmt = _HEADER_FIELDS[field]
+        struct.pack_into(fmt, self._view, offset, value)
+
+    @property
+    def collector_pid(self) -> int:
+        return self._get('collector_pid')
+
+    @collector_pid.setter
+    def collector_pid(self, pid: int):
+        self._set('collector_pid', pid)
+
+    @property
+    def client_activity(self) -> float:
+        """所有工作进程中最后一次客户端请求的时间"""
+        return self._get('client_activity')
+
+    @property
+    def process_demand(self) -> float:
+        """所有工作进程中最后一次进程表请求的时间"""
+        return self._get('process_demand')
+
+    @property
+    def collector_active(self) -> bool:
+        """采集进程是否处于快速采集频率"""
+        return bool(self._get('collector_active'))
+
+    @collector_active.setter
+    def collector_active(self, active: bool):
+        self._set('collector_active', int(active))
+
+    def touch_client(self):
+        """记录一次客户端请求；采集进程处于空闲频率时请求立即唤醒（限频）"""
+        now = time.time()
+        self._set('client_activity', now)
+        if not self.collector_active and now - self._last_wake >= WAKE_INTERVAL:
+            self._last_wake = now
+            self.send(('wake',))
+
+    def touch_process_demand(self):
+        """记录一次进程表请求"""
+        self._set('process_demand', time.time())
+
+    def send(self, command: Tuple):
+        """工作进程向采集进程发送命令"""
+        self._commands.put(command)
+
+    def receive(self, timeout: float) -> Optional[Tuple]:
+        """
+        采集进程等待下一条命令
+        :param timeout: 超时时间（秒）
+        :return: 命令元组，超时返回 None
+        """
+        try:
+            return self._commands.get(timeout=max(timeout, 0))
+        except queue.Empty:
+            return None
+
+
+def _collector_main():
+    """采集进程入口"""
+    global role
+    role = 'collector'
+    parent = os.getppid()
+    # SIGTERM 时正常退出，使 atexit 写入剩余的指标数据
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # 重新派生时继承了 gunicorn 主进程的信号处理函数，恢复默认处理
+    for signum in (signal.SIGHUP, signal.SIGQUIT, signal.SIGUSR1, signal.SIGUSR2,
+                   signal.SIGTTIN, signal.SIGTTOU, signal.SIGWINCH, signal.SIGCHLD):
+        signal.signal(signum, signal.SIG_DFL)
+    board.collector_pid = os.getpid()
+
+    import app
+
+    def watch_parent():
+        # 主进程被强制结束时采集进程随之退出
+        while os.getppid() == parent:
+            time.sleep(PARENT_CHECK_INTERVAL)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    threading.Thread(target=watch_parent, daemon=True).start()
+    logger.info(f"采集进程已启动，PID: {os.getpid()}")
+    app.run_collector()
+
+
+def _spawn_collector() -> int:
+    """派生采集进程，返回PID"""
+    # 直接 fork 而不使用 multiprocessing.Process，避免工作进程退出时 multiprocessing 试图 join 兄弟进程
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _collector_main()
+        except SystemExit as e:
+            code = e.code or 0
+        except BaseException:
+            logger.exception("采集进程异常退出")
+            code = 1
+        finally:
+            logging.shutdown()
+            os._exit(code)
+    return pid
+
+
+def start_collector():
+    """
+    在主进程中创建共享内存并派生唯一的采集进程（gunicorn on_starting 钩子中调用，早于工作进程派生）
+    """
+    global board, collector_pid
+    from metrics_history import metrics_history
+    board = SharedBoard(regions={'history': metrics_history.shared_size()})
+    with _collector_lock:
+        collector_pid = _spawn_collector()
+
+
+def _collector_alive() -> bool:
+    try:
+        pid, _ = os.waitpid(collector_pid, os.WNOHANG)
+    except ChildProcessError:
+        # 已被 gunicorn 主进程回收（它的 SIGCHLD 处理会回收所有子进程）
+        return False
+    return pid == 0
+
+
+def supervise_collector():
+    """
+    在主进程中启动监视线程：采集进程意外退出时重新派生，新进程继续使用同一块共享内存，
+    工作进程无需重启（gunicorn when_ready 钩子中调用）
+    """
+    def run():
+        global collector_pid
+        while not _supervisor_stop.wait(COLLECTOR_CHECK_INTERVAL):
+            with _collector_lock:
+                if _supervisor_stop.is_set() or _collector_alive():
+                    continue
+                logger.error(f"采集进程 {collector_pid} 已退出，重新启动")
+                collector_pid = _spawn_collector()
+                logger.info(f"采集进程已重新启动，PID: {collector_pid}")
+
+    threading.Thread(target=run, daemon=True, name='collector-supervisor').start()
+
+
+def stop_collector(timeout: float = 10):
+    """停止采集进程并等待其写完剩余数据（gunicorn on_exit 钩子中调用）"""
+    _supervisor_stop.set()
+    with _collector_lock:
+        _stop_collector(timeout)
+
+
+def _stop_collector(timeout: float):
+    if not collector_pid:
+        return
+    try:
+        os.kill(collector_pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            pid, _ = os.waitpid(collector_pid, os.WNOHANG)
+        except ChildProcessError:
+            # 已被 gunicorn 主进程回收
+            return
+        if pid:
+            return
+        time.sleep(0.1)
+    os.kill(collector_pid, signal.SIGKILL)
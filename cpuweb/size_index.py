@@ -0,0 +1,657 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录大小索引模块
+为 base_path 下的每个目录维护直接文件大小/数量和整棵子树的汇总，/api/files/stats 直接读取汇总结果，不再遍历目录树。
+
+- 首次启动时由后台线程按广度优先扫描整棵树，每批最多 WALK_WORKERS 个目录在共享的扫描线程池（tree_walker）中并行扫描；
+  之后只对发生变化的目录做单层重扫，差值沿祖先链向上累加
+- Linux 上每个已扫描目录由 inotify 监视，事件合并 SETTLE_DELAY 秒后重扫；
+  超过监视上限的目录每 SWEEP_INTERVAL 秒检查一次 mtime（只能发现条目增删，文件原地增长要等下一次重扫）
+- 索引每 FLUSH_INTERVAL 秒批量写入 SQLite（WAL），重启后立即可用，随后在后台逐个目录重新校验
+- 每个目录记录子树中待重扫的目录数（pending），查询结果据此给出 stale 标志和 as_of 时间
+- 大小为文件的表观大小之和（st_size），硬链接按链接数重复计算
+
+多进程模式下只有采集进程维护索引，工作进程直接读取数据库。
+其他索引（例如文件名搜索）可以通过 add_listener() 复用同一次扫描结果，并在同一个写入事务中落盘
+"""
+import os
+import stat
+import time
+import atexit
+import sqlite3
+import threading
+import logging
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from inotify_watcher import InotifyWatcher, IN_Q_OVERFLOW, IN_IGNORED
+from tree_walker import executor, scan_directory, WALK_WORKERS
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'file_index.db')
+
+# 批量写入间隔（秒）
+FLUSH_INTERVAL = 30
+# 未被 inotify 监视的目录检查 mtime 的间隔（秒）
+SWEEP_INTERVAL = 300
+# 合并 inotify 事件的等待时间（秒），持续写入的目录最多每个周期重扫一次
+SETTLE_DELAY = 1.0
+# 最多占用系统 inotify 监视上限（fs.inotify.max_user_watches）的比例
+WATCH_SHARE = 0.5
+# depth 参数上限
+MAX_DEPTH = 4
+# 记住的优先扫描路径数量
+MAX_WANTED = 16
+# 优先扫描时最多遍历的子树目录数
+PRIORITY_VISITS = 10000
+# 监听器有待写入的变化时检查是否需要提前写入的间隔（秒）
+LISTENER_POLL = 0.5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    size INTEGER NOT NULL,
+    files INTEGER NOT NULL,
+    dirs INTEGER NOT NULL,
+    total_size INTEGER NOT NULL,
+    total_files INTEGER NOT NULL,
+    total_dirs INTEGER NOT NULL,
+    pending INTEGER NOT NULL,
+    unwatched INTEGER NOT NULL,
+    scanned_at REAL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS directories_parent ON directories (parent);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+UPSERT = """
+INSERT OR REPLACE INTO directories
+(path, parent, size, files, dirs, total_size, total_files, total_dirs, pending, unwatched, scanned_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_COLUMNS = 'path, size, total_size, total_files, total_dirs, pending, unwatched, scanned_at'
+
+
+def _max_watches() -> int:
+    try:
+        with open('/proc/sys/fs/inotify/max_user_watches') as f:
+            return int(int(f.read()) * WATCH_SHARE)
+    except (OSError, ValueError):
+        return 0
+
+
+def _join(parent: str, name: str) -> str:
+    return f"{parent}/{name}" if parent else name
+
+
+class _Node:
+    """一个目录：直接文件统计 + 子树汇总"""
+    __slots__ = ('path', 'parent', 'children', 'size', 'files', 'dirs', 'total_size', 'total_files',
+                 'total_dirs', 'pending', 'unwatched', 'dirty', 'generation', 'queued', 'watched',
+                 'mtime_ns', 'scanned_at')
+
+    def __init__(self, path: str, parent: Optional['_Node']):
+        self.path = path
+        self.parent = parent
+        self.children: Dict[str, '_Node'] = {}
+        self.size = self.files = self.dirs = 0
+        self.total_size = self.total_files = self.total_dirs = 0
+        self.pending = self.unwatched = 0
+        self.dirty = False
+        self.generation = 0
+        self.queued = False
+        self.watched = False
+        self.mtime_ns = 0
+        self.scanned_at: Optional[float] = None
+
+
+class DirectorySizeIndex:
+    def __init__(self, base_path: str, db_path: str = DEFAULT_DB_PATH, flush_interval: float = FLUSH_INTERVAL):
+        """
+        初始化目录大小索引（不会立即扫描，start() 后才在后台维护）
+        :param base_path: 索引的根目录（已解析的绝对路径）
+        :param db_path: SQLite 数据库文件路径
+        :param flush_interval: 批量写入间隔（秒）
+        """
+        self.base_path = str(base_path)
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        # 非维护进程请求优先扫描某个路径时调用，由 app 设置为发往采集进程的命令
+        self.remote: Optional[Callable[[str], None]] = None
+        self._nodes: Dict[str, _Node] = {}
+        self._queue: deque = deque()
+        self._wanted: deque = deque(maxlen=MAX_WANTED)
+        self._touched: set = set()
+        self._touched_at = 0.0
+        self._changed: set = set()
+        self._deleted: set = set()
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._loaded = False
+        self._conn: Optional[sqlite3.Connection] = None
+        self._watcher = InotifyWatcher(self._on_event, name='size-index-inotify')
+        self._max_watches = _max_watches() if self._watcher.available else 0
+        self._watches = 0
+        self._swept_at = time.time()
+        self._listeners: List = []
+
+    def add_listener(self, listener):
+        """
+        注册扫描结果的监听器（必须在 start() 之前调用），监听器需实现：
+        setup(conn) 创建表结构；scanned(目录, 扫描结果) 目录完成单层扫描；removed(目录) 子树被删除；
+        pending() 是否有待写入的变化；wants_flush() 是否需要提前写入；write(conn) 在写入事务中落盘；
+        start()/close() 随索引启动和停止（例如监听器自己的后台线程）
+        """
+        self._listeners.append(listener)
+
+    # ---- 查询 ----
+
+    def query(self, path: str, depth: int = 0) -> Optional[Dict]:
+        """
+        查询目录的子树汇总
+        :param path: 相对 base_path 的目录路径，根目录为空字符串
+        :param depth: 同时返回几层子目录的汇总（0~MAX_DEPTH）
+        :return: 汇总字典，目录尚未被索引时返回 None
+        """
+        depth = max(0, min(depth, MAX_DEPTH))
+        if self._thread is None or not self._loaded:
+            return self._query_db(path, depth)
+        with self._lock:
+            node = self._nodes.get(path)
+            if node is None:
+                return None
+            return self._describe(node, depth, time.time())
+
+    def _freshness(self, pending: int, unwatched: int, scanned_at: Optional[float], synced_at: float, swept_at: float):
+        """子树中有待重扫的目录时为 stale，as_of 取该目录自身最后一次扫描的时间"""
+        if pending:
+            return scanned_at, True
+        if unwatched:
+            return min(synced_at, swept_at), False
+        return synced_at, False
+
+    def _describe(self, node: _Node, depth: int, now: float) -> Dict:
+        as_of, stale = self._freshness(node.pending, node.unwatched, node.scanned_at, now, self._swept_at)
+        result = {
+            "name": node.path.rpartition('/')[2],
+            "path": node.path,
+            "size_bytes": node.total_size,
+            "file_count": node.total_files,
+            "directory_count": node.total_dirs,
+            "files_size_bytes": node.size,
+            "as_of": as_of,
+            "stale": stale
+        }
+        if depth > 0:
+            children = sorted(node.children.values(), key=lambda c: c.total_size, reverse=True)
+            result["children"] = [self._describe(child, depth - 1, now) for child in children]
+        return result
+
+    def _query_db(self, path: str, depth: int) -> Optional[Dict]:
+        if not os.path.exists(self.db_path):
+            return None
+        conn = sqlite3.connect(self.db_path)
+        try:
+            meta = dict(conn.execute('SELECT key, value FROM meta').fetchall())
+            if meta.get('base_path') != self.base_path:
+                return None
+            synced_at = float(meta.get('synced_at', 0))
+            swept_at = float(meta.get('swept_at', synced_at))
+
+            def describe(row) -> Dict:
+                rel, size, total_size, total_files, total_dirs, pending, unwatched, scanned_at = row
+                as_of, stale = self._freshness(pending, unwatched, scanned_at, synced_at, swept_at)
+                return {
+                    "name": rel.rpartition('/')[2],
+                    "path": rel,
+                    "size_bytes": total_size,
+                    "file_count": total_files,
+                    "directory_count": total_dirs,
+                    "files_size_bytes": size,
+                    "as_of": as_of,
+                    "stale": stale
+                }
+
+            row = conn.execute(f'SELECT {_COLUMNS} FROM directories WHERE path = ?', (path,)).fetchone()
+            if row is None:
+                return None
+            result = describe(row)
+            level = [result]
+            for _ in range(depth):
+                parents = {item["path"]: item for item in level}
+                for item in level:
+                    item["children"] = []
+                level = []
+                for key in parents:
+                    for row in conn.execute(f'SELECT {_COLUMNS} FROM directories WHERE parent = ? '
+                                            'ORDER BY total_size DESC', (key,)):
+                        child = describe(row)
+                        parents[key]["children"].append(child)
+                        level.append(child)
+            return result
+        except sqlite3.Error as e:
+            logger.error(f"读取目录大小索引失败: {e}")
+            return None
+        finally:
+            conn.close()
+
+    def prioritize(self, path: str):
+        """
+        请求优先扫描某个路径（尚未索引或结果过时），扫描队列中它的祖先和子树会被提前
+        :param path: 相对 base_path 的目录路径
+        """
+        if self._thread is None:
+            if self.remote is not None:
+                self.remote(path)
+            return
+        with self._cond:
+            if path not in self._wanted:
+                self._wanted.append(path)
+            # 从最近的已索引祖先开始提前扫描
+            node = None
+            key = path
+            while node is None:
+                node = self._nodes.get(key)
+                if node is None:
+                    if not key:
+                        return
+                    key = key.rpartition('/')[0]
+            # 子树中已在队列里的目录按广度优先顺序移到队首（重复的队列项在处理时跳过）
+            found = []
+            level = [node]
+            visited = 0
+            while level and visited < PRIORITY_VISITS:
+                visited += len(level)
+                found.extend(item.path for item in level if item.queued)
+                level = [child for item in level if item.pending for child in item.children.values()]
+            self._queue.extendleft(reversed(found))
+            self._cond.notify()
+
+    def status(self) -> Dict:
+        """获取索引状态"""
+        with self._lock:
+            root = self._nodes.get('')
+            return {
+                "running": self._thread is not None,
+                "directories": len(self._nodes),
+                "queue": len(self._queue),
+                "pending": root.pending if root else None,
+                "watches": self._watches,
+                "max_watches": self._max_watches
+            }
+
+    # ---- 维护 ----
+
+    def _add(self, node: Optional[_Node], size: int = 0, files: int = 0, dirs: int = 0,
+             pending: int = 0, unwatched: int = 0):
+        """把差值累加到该目录及所有祖先的汇总上"""
+        while node is not None:
+            node.total_size += size
+            node.total_files += files
+            node.total_dirs += dirs
+            node.pending += pending
+            node.unwatched += unwatched
+            self._changed.add(node.path)
+            node = node.parent
+
+    def _wanted_related(self, path: str) -> bool:
+        for wanted in self._wanted:
+            if path == wanted or not path or wanted.startswith(path + '/') or path.startswith(wanted + '/'):
+                return True
+        return False
+
+    def _mark(self, node: _Node):
+        """标记目录需要重扫"""
+        node.generation += 1
+        if not node.dirty:
+            node.dirty = True
+            self._add(node, pending=1)
+        if not node.queued:
+            node.queued = True
+            if self._wanted and self._wanted_related(node.path):
+                self._queue.appendleft(node.path)
+            else:
+                self._queue.append(node.path)
+
+    def _create(self, path: str, parent: Optional[_Node]) -> _Node:
+        node = _Node(path, parent)
+        self._nodes[path] = node
+        if parent is not None:
+            parent.children[path.rpartition('/')[2]] = node
+        self._deleted.discard(path)
+        self._add(node, unwatched=1)
+        self._mark(node)
+        return node
+
+    def _remove(self, node: _Node):
+        """删除目录及其子树"""
+        self._add(node.parent, -node.total_size, -node.total_files, -node.total_dirs,
+                  -node.pending, -node.unwatched)
+        if node.parent is not None:
+            node.parent.children.pop(node.path.rpartition('/')[2], None)
+        self._deleted.add(node.path)
+        for listener in self._listeners:
+            listener.removed(node.path)
+        stack = [node]
+        while stack:
+            item = stack.pop()
+            stack.extend(item.children.values())
+            if item.watched:
+                self._watcher.unwatch(os.path.join(self.base_path, item.path))
+                self._watches -= 1
+            self._nodes.pop(item.path, None)
+            self._changed.discard(item.path)
+
+    def _scan(self, path: str, need_watch: bool) -> tuple:
+        """
+        在扫描线程池中执行：先建立监视再单层扫描目录，扫描期间的变化不会丢失（不持有锁）
+        :return: (是否已监视, (直接文件总大小, 文件数, 子目录名称列表, 目录mtime, 扫描结果))，目录已不存在时扫描结果为 None
+        """
+        full_path = os.path.join(self.base_path, path) if path else self.base_path
+        watched = need_watch and self._watcher.watch(full_path)
+        try:
+            mtime_ns = os.stat(full_path).st_mtime_ns
+            # 与 du 一致不跟随符号链接：链接按自身大小计为文件，不进入指向目录的链接（避免循环和重复统计）
+            records = scan_directory(full_path, True, follow_symlinks=False)
+        except (FileNotFoundError, NotADirectoryError):
+            return watched, None
+        except PermissionError:
+            logger.warning(f"无法访问: {full_path}, 跳过...")
+            return watched, (0, 0, [], mtime_ns, [])
+        size = files = 0
+        subdirs = []
+        for name, is_dir, st in records:
+            if is_dir:
+                subdirs.append(name)
+            elif stat.S_ISREG(st.st_mode) or stat.S_ISLNK(st.st_mode):
+                size += st.st_size
+                files += 1
+        return watched, (size, files, subdirs, mtime_ns, records)
+
+    def _begin(self, path: str) -> Optional[tuple]:
+        """从队列中取出目录准备扫描，返回 (事件序号, 是否需要建立监视)"""
+        node = self._nodes.get(path)
+        if node is None or not node.queued:
+            return None
+        node.queued = False
+        need_watch = not node.watched and self._watches < self._max_watches
+        if need_watch:
+            # 先占用监视名额，同一批次中的目录不会超过上限
+            self._watches += 1
+        return node.generation, need_watch
+
+    def _apply(self, path: str, generation: int, need_watch: bool, watched: bool, result: Optional[tuple]):
+        """把扫描结果合并到索引中（持有锁）"""
+        if need_watch and not watched:
+            self._watches -= 1
+        node = self._nodes.get(path)
+        if node is None:
+            if watched:
+                self._watcher.unwatch(os.path.join(self.base_path, path) if path else self.base_path)
+                self._watches -= 1
+            return
+        if watched:
+            node.watched = True
+            self._add(node, unwatched=-1)
+        if result is None:
+            # 目录已被删除或替换，由上级目录重扫时移除
+            if node.parent is not None:
+                self._mark(node.parent)
+            else:
+                logger.error(f"索引根目录不存在: {self.base_path}")
+            return
+        size, files, subdirs, mtime_ns, records = result
+        self._add(node, size - node.size, files - node.files, len(subdirs) - node.dirs)
+        node.size, node.files, node.dirs = size, files, len(subdirs)
+        names = set(subdirs)
+        for name in [n for n in node.children if n not in names]:
+            self._remove(node.children[name])
+        for name in subdirs:
+            if name not in node.children:
+                self._create(_join(path, name), node)
+        node.mtime_ns = mtime_ns
+        node.scanned_at = time.time()
+        self._changed.add(path)
+        for listener in self._listeners:
+            listener.scanned(path, records)
+        if node.generation == generation:
+            if node.dirty:
+                node.dirty = False
+                self._add(node, pending=-1)
+        elif not node.queued:
+            # 扫描期间又收到了事件
+            node.queued = True
+            self._queue.append(path)
+
+    def _process(self, paths: List[str]):
+        """在共享的扫描线程池中并行扫描一批目录，按出队顺序合并结果"""
+        with self._lock:
+            batch = [(path, self._begin(path)) for path in paths]
+        batch = [(path, state) for path, state in batch if state is not None]
+        pool = executor()
+        futures = [pool.submit(self._scan, path, need_watch) for path, (_, need_watch) in batch]
+        for (path, (generation, need_watch)), future in zip(batch, futures):
+            try:
+                watched, result = future.result()
+            except Exception as e:
+                # 该目录保持待重扫状态（stale），下一次事件或 mtime 检查时重试
+                logger.error(f"扫描目录失败 {path}: {e}")
+                with self._lock:
+                    if need_watch:
+                        self._watches -= 1
+                continue
+            with self._lock:
+                self._apply(path, generation, need_watch, watched, result)
+
+    def _on_event(self, path: str, mask: int, name: str):
+        with self._cond:
+            if mask & IN_Q_OVERFLOW:
+                logger.warning("inotify 事件队列溢出，重新校验整个目录大小索引")
+                for node in self._nodes.values():
+                    self._mark(node)
+                self._cond.notify()
+                return
+            rel = '' if path == self.base_path else path[len(self.base_path) + 1:]
+            node = self._nodes.get(rel)
+            if node is None:
+                return
+            if mask & IN_IGNORED:
+                # 监视已被内核移除，目录本身的删除由上级目录的事件处理
+                if node.watched:
+                    node.watched = False
+                    self._watches -= 1
+                    self._add(node, unwatched=1)
+                return
+            if not self._touched:
+                self._touched_at = time.monotonic()
+            self._touched.add(rel)
+            self._cond.notify()
+
+    def _sweep(self):
+        """检查未被监视的目录的 mtime"""
+        with self._lock:
+            candidates = [(node.path, node.mtime_ns) for node in self._nodes.values()
+                          if not node.watched and not node.dirty]
+        changed = []
+        for path, mtime_ns in candidates:
+            try:
+                if os.stat(os.path.join(self.base_path, path) if path else self.base_path).st_mtime_ns != mtime_ns:
+                    changed.append(path)
+            except OSError:
+                changed.append(path)
+        with self._lock:
+            for path in changed:
+                node = self._nodes.get(path)
+                if node is not None:
+                    self._mark(node)
+            self._swept_at = time.time()
+
+    def _load(self):
+        """从数据库加载上次的索引，所有目录标记为待重扫"""
+        conn = self._conn
+        meta = dict(conn.execute('SELECT key, value FROM meta').fetchall())
+        if meta.get('base_path') != self.base_path:
+            with conn:
+                conn.execute('DELETE FROM directories')
+                for listener in self._listeners:
+                    listener.removed('')
+                conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', ('base_path', self.base_path))
+        rows = conn.execute('SELECT path, size, files, dirs, total_size, total_files, total_dirs, scanned_at '
+                            'FROM directories ORDER BY path').fetchall()
+        with self._lock:
+            # 按路径排序后父目录总在子目录之前
+            for path, size, files, dirs, total_size, total_files, total_dirs, scanned_at in rows:
+                if path:
+                    parent = self._nodes.get(path.rpartition('/')[0])
+                    if parent is None:
+                        continue
+                elif self._nodes:
+                    continue
+                else:
+                    parent = None
+                node = _Node(path, parent)
+                node.size, node.files, node.dirs = size, files, dirs
+                node.total_size, node.total_files, node.total_dirs = total_size, total_files, total_dirs
+                node.scanned_at = scanned_at
+                self._nodes[path] = node
+                if parent is not None:
+                    parent.children[path.rpartition('/')[2]] = node
+            if '' not in self._nodes:
+                self._nodes.clear()
+                self._create('', None)
+            else:
+                # 从叶子到根累计 pending/unwatched，广度优先入队
+                for node in sorted(self._nodes.values(), key=lambda n: n.path.count('/') if n.path else -1,
+                                   reverse=True):
+                    node.pending += 1
+                    node.unwatched += 1
+                    node.dirty = True
+                    if node.parent is not None:
+                        node.parent.pending += node.pending
+                        node.parent.unwatched += node.unwatched
+                for node in sorted(self._nodes.values(), key=lambda n: n.path.count('/') if n.path else -1):
+                    node.queued = True
+                    self._queue.append(node.path)
+                self._changed.update(self._nodes)
+            self._loaded = True
+        logger.info(f"目录大小索引已加载 {len(rows)} 个目录")
+
+    def flush(self):
+        """将变化的目录批量写入数据库"""
+        with self._write_lock:
+            if self._conn is None:
+                return
+            with self._lock:
+                deleted, self._deleted = self._deleted, set()
+                changed, self._changed = self._changed, set()
+                rows = []
+                for path in changed:
+                    node = self._nodes.get(path)
+                    if node is not None:
+                        rows.append((path, node.parent.path if node.parent else None, node.size, node.files,
+                                     node.dirs, node.total_size, node.total_files, node.total_dirs,
+                                     node.pending, node.unwatched, node.scanned_at))
+                swept_at = self._swept_at
+            if not deleted and not rows and not any(listener.pending() for listener in self._listeners):
+                return
+            with self._conn:
+                for path in deleted:
+                    if path:
+                        self._conn.execute('DELETE FROM directories WHERE path = ? OR (path > ? AND path < ?)',
+                                           (path, path + '/', path + '0'))
+                    else:
+                        self._conn.execute('DELETE FROM directories')
+                self._conn.executemany(UPSERT, sorted(rows))
+                for listener in self._listeners:
+                    listener.write(self._conn)
+                self._conn.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                                       [('synced_at', str(time.time())), ('swept_at', str(swept_at))])
+            self._conn.execute('PRAGMA wal_checkpoint(PASSIVE)')
+
+    def _run(self):
+        try:
+            self._load()
+        except sqlite3.Error as e:
+            logger.error(f"加载目录大小索引失败: {e}")
+            with self._lock:
+                self._nodes.clear()
+                self._create('', None)
+                self._loaded = True
+        last_flush = last_sweep = time.monotonic()
+        while not self._stop.is_set():
+            paths = []
+            with self._cond:
+                now = time.monotonic()
+                if self._touched and now - self._touched_at >= SETTLE_DELAY:
+                    for rel in self._touched:
+                        node = self._nodes.get(rel)
+                        if node is not None:
+                            self._mark(node)
+                    self._touched.clear()
+                if self._queue:
+                    while self._queue and len(paths) < WALK_WORKERS:
+                        paths.append(self._queue.popleft())
+                else:
+                    timeout = min(last_flush + self.flush_interval, last_sweep + SWEEP_INTERVAL) - now
+                    if self._touched:
+                        timeout = min(timeout, self._touched_at + SETTLE_DELAY - now)
+                    if any(listener.pending() for listener in self._listeners):
+                        # 监听器按自己的延迟要求提前写入
+                        timeout = min(timeout, LISTENER_POLL)
+                    self._cond.wait(max(timeout, 0.01))
+            if paths:
+                self._process(paths)
+            now = time.monotonic()
+            try:
+                if now - last_sweep >= SWEEP_INTERVAL:
+                    last_sweep = now
+                    self._sweep()
+                if now - last_flush >= self.flush_interval or any(l.wants_flush() for l in self._listeners):
+                    last_flush = now
+                    self.flush()
+            except Exception as e:
+                logger.error(f"维护目录大小索引失败: {e}")
+
+    def start(self):
+        """启动后台维护线程（每个部署只应在一个进程中调用），进程退出时写入剩余数据"""
+        if self._thread is not None:
+            return
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(SCHEMA)
+        for listener in self._listeners:
+            listener.setup(conn)
+        self._conn = conn
+        self._thread = threading.Thread(target=self._run, name='size-index', daemon=True)
+        self._thread.start()
+        for listener in self._listeners:
+            listener.start()
+        atexit.register(self.close)
+
+    def close(self):
+        """停止维护线程并写入剩余数据"""
+        if self._thread is None or self._stop.is_set():
+            return
+        self._stop.set()
+        with self._cond:
+            self._cond.notify()
+        self._thread.join(timeout=5)
+        for listener in self._listeners:
+            listener.close()
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"写入目录大小索引失败: {e}")
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+系统信息快照发布模块
+采集线程每个周期只序列化一次JSON，生成带版本号、ETag和Last-Modified的不可变快照，
+/api/system 轮询和SSE推送的所有客户端共享同一份字节数据。
+多进程模式下快照写入共享内存槽位，工作进程只读取，不再各自序列化
+"""
+import json
+import time
+import hashlib
+import threading
+import logging
+from typing import Callable, Dict, Iterator, NamedTuple, Optional
+from werkzeug.http import http_date
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# SSE心跳间隔（秒），防止反向代理因空闲断开连接
+SSE_HEARTBEAT_INTERVAL = 15
+# 工作进程轮询共享内存版本号的间隔（秒）
+SHARED_POLL_INTERVAL = 0.1
+
+
+class Snapshot(NamedTuple):
+    """不可变的预序列化快照"""
+    version: int
+    payload: bytes
+    etag: str
+    last_modified: str
+    timestamp: float
+
+
+class SnapshotPublisher:
+    def __init__(self):
+        """初始化快照发布器"""
+        self._condition = threading.Condition()
+        self._snapshot = Snapshot(0, b'{}', '', http_date(0), 0.0)
+        self._subscribers = 0
+        self._slot = None
+        self._writer = True
+        self._heartbeat = None
+
+    def attach(self, slot, writer: bool, heartbeat: Optional[Callable[[], None]] = None):
+        """
+        挂载共享内存槽位（多进程模式）
+        :param slot: shared_state.SharedSlot
+        :param writer: 是否为采集进程（写入方）
+        :param heartbeat: 工作进程中SSE连接每次推送后调用，用于告知采集进程仍有客户端在观看
+        """
+        self._slot = slot
+        self._writer = writer
+        self._heartbeat = heartbeat
+
+    def _sync(self):
+        """工作进程：共享内存中有新版本时读取并缓存"""
+        if self._slot.version() != self._snapshot.version:
+            result = self._slot.read()
+            if result:
+                version, timestamp, etag, payload = result
+                self._snapshot = Snapshot(version, payload, etag, http_date(timestamp), timestamp)
+
+    @property
+    def subscribers(self) -> int:
+        """当前SSE订阅者数量"""
+        return self._subscribers
+
+    def publish(self, data: Dict):
+        """
+        序列化并发布一个新快照，唤醒所有等待中的订阅者
+        :param data: 快照数据
+        """
+        if not self._writer:
+            raise RuntimeError("工作进程不能发布快照")
+        payload = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        # 强ETag由内容摘要生成，内容不变时客户端可持续命中304
+        etag = hashlib.blake2b(payload, digest_size=8).hexdigest()
+        now = time.time()
+        with self._condition:
+            self._snapshot = Snapshot(self._snapshot.version + 1, payload, etag, http_date(now), now)
+            if self._slot is not None:
+                self._slot.write(payload, now)
+            self._condition.notify_all()
+
+    def latest(self) -> Snapshot:
+        """
+        获取最新快照
+        :return: 快照对象，尚未发布时版本号为0
+        """
+        if not self._writer:
+            self._sync()
+        return self._snapshot
+
+    def wait_for(self, version: int, timeout: Optional[float] = None) -> Snapshot:
+        """
+        等待版本号大于 version 的快照
+        :param version: 订阅者已持有的版本号
+        :param timeout: 超时时间（秒）
+        :return: 快照对象，超时时版本号不变
+        """
+        if not self._writer:
+            # 跨进程没有条件变量可用，轮询共享内存中的版本号（只读取8字节）
+            deadline = time.monotonic() + (timeout if timeout is not None else float('inf'))
+            while self._slot.version() <= version:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                time.sleep(min(SHARED_POLL_INTERVAL, remaining))
+            return self.latest()
+        with self._condition:
+            self._condition.wait_for(lambda: self._snapshot.version > version, timeout)
+            return self._snapshot
+
+    def stream(self) -> Iterator[bytes]:
+        """
+        生成SSE事件流，每个采集周期推送一次快照
+        :return: SSE格式的字节流
+        """
+        with self._condition:
+            self._subscribers += 1
+        try:
+            # retry 字段告知浏览器断线后的重连间隔（毫秒）
+            yield b'retry: 3000\n\n'
+            snapshot = self.latest()
+            if snapshot.version:
+                yield b'id: %d\ndata: %s\n\n' % (snapshot.version, snapshot.payload)
+            version = snapshot.version
+            while True:
+                snapshot = self.wait_for(version, SSE_HEARTBEAT_INTERVAL)
+                if self._heartbeat:
+                    self._heartbeat()
+                if snapshot.version == version:
+                    yield b': keepalive\n\n'
+                    continue
+                version = snapshot.version
+                yield b'id: %d\ndata: %s\n\n' % (version, snapshot.payload)
+        finally:
+            with self._condition:
+                self._subscribers -= 1
+
+
+# 创建快照发布器实例
+snapshot_publisher = SnapshotPublisher()
@@ -9,6 +9,7 @@
 
 import time
 import os
+import glob
 import RPi.GPIO as GPIO
 import requests
 
@@ -19,24 +20,44 @@ GPIO.setwarnings(False)
 FAN_PIN = 14  # GPIO BCM码14
 HIGH_TEMP = 40.0  # 高温阈值（度）
 TEMP_CHECK_INTERVAL = 1  # 温度检查间隔（秒）
-TEMP_PATH = '/sys/class/thermal/thermal_zone0/temp'  # 温度传感器路径
+TEMP_PATH = '/sys/class/thermal/thermal_zone0/temp'  # 默认温度传感器路径（未找到cpu-thermal时使用）
 CYCLE_DURATION = 300  # 循环周期（秒），5分钟=300秒
 
 # 全局变量
 fan_status = False  # 风扇状态 False=关闭, True=开启
 last_switch_time = time.time()  # 上次切换时间
 is_in_cooling_period = False  # 是否处于降温模式
+temp_fd = None  # 温度传感器文件描述符，启动时打开一次
+
+def find_cpu_temp_path():
+    """
+    在所有 thermal zone 中查找 CPU 温度传感器
+    返回温度文件路径
+    """
+    for zone in sorted(glob.glob('/sys/class/thermal/thermal_zone*')):
+        try:
+            with open(os.path.join(zone, 'type'), 'r') as f:
+                if 'cpu' in f.read().lower():
+                    return os.path.join(zone, 'temp')
+        except OSError:
+            continue
+    return TEMP_PATH
 
 def get_cpu_temperature():
     """
     获取CPU温度
     返回温度值（摄氏度）
     """
+    global temp_fd
     try:
-        with open(TEMP_PATH, 'r') as f:
-            temp_raw = f.read().strip()
-            temp_celsius = float(temp_raw) / 1000.0
-            return temp_celsius
+        if temp_fd is None:
+            temp_path = find_cpu_temp_path()
+            temp_fd = os.open(temp_path, os.O_RDONLY)
+            print(f"温度传感器: {temp_path}")
+        # 保持文件打开，每次从偏移0重新读取
+        temp_raw = os.pread(temp_fd, 32, 0).strip()
+        temp_celsius = float(temp_raw) / 1000.0
+        return temp_celsius
     except FileNotFoundError:
         print(f"错误：找不到温度传感器文件 {TEMP_PATH}")
         return None
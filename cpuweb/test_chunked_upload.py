@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试分块断点续传上传：区间合并（直接调用）和完整的上传流程（需要服务运行在 9001 端口）
+"""
+import hashlib
+import os
+import socket
+import time
+import uuid
+from urllib.parse import urlparse
+
+import requests
+
+from chunked_upload import _merge, _missing
+
+CHUNK = 64 * 1024
+
+
+def _put_partial(base_url, upload_id, offset, data, sent):
+    """声明完整分块的 Content-Length，只发送前 sent 字节后断开连接，模拟上传中断"""
+    url = urlparse(base_url)
+    sock = socket.create_connection((url.hostname, url.port), timeout=10)
+    try:
+        sock.sendall((
+            f"PUT /api/files/upload/{upload_id}?offset={offset} HTTP/1.1\r\n"
+            f"Host: {url.netloc}\r\n"
+            f"Content-Type: application/octet-stream\r\n"
+            f"Content-Length: {len(data)}\r\n\r\n"
+        ).encode() + data[:sent])
+    finally:
+        sock.close()
+
+
+def test_chunked_upload():
+    """测试区间合并、乱序上传、分块校验、中断后续传、整体校验失败和完成上传"""
+    base_url = "http://127.0.0.1:9001"
+    failures = []
+
+    def check(condition, message):
+        print(f"   {'✓' if condition else '✗'} {message}")
+        if not condition:
+            failures.append(message)
+
+    print("开始测试分块断点续传上传...")
+
+    # 1. 区间合并与缺失区间
+    print("\n1. 测试 _merge 和 _missing:")
+    check(_merge([], 0, 10) == [[0, 10]], "空列表")
+    check(_merge([[0, 10]], 20, 30) == [[0, 10], [20, 30]], "不相邻的区间保持分开并排序")
+    check(_merge([[20, 30]], 0, 10) == [[0, 10], [20, 30]], "插入到前面")
+    check(_merge([[0, 10]], 10, 20) == [[0, 20]], "首尾相接的区间合并")
+    check(_merge([[0, 10], [20, 30]], 5, 25) == [[0, 30]], "跨越两个区间")
+    check(_merge([[0, 10], [20, 30], [40, 50]], 10, 20) == [[0, 30], [40, 50]], "填补空隙")
+    check(_merge([[0, 100]], 10, 20) == [[0, 100]], "已包含的区间")
+    check(_missing([], 100) == [[0, 100]], "没有接收任何数据")
+    check(_missing([[0, 10], [20, 30]], 50) == [[10, 20], [30, 50]], "中间和末尾缺失")
+    check(_missing([[10, 50]], 50) == [[0, 10]], "开头缺失")
+    check(_missing([[0, 50]], 50) == [], "已完整")
+
+    # 2. 完整上传流程
+    print("\n2. 测试上传流程:")
+    try:
+        requests.get(f"{base_url}/api/files/list", timeout=5)
+    except requests.RequestException as e:
+        print(f"   ⚠ 服务未运行，跳过上传流程测试: {e}")
+        assert not failures, failures
+        return
+
+    # 目标目录由 create_dirs 创建，测试结束后删除
+    dir_path = f"test_upload_{int(time.time())}_{str(uuid.uuid4())[:8]}"
+    data = os.urandom(3 * CHUNK + 100)
+    sha256 = hashlib.sha256(data).hexdigest()
+    upload_url = None
+    try:
+        response = requests.post(f"{base_url}/api/files/upload/init", json={
+            "path": dir_path, "filename": "upload.bin", "size": len(data), "chunk_size": CHUNK, "create_dirs": True
+        })
+        result = response.json()
+        check(response.status_code == 200 and result['missing'] == [[0, len(data)]], f"创建会话: {result.get('upload_id')}")
+        upload_id = result['upload_id']
+        upload_url = f"{base_url}/api/files/upload/{upload_id}"
+
+        # 乱序上传：先上传第3块，再上传第1块
+        response = requests.put(f"{upload_url}?offset={2 * CHUNK}", data=data[2 * CHUNK:3 * CHUNK])
+        check(response.status_code == 200, "先上传第3块")
+        response = requests.put(f"{upload_url}?offset=0", data=data[:CHUNK],
+                                headers={"X-Chunk-SHA256": hashlib.sha256(data[:CHUNK]).hexdigest()})
+        check(response.status_code == 200, "再上传第1块（带分块校验和）")
+        response = requests.put(f"{upload_url}?offset={3 * CHUNK}", data=data[3 * CHUNK:],
+                                headers={"X-Chunk-SHA256": "0" * 64})
+        check(response.status_code == 422, f"分块校验和错误返回422: {response.json().get('message')}")
+        response = requests.put(f"{upload_url}?offset={len(data)}", data=b'x')
+        check(response.status_code == 416, "超出文件范围返回416")
+
+        result = requests.get(upload_url).json()
+        check(result['missing'] == [[CHUNK, 2 * CHUNK], [3 * CHUNK, len(data)]], f"缺失区间: {result['missing']}")
+        response = requests.post(f"{upload_url}/finalize", json={})
+        check(response.status_code == 409, "未上传完整时完成上传返回409")
+
+        # 上传第2块时中断，已写入的部分保留，从断点续传
+        sent = CHUNK // 2
+        _put_partial(base_url, upload_id, CHUNK, data[CHUNK:2 * CHUNK], sent)
+        missing = []
+        for _ in range(50):
+            missing = requests.get(upload_url).json()['missing']
+            if missing and missing[0][0] > CHUNK:
+                break
+            time.sleep(0.1)
+        check(missing and missing[0] == [CHUNK + sent, 2 * CHUNK], f"中断后保留已写入的部分: {missing}")
+        for start, end in missing:
+            requests.put(f"{upload_url}?offset={start}", data=data[start:end])
+        result = requests.get(upload_url).json()
+        check(result['missing'] == [] and result['complete'], "续传后上传完整")
+
+        # 整体校验和错误：清空已接收区间，需要重新上传
+        response = requests.post(f"{upload_url}/finalize", json={"sha256": "0" * 64})
+        check(response.status_code == 422, f"整体校验和错误返回422: {response.json().get('message')}")
+        result = requests.get(upload_url).json()
+        check(result['missing'] == [[0, len(data)]], "已接收区间被清空")
+
+        requests.put(f"{upload_url}?offset=0", data=data)
+        response = requests.post(f"{upload_url}/finalize", json={"sha256": sha256})
+        result = response.json()
+        check(response.status_code == 200 and result['success'], f"完成上传: {result.get('path')}")
+        response = requests.get(f"{base_url}/api/files/download", params={"path": result.get('path', '')})
+        check(response.content == data, "下载的内容与上传的一致")
+        upload_url = None
+        check(requests.get(f"{base_url}/api/files/upload/{upload_id}").status_code == 404, "完成后会话已删除")
+    except Exception as e:
+        check(False, f"上传流程失败: {e}")
+    finally:
+        if upload_url:
+            requests.delete(upload_url)
+        requests.post(f"{base_url}/api/files/delete", json={"path": dir_path})
+
+    print("\n分块断点续传上传测试完成!")
+    assert not failures, failures
+
+
+if __name__ == "__main__":
+    test_chunked_upload()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试批量文件操作（直接调用 FileManager，在临时目录中执行，不需要启动服务）
+"""
+import os
+import shutil
+import tempfile
+
+from file_batch import BatchPlan, BATCH_TRASH_PREFIX
+from file_manager import FileManager
+
+# 超过文件名长度上限的新名称：格式和预检都能通过，执行时才失败（ENAMETOOLONG）
+TOO_LONG = 'x' * 300
+
+
+def _make_tree(base):
+    """创建测试用的文件：a.txt ~ f.txt 和 dir/inner.txt"""
+    for name in ('a.txt', 'c.txt', 'd.txt', 'e.txt', 'f.txt'):
+        with open(os.path.join(base, name), 'w') as f:
+            f.write(name)
+    os.chmod(os.path.join(base, 'd.txt'), 0o644)
+    os.mkdir(os.path.join(base, 'dir'))
+    with open(os.path.join(base, 'dir', 'inner.txt'), 'w') as f:
+        f.write('inner')
+
+
+def _snapshot(base):
+    """目录树快照：相对路径 -> (权限, 内容)"""
+    result = {}
+    for root, dirs, files in os.walk(base):
+        for name in dirs + files:
+            path = os.path.join(root, name)
+            content = None
+            if os.path.isfile(path):
+                with open(path) as f:
+                    content = f.read()
+            result[os.path.relpath(path, base)] = (os.stat(path).st_mode & 0o7777, content)
+    return result
+
+
+def test_file_batch():
+    """测试 atomic 撤销、非 atomic 跳过失败的操作、虚拟视图和预检"""
+    failures = []
+
+    def check(condition, message):
+        print(f"   {'✓' if condition else '✗'} {message}")
+        if not condition:
+            failures.append(message)
+
+    print("开始测试批量文件操作...")
+    base = tempfile.mkdtemp(prefix='batch-test-')
+    try:
+        manager = FileManager(base_path=base)
+
+        # 1. atomic：第6个操作执行时失败，前5个操作倒序撤销
+        print("\n1. 测试 atomic 批次执行中失败:")
+        _make_tree(base)
+        before = _snapshot(base)
+        result = manager.batch([
+            {"op": "mkdir", "path": "new"},
+            {"op": "rename", "path": "a.txt", "new_name": "b.txt"},
+            {"op": "move", "path": "c.txt", "dest": "new"},
+            {"op": "chmod", "path": "d.txt", "mode": "600"},
+            {"op": "delete", "path": "e.txt"},
+            {"op": "rename", "path": "f.txt", "new_name": TOO_LONG},
+        ], atomic=True)
+        results = result["results"]
+        check(result.get("status") == 409 and not result["success"], f"返回409: {result['message']}")
+        check(all(r.get("rolled_back") for r in results[:5]), "前5个操作标记为已撤销")
+        check(not results[5]["success"] and not results[5].get("rolled_back"), "第6个操作标记为失败")
+        check(result["succeeded"] == 0 and result["failed"] == 6, "succeeded 为0")
+        check(_snapshot(base) == before, "目录树（名称、权限、内容）与执行前相同")
+        check(not any(name.startswith(BATCH_TRASH_PREFIX) for name in os.listdir(base)), "没有残留暂存条目")
+
+        # 2. atomic：预检失败时不执行任何操作
+        print("\n2. 测试 atomic 批次预检失败:")
+        result = manager.batch([
+            {"op": "rename", "path": "a.txt", "new_name": "a2.txt"},
+            {"op": "delete", "path": "missing.txt"},
+        ], atomic=True)
+        check(result.get("status") == 409, f"返回409: {result['message']}")
+        check([r["message"] for r in result["results"]] == ["未执行", "文件或目录不存在"], "结果与操作一一对应")
+        check(os.path.exists(os.path.join(base, 'a.txt')), "第1个操作没有执行")
+
+        # 3. 非 atomic：失败的操作跳过，其余照常执行
+        print("\n3. 测试非 atomic 批次:")
+        result = manager.batch([
+            {"op": "rename", "path": "a.txt", "new_name": "b.txt"},
+            {"op": "rename", "path": "missing.txt", "new_name": "z.txt"},
+            {"op": "delete", "path": "e.txt"},
+            {"op": "rename", "path": "f.txt", "new_name": TOO_LONG},
+            {"op": "mkdir", "path": "made"},
+        ])
+        check([r["success"] for r in result["results"]] == [True, False, True, False, True],
+              f"结果: {[r['message'] for r in result['results']]}")
+        check(result["succeeded"] == 3 and result["failed"] == 2, result["message"])
+        check(os.path.exists(os.path.join(base, 'b.txt')) and not os.path.exists(os.path.join(base, 'e.txt'))
+              and os.path.isdir(os.path.join(base, 'made')) and os.path.exists(os.path.join(base, 'f.txt')),
+              "成功的操作已生效，失败的操作没有改动文件")
+
+        # 4. 预检之后目标被创建：不替换已存在的目标
+        print("\n4. 测试执行时目标已存在:")
+        steps, invalid, predicted = manager._resolve_batch(
+            [{"op": "rename", "path": "b.txt", "new_name": "late.txt"}])
+        check(not invalid and predicted == [None], "预检通过")
+        with open(os.path.join(base, 'late.txt'), 'w') as f:
+            f.write('late')
+        result = manager._run_batch(steps, predicted, atomic=False)
+        with open(os.path.join(base, 'late.txt')) as f:
+            check(result["results"][0]["message"] == "目标已存在" and f.read() == 'late', "返回目标已存在，内容未被替换")
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+    base = tempfile.mkdtemp(prefix='batch-test-')
+    try:
+        manager = FileManager(base_path=base)
+        _make_tree(base)
+
+        # 5. 虚拟视图：前面的操作创建、移走、删除的路径对后面的操作可见
+        print("\n5. 测试 BatchPlan 虚拟视图:")
+        plan = BatchPlan()
+        src, moved = os.path.join(base, 'dir'), os.path.join(base, 'dir2')
+        plan.move(src, moved)
+        check(plan.exists(os.path.join(moved, 'inner.txt')), "移动后新位置下的条目存在")
+        check(not plan.exists(os.path.join(src, 'inner.txt')) and not plan.exists(src), "原位置不存在")
+        check(plan.is_real_dir(moved), "新位置仍是目录")
+        created = os.path.join(base, 'created')
+        plan.create(created)
+        check(plan.is_dir(created) and not plan.exists(os.path.join(created, 'x')), "新建的目录为空目录")
+        plan.move(os.path.join(base, 'a.txt'), os.path.join(created, 'a.txt'))
+        check(plan.exists(os.path.join(created, 'a.txt')), "移入新建目录的条目可见")
+        plan.remove(created)
+        check(not plan.exists(os.path.join(created, 'a.txt')), "删除目录后其中的条目不存在")
+        check(os.path.exists(os.path.join(base, 'dir', 'inner.txt')), "虚拟视图不改动真实文件")
+
+        # 6. _resolve_batch 按顺序预检
+        print("\n6. 测试 _resolve_batch 预检:")
+        steps, invalid, predicted = manager._resolve_batch([
+            {"op": "mkdir", "path": "n"},
+            {"op": "mkdir", "path": "n/m"},
+            {"op": "rename", "path": "a.txt", "new_name": "b.txt"},
+            {"op": "rename", "path": "b.txt", "new_name": "c2.txt"},
+            {"op": "delete", "path": "a.txt"},
+            {"op": "move", "path": "c2.txt", "dest": "n"},
+            {"op": "rename", "path": "d.txt", "new_name": "c.txt"},
+            {"op": "move", "path": "dir", "dest": "dir"},
+            {"op": "move", "path": "e.txt", "dest": "nowhere"},
+        ])
+        check(not invalid, "路径均安全")
+        check(predicted == [None, None, None, None, "文件或目录不存在", None, "目标已存在",
+                            "不能移动到自身或其子目录中", "目标目录不存在"], f"预检结果: {predicted}")
+        steps, invalid, predicted = manager._resolve_batch([{"op": "delete", "path": "../etc"}])
+        check(len(invalid) == 1, f"越出基础路径: {invalid}")
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+    print("\n批量文件操作测试完成!")
+    assert not failures, failures
+
+
+if __name__ == "__main__":
+    test_file_batch()
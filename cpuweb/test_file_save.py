@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试差异保存（直接调用 file_save，在临时目录中执行，不需要启动服务）
+"""
+import os
+import codecs
+import shutil
+import tempfile
+
+import file_save
+from file_download import file_etag
+from file_save import SaveConflict, _line_offsets, apply_patches, normalize_patches
+
+
+def test_file_save():
+    """测试行偏移计算、文件末尾插入、无换行的最后一行、BOM、ETag 冲突和行号越界"""
+    failures = []
+
+    def check(condition, message):
+        print(f"   {'✓' if condition else '✗'} {message}")
+        if not condition:
+            failures.append(message)
+
+    def write(name, data):
+        path = os.path.join(base, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def read(path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def offsets(data, lines, start=0):
+        fd = os.open(write('offsets.txt', data), os.O_RDONLY)
+        try:
+            return _line_offsets(fd, lines, start, len(data))
+        finally:
+            os.close(fd)
+
+    def patch(path, patches, encoding='utf-8'):
+        return apply_patches(path, normalize_patches(patches), encoding, file_etag(os.stat(path)), fsync=False)
+
+    print("开始测试差异保存...")
+    base = tempfile.mkdtemp(prefix='save-test-')
+    block = file_save.SAVE_BLOCK
+    try:
+        # 1. 行偏移：第 k 行从第 k-1 个换行符之后开始，行数+2 为文件末尾
+        print("\n1. 测试 _line_offsets:")
+        data = b'a\nbb\nccc\n'
+        expected = {1: 0, 2: 2, 3: 5, 4: 9, 5: 9}
+        check(offsets(data, [1, 2, 3, 4, 5]) == expected, f"以换行结尾: {offsets(data, [1, 2, 3, 4, 5])}")
+        # 读取块小于行长度时，换行符跨越多个块
+        file_save.SAVE_BLOCK = 3
+        check(offsets(data, [5, 3, 1, 4, 2]) == expected, "跨块扫描、乱序行号结果相同")
+        file_save.SAVE_BLOCK = block
+        check(offsets(b'a\nbb\nccc', [3, 4]) == {3: 5, 4: 8}, "最后一行没有换行时，行数+1 为文件末尾")
+        check(offsets(b'', [1, 2]) == {1: 0, 2: 0}, "空文件")
+        check(offsets(codecs.BOM_UTF8 + b'x\ny', [1, 2], start=3) == {1: 3, 2: 5}, "跳过BOM")
+        for data, line in ((b'a\nbb\nccc\n', 6), (b'a\nbb\nccc', 5)):
+            try:
+                offsets(data, [line])
+                check(False, f"行号 {line} 应超出范围")
+            except ValueError as e:
+                check(True, f"行号越界: {e}")
+
+        # 2. 替换和在文件末尾插入
+        print("\n2. 测试 apply_patches:")
+        path = write('lines.txt', b'a\nb\nc\n')
+        st, written = patch(path, [{"start": 2, "end": 3, "content": "B\n"}])
+        check(read(path) == b'a\nB\nc\n' and written == 2, f"替换第2行，写入 {written} 字节")
+        check(file_etag(st) == file_etag(os.stat(path)), "返回新文件的状态")
+        patch(path, [{"start": 5, "end": 5, "content": "d\n"}])
+        check(read(path) == b'a\nB\nc\nd\n', "在行数+2（文件末尾）插入")
+        patch(path, [{"start": 1, "end": 1, "content": "0\n"}, {"start": 3, "end": 6, "content": ""}])
+        check(read(path) == b'0\na\nB\n', "同时在开头插入、删除末尾两行")
+
+        # 3. 最后一行没有换行
+        print("\n3. 测试最后一行没有换行:")
+        path = write('tail.txt', b'a\nb')
+        patch(path, [{"start": 2, "end": 3, "content": "B"}])
+        check(read(path) == b'a\nB', "替换最后一行，仍然没有换行")
+        patch(path, [{"start": 3, "end": 3, "content": "\nc"}])
+        check(read(path) == b'a\nB\nc', "在文件末尾追加一行")
+
+        # 4. BOM：utf-8-sig 时 BOM 不属于第1行，只保留一个
+        print("\n4. 测试 utf-8-sig:")
+        path = write('bom.txt', codecs.BOM_UTF8 + 'x\n中\n'.encode('utf-8'))
+        patch(path, [{"start": 1, "end": 2, "content": "X\n"}], 'utf-8-sig')
+        check(read(path) == codecs.BOM_UTF8 + 'X\n中\n'.encode('utf-8'), "替换第1行后保留一个BOM")
+        patch(path, [{"start": 2, "end": 3, "content": "文\n"}], 'utf-8-sig')
+        check(read(path) == codecs.BOM_UTF8 + 'X\n文\n'.encode('utf-8'), "替换的文本按 utf-8 写入")
+
+        # 5. ETag 冲突：不修改文件，返回当前 ETag
+        print("\n5. 测试 ETag 冲突:")
+        path = write('conflict.txt', b'a\nb\n')
+        current = file_etag(os.stat(path))
+        try:
+            apply_patches(path, normalize_patches([{"start": 1, "end": 2, "content": "A\n"}]), 'utf-8',
+                          '"stale"', fsync=False)
+            check(False, "应返回冲突")
+        except SaveConflict as e:
+            check(e.etag == current, "冲突中附带当前 ETag")
+        check(read(path) == b'a\nb\n', "文件未被修改")
+
+        # 6. 行号越界：不修改文件，不残留临时文件
+        print("\n6. 测试行号越界:")
+        try:
+            patch(path, [{"start": 2, "end": 9, "content": ""}])
+            check(False, "应拒绝越界的区间")
+        except ValueError as e:
+            check(True, f"拒绝: {e}")
+        check(read(path) == b'a\nb\n', "文件未被修改")
+        check(not any(name.startswith(file_save.SAVE_TEMP_PREFIX) for name in os.listdir(base)), "没有残留临时文件")
+        for patches in ([{"start": 2, "end": 1}], [{"start": 1, "end": 3}, {"start": 2, "end": 4}], []):
+            try:
+                normalize_patches(patches)
+                check(False, f"应拒绝 {patches}")
+            except ValueError as e:
+                check(True, f"格式错误: {e}")
+    finally:
+        file_save.SAVE_BLOCK = block
+        shutil.rmtree(base, ignore_errors=True)
+
+    print("\n差异保存测试完成!")
+    assert not failures, failures
+
+
+if __name__ == "__main__":
+    test_file_save()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试系统指标历史接口的脚本
+"""
+import requests
+import time
+
+def test_system_history():
+    """测试历史数据查询与服务端降采样"""
+    base_url = "http://127.0.0.1:9001"
+    
+    print("开始测试系统指标历史接口...")
+    print("="*50)
+    
+    # 测试1: 默认指标
+    print("1. 测试默认指标 (cpu.percent):")
+    try:
+        response = requests.get(f"{base_url}/api/system/history", timeout=10)
+        data = response.json()
+        if data.get('success'):
+            print(f"   ✓ 样本数: {data['samples']}, 返回点数: {len(data['timestamps'])}, 步长: {data['step']}秒")
+        else:
+            print(f"   ✗ 查询失败: {data.get('message')}")
+    except Exception as e:
+        print(f"   ✗ 请求失败: {e}")
+    print()
+    
+    # 测试2: 指定起始时间和步长
+    print("2. 测试最近10分钟、10秒步长的温度数据:")
+    try:
+        since = time.time() - 600
+        response = requests.get(f"{base_url}/api/system/history",
+                                params={"metric": "cpu.temp", "since": since, "step": 10},
+                                timeout=10)
+        data = response.json()
+        if data.get('success'):
+            print(f"   ✓ 返回点数: {len(data['timestamps'])} (应不超过60)")
+            if data['avg']:
+                print(f"     最新平均值: {data['avg'][-1]}, 最小值: {data['min'][-1]}, 最大值: {data['max'][-1]}")
+        else:
+            print(f"   ✗ 查询失败: {data.get('message')}")
+    except Exception as e:
+        print(f"   ✗ 请求失败: {e}")
+    print()
+    
+    # 测试3: 未知指标应返回400
+    print("3. 测试未知指标:")
+    try:
+        response = requests.get(f"{base_url}/api/system/history", params={"metric": "unknown"}, timeout=10)
+        if response.status_code == 400:
+            print(f"   ✓ 正确返回400: {response.json().get('message')}")
+        else:
+            print(f"   ✗ 状态码异常: {response.status_code}")
+    except Exception as e:
+        print(f"   ✗ 请求失败: {e}")
+    print()
+
+if __name__ == "__main__":
+    test_system_history()
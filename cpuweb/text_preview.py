@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文本文件分段预览模块
+按字节偏移或行号读取文件中的一个窗口（默认500行），不读取整个文件，几百MB的日志也能立即打开：
+- 编码只检测一次：读取文件开头的样本，含 NUL 字节视为二进制，依次尝试 UTF-8、GB18030，最后使用 Latin-1
+- 稀疏行索引：每 PREVIEW_BLOCK 字节记录一个检查点（该位置之前的换行数），只扫描到请求的行所在的块为止，
+  按需向后扩展；定位某一行时只需在一个块内查找
+- 行索引和检测到的编码按 (路径, inode, 修改时间, 大小) 缓存，文件变化后自动失效
+- UTF-8 和 GB18030 的多字节字符中不会出现换行符的字节值，按字节查找换行不会切断字符
+"""
+import os
+import codecs
+import threading
+import logging
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 行索引检查点间隔，也是每次读取的块大小（字节）
+PREVIEW_BLOCK = 1024 * 1024
+# 编码检测的样本大小（字节）
+SAMPLE_BYTES = 64 * 1024
+# 每次返回的默认行数和最大行数
+DEFAULT_PREVIEW_LINES = 500
+MAX_PREVIEW_LINES = 5000
+# 单个窗口的最大字节数（超长的行在此处截断，下一个窗口从截断处继续）
+MAX_WINDOW_BYTES = 4 * 1024 * 1024
+# 缓存的行索引数量
+INDEX_CACHE_ENTRIES = 64
+# 依次尝试的编码，都失败时使用 latin-1（任何字节序列都能解码）
+TEXT_ENCODINGS = ('utf-8', 'gb18030')
+
+
+def detect_encoding(sample: bytes, at_eof: bool) -> Optional[str]:
+    """
+    根据文件开头的样本检测编码
+    :param sample: 样本字节
+    :param at_eof: 样本是否就是整个文件（否则末尾可能是被截断的多字节字符）
+    :return: 编码名称，二进制文件返回 None
+    """
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if b'\0' in sample:
+        # 二进制文件，或者 UTF-16/32（按字节查找换行不适用）
+        return None
+    for encoding in TEXT_ENCODINGS:
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=at_eof)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return 'latin-1'
+
+
+class LineIndex:
+    """
+    稀疏行索引：checkpoints[i] 为字节位置 i * PREVIEW_BLOCK 之前的换行数
+    只在持有 lock 时扩展
+    """
+
+    def __init__(self, encoding: str, size: int):
+        self.encoding = encoding
+        self.size = size
+        self.checkpoints = [0]
+        self.total_lines: Optional[int] = None
+        self.lock = threading.Lock()
+
+    @property
+    def complete(self) -> bool:
+        return self.total_lines is not None
+
+    def _extend(self, f):
+        """向后扫描一个块；扫描到文件末尾时得到总行数"""
+        pos = (len(self.checkpoints) - 1) * PREVIEW_BLOCK
+        f.seek(pos)
+        block = f.read(min(PREVIEW_BLOCK, self.size - pos))
+        newlines = self.checkpoints[-1] + block.count(b'\n')
+        if block and pos + len(block) < self.size:
+            self.checkpoints.append(newlines)
+            return
+        # 扫描到末尾（或文件在此期间被截短）；最后一行没有换行符时也算一行
+        if self.size > 0:
+            f.seek(self.size - 1)
+            if f.read(1) != b'\n':
+                newlines += 1
+        self.total_lines = newlines
+
+    def line_offset(self, f, line: int) -> Optional[int]:
+        """
+        第 line 行（从0开始）的起始字节位置
+        :return: 字节位置，超过文件行数时返回 None
+        """
+        if line == 0:
+            return 0
+        with self.lock:
+            # 扩展到第 line 个换行符所在的块被扫描过为止
+            while self.checkpoints[-1] < line and not self.complete:
+                self._extend(f)
+            checkpoints = self.checkpoints
+        # 最后一个换行数小于 line 的检查点，第 line 个换行符在它之后的块中
+        i = bisect_left(checkpoints, line) - 1
+        pos = i * PREVIEW_BLOCK
+        remaining = line - checkpoints[i]
+        f.seek(pos)
+        while True:
+            block = f.read(PREVIEW_BLOCK)
+            if not block:
+                return None
+            count = block.count(b'\n')
+            if count >= remaining:
+                index = -1
+                for _ in range(remaining):
+                    index = block.index(b'\n', index + 1)
+                return pos + index + 1 if pos + index + 1 < self.size else None
+            remaining -= count
+            pos += len(block)
+
+    def line_at(self, f, offset: int) -> Optional[int]:
+        """
+        字节位置 offset 处的行号（从0开始）；索引尚未扫描到该位置时返回 None（不为此扫描整个前缀）
+        """
+        i = offset // PREVIEW_BLOCK
+        with self.lock:
+            if i >= len(self.checkpoints):
+                return None
+            base = self.checkpoints[i]
+        f.seek(i * PREVIEW_BLOCK)
+        return base + f.read(offset - i * PREVIEW_BLOCK).count(b'\n')
+
+
+def _align_forward(f, offset: int, size: int) -> int:
+    """把任意字节位置对齐到它所在行的下一行开头（已经是行首时不变）"""
+    if offset <= 0:
+        return 0
+    pos = offset - 1
+    f.seek(pos)
+    limit = offset + MAX_WINDOW_BYTES
+    while pos < size and pos < limit:
+        block = f.read(PREVIEW_BLOCK)
+        if not block:
+            break
+        index = block.find(b'\n')
+        if index >= 0:
+            return pos + index + 1
+        pos += len(block)
+    # 找不到换行（文件末尾或超长的行）时从请求的位置开始
+    return min(offset, size)
+
+
+def _read_forward(f, start: int, max_lines: int) -> bytes:
+    """从 start 开始读取最多 max_lines 行（不超过 MAX_WINDOW_BYTES）"""
+    f.seek(start)
+    buffer = bytearray()
+    remaining = max_lines
+    while remaining > 0 and len(buffer) < MAX_WINDOW_BYTES:
+        block = f.read(min(PREVIEW_BLOCK, MAX_WINDOW_BYTES - len(buffer)))
+        if not block:
+            break
+        count = block.count(b'\n')
+        if count >= remaining:
+            index = -1
+            for _ in range(remaining):
+                index = block.index(b'\n', index + 1)
+            buffer += block[:index + 1]
+            break
+        buffer += block
+        remaining -= count
+    return bytes(buffer)
+
+
+def read_backward(f, end: int, max_lines: int) -> Tuple[int, bytes]:
+    """读取在 end 之前结束的最多 max_lines 行，返回 (起始位置, 数据)"""
+    pos = end
+    chunks = []
+    newlines = 0
+    total = 0
+    # 需要 max_lines + 1 个换行符才能确定第一行的开头
+    while pos > 0 and newlines <= max_lines and total < MAX_WINDOW_BYTES:
+        read_start = max(0, pos - PREVIEW_BLOCK)
+        f.seek(read_start)
+        block = f.read(pos - read_start)
+        chunks.append(block)
+        newlines += block.count(b'\n')
+        total += len(block)
+        pos = read_start
+    data = b''.join(reversed(chunks))
+    search_end = len(data) - 1 if data.endswith(b'\n') else len(data)
+    start = 0
+    for _ in range(max_lines):
+        index = data.rfind(b'\n', 0, search_end)
+        if index < 0:
+            start = 0
+            break
+        search_end = index
+        start = index + 1
+    return pos + start, data[start:]
+
+
+class TextPreviewer:
+    """分段预览读取器，持有行索引缓存（每个进程一份）"""
+
+    def __init__(self, max_entries: int = INDEX_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._indexes: 'OrderedDict[tuple, Optional[LineIndex]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _index(self, path: str, st: os.stat_result, f) -> Optional[LineIndex]:
+        """获取缓存的行索引；首次打开时检测编码，二进制文件缓存为 None"""
+        key = (path, st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if key in self._indexes:
+                self._indexes.move_to_end(key)
+                return self._indexes[key]
+        f.seek(0)
+        sample = f.read(SAMPLE_BYTES)
+        encoding = detect_encoding(sample, at_eof=len(sample) >= st.st_size)
+        index = LineIndex(encoding, st.st_size) if encoding else None
+        with self._lock:
+            self._indexes[key] = index
+            self._indexes.move_to_end(key)
+            while len(self._indexes) > self.max_entries:
+                self._indexes.popitem(last=False)
+        return index
+
+    def read(self, path: str, offset: Optional[int] = None, line: Optional[int] = None,
+             before: Optional[int] = None, lines: int = DEFAULT_PREVIEW_LINES) -> Dict:
+        """
+        读取一个窗口
+        :param path: 文件的绝对路径（已经过安全校验）
+        :param offset: 从该字节位置所在行的下一行开头开始（为行首时即从该行开始）
+        :param line: 从该行开始（从1开始），与 offset、before 三选一，都未指定时从文件开头开始
+        :param before: 读取在该字节位置之前结束的行（向上滚动）
+        :param lines: 行数
+        :return: 窗口内容和位置信息；二进制文件返回 type 为 binary 的失败结果
+        """
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            size = st.st_size
+            index = self._index(path, st, f)
+            if index is None:
+                return {"success": False, "message": "文件为二进制格式或不支持的编码，无法预览", "type": "binary"}
+
+            if before is not None:
+                start, data = read_backward(f, min(max(before, 0), size), lines)
+            else:
+                if line is not None:
+                    start = index.line_offset(f, line - 1)
+                    if start is None:
+                        start = size
+                else:
+                    start = _align_forward(f, offset or 0, size)
+                data = _read_forward(f, start, lines)
+            end = start + len(data)
+            count = data.count(b'\n') + (1 if data and not data.endswith(b'\n') else 0)
+            # 一个窗口就包含了整个文件
+            total_lines = count if start == 0 and end >= size else index.total_lines
+            first_line = line - 1 if line is not None and start < size else index.line_at(f, start)
+
+        return {
+            "success": True,
+            "type": "text",
+            "encoding": index.encoding,
+            "content": data.decode(index.encoding, errors='replace'),
+            "offset": start,
+            "end": end,
+            "size": size,
+            "lines": count,
+            "line": first_line + 1 if first_line is not None else None,
+            "total_lines": total_lines,
+            "bof": start == 0,
+            "eof": end >= size
+        }
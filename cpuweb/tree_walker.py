@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并行目录树遍历模块
+文件管理器中所有递归操作（目录统计、删除、搜索、打包）共用的遍历器：
+- 迭代式工作队列，不使用递归，任意深度的目录树都不会触及递归上限
+- os.scandir/stat 在执行期间释放 GIL，单层扫描分发到线程池中并行执行
+- 同时提交的扫描数量有上限（MAX_IN_FLIGHT），调用方消费结果的速度决定遍历速度，未消费的扫描结果不会堆积；
+  待扫描队列只保存路径，按后进先出（深度优先）处理，长度约为目录深度×每层子目录数，
+  单个目录包含大量子目录时随之增长，并不是严格有界
+- 通过 threading.Event 取消；生成器被关闭（例如流式响应的客户端断开）时取消尚未开始的扫描
+- WalkProgress 记录已扫描的目录数、文件数、字节数和错误数，供调用方报告进度
+"""
+import os
+import stat
+import time
+import threading
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 扫描线程数
+WALK_WORKERS = min(8, (os.cpu_count() or 1) * 2)
+# 同一次遍历最多同时提交的扫描数
+MAX_IN_FLIGHT = WALK_WORKERS * 2
+# 等待扫描结果时检查取消标志的间隔（秒）
+CANCEL_POLL = 0.5
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+class WalkCancelled(Exception):
+    """遍历被取消"""
+
+
+class WalkProgress:
+    """遍历进度（只由消费结果的线程更新）"""
+
+    def __init__(self):
+        self.directories = 0
+        self.files = 0
+        self.bytes = 0
+        self.errors = 0
+        self.current = ''
+        self.started = time.time()
+
+    def as_dict(self) -> Dict:
+        return {
+            'directories': self.directories,
+            'files': self.files,
+            'bytes': self.bytes,
+            'errors': self.errors,
+            'current': self.current,
+            'elapsed': round(time.time() - self.started, 3)
+        }
+
+
+def executor() -> ThreadPoolExecutor:
+    """获取当前进程的扫描线程池（延迟创建，fork 之后的子进程各自创建）"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=WALK_WORKERS, thread_name_prefix='tree-walker')
+        return _executor
+
+
+def scan_directory(dir_path: str, need_stat: bool, follow_symlinks: bool = True) -> List[tuple]:
+    """
+    使用 os.scandir 扫描单层目录
+    is_dir() 直接使用 readdir 返回的类型信息，只有在需要大小/时间时才对每个条目调用一次 stat（结果由 DirEntry 缓存）
+    :param dir_path: 目录路径
+    :param need_stat: 是否需要 stat 信息
+    :param follow_symlinks: 是否跟随符号链接判断类型和获取 stat（遍历时为 False，不会进入指向目录的链接）
+    :return: [(名称, 是否目录, stat结果或None)]
+    """
+    records = []
+    with os.scandir(dir_path) as entries:
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir(follow_symlinks=follow_symlinks)
+                st = None
+                if need_stat:
+                    try:
+                        st = entry.stat(follow_symlinks=follow_symlinks)
+                    except FileNotFoundError:
+                        # 失效的符号链接，使用链接自身的信息
+                        st = entry.stat(follow_symlinks=False)
+            except PermissionError:
+                # 如果无法访问某个文件/目录，跳过它
+                logger.warning(f"无法访问: {entry.path}, 跳过...")
+                continue
+            except FileNotFoundError:
+                # 扫描期间被删除
+                continue
+            records.append((entry.name, is_dir, st))
+    return records
+
+
+def _scan(path: str, need_stat: bool, visit: Optional[Callable[[str, List[tuple]], Any]]):
+    """在线程池中执行：扫描一层目录，再调用 visit（visit 抛出的异常交给调用方）"""
+    try:
+        records = scan_directory(path, need_stat, follow_symlinks=False)
+    except OSError as e:
+        return None, e, None
+    return records, None, visit(path, records) if visit is not None else None
+
+
+def walk(root: str, need_stat: bool = True, visit: Optional[Callable[[str, List[tuple]], Any]] = None,
+         cancel: Optional[threading.Event] = None,
+         progress: Optional[WalkProgress] = None) -> Iterator[Tuple[str, List[tuple], Any]]:
+    """
+    并行遍历目录树（不跟随符号链接）
+    结果按扫描完成的顺序产生，父目录总是先于子目录
+    :param root: 根目录（绝对路径）
+    :param need_stat: 扫描结果是否包含 stat 信息
+    :param visit: 在扫描线程中对每个目录调用 visit(目录路径, 扫描结果)，返回值随结果一起产生
+    :param cancel: 取消标志，被设置后抛出 WalkCancelled
+    :param progress: 进度对象
+    :return: 生成 (目录路径, [(名称, 是否目录, stat结果或None)], visit返回值)
+    """
+    pool = executor()
+    # 后进先出，待扫描队列的长度大致与目录深度×分支数成正比（不设上限：丢弃路径会漏掉子树）
+    frontier = deque([root])
+    in_flight: Dict[Any, str] = {}
+    try:
+        while frontier or in_flight:
+            if cancel is not None and cancel.is_set():
+                raise WalkCancelled()
+            while frontier and len(in_flight) < MAX_IN_FLIGHT:
+                path = frontier.pop()
+                in_flight[pool.submit(_scan, path, need_stat, visit)] = path
+            done, _ = wait(list(in_flight), timeout=CANCEL_POLL, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = in_flight.pop(future)
+                records, error, value = future.result()
+                if error is not None:
+                    if path == root:
+                        raise error
+                    if not isinstance(error, FileNotFoundError):
+                        # 无权限等错误只跳过该子树
+                        logger.warning(f"无法扫描: {path}: {error}")
+                        if progress is not None:
+                            progress.errors += 1
+                    continue
+                for name, is_dir, _ in records:
+                    if is_dir:
+                        frontier.append(os.path.join(path, name))
+                if progress is not None:
+                    progress.directories += 1
+                    progress.current = path
+                    for _, is_dir, st in records:
+                        if not is_dir:
+                            progress.files += 1
+                            if st is not None and stat.S_ISREG(st.st_mode):
+                                progress.bytes += st.st_size
+                yield path, records, value
+    finally:
+        # 正常结束、取消或生成器被关闭时，丢弃尚未开始的扫描
+        for future in in_flight:
+            future.cancel()
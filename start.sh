@@ -10,9 +10,43 @@ conda activate cpuweb
 # 切换到项目目录
 cd /home/bi9bjv/python/cpuweb
 
+# 服务器模式: prefork（gunicorn 多进程，默认）或 dev（Flask 开发服务器）
+# 用法: ./start.sh [--server prefork|dev]，也可通过环境变量 CPUWEB_SERVER 指定
+SERVER_MODE="${CPUWEB_SERVER:-prefork}"
+while [ $# -gt 0 ]; do
+    case "$1" in
+        --server)
+            SERVER_MODE="$2"
+            shift 2
+            ;;
+        --server=*)
+            SERVER_MODE="${1#*=}"
+            shift
+            ;;
+        *)
+            echo "未知参数: $1"
+            echo "用法: $0 [--server prefork|dev]"
+            exit 1
+            ;;
+    esac
+done
+
 # 启动应用
 echo "启动系统监控服务，访问地址: http://$(hostname -I | awk '{print $1}'):9001"
 echo "本地访问地址: http://localhost:9001"
 echo "按 Ctrl+C 停止服务"
 
-python app.py
\ No newline at end of file
+case "$SERVER_MODE" in
+    prefork)
+        echo "服务器模式: gunicorn 多进程（工作进程数: ${CPUWEB_WORKERS:-2}）"
+        exec gunicorn -c gunicorn.conf.py app:app
+        ;;
+    dev)
+        echo "服务器模式: Flask 开发服务器"
+        exec python app.py
+        ;;
+    *)
+        echo "无效的服务器模式: $SERVER_MODE，仅支持 prefork 或 dev"
+        exit 1
+        ;;
+esac